@@ -10,6 +10,8 @@ DATA_DIR = r"C:\Users\benau\wiktionary-db\data"
 TEMPLATE_PATH = os.path.join(DATA_DIR, "Template")
 MODULE_PATH = os.path.join(DATA_DIR, "Module")
 TEMPLATE_LIST = os.path.join(DATA_DIR, "unique_template_names.txt")
+# The query API accepts up to 50 titles per request
+BATCH_SIZE = 50
 
 os.makedirs(TEMPLATE_PATH, exist_ok=True)
 os.makedirs(MODULE_PATH, exist_ok=True)
@@ -21,24 +23,58 @@ downloaded_modules = set()
 def sanitize_filename(name):
     return re.sub(r'[\\/*?:"<>|]', '_', name)
 
-def fetch_wikitext(title):
+def fetch_wikitext_batch(titles):
+    """Fetch up to BATCH_SIZE pages in one query.
+
+    Returns {requested title: wikitext or None}, following normalized
+    titles, redirects and continued responses.
+    """
     params = {
         "action": "query",
         "format": "json",
+        "formatversion": "2",
         "prop": "revisions",
-        "titles": title,
+        "titles": "|".join(titles),
         "rvslots": "main",
-        "rvprop": "content"
+        "rvprop": "content",
+        "redirects": "1"
     }
-    response = requests.get(BASE_API_URL, headers=HEADERS, params=params)
-    response.raise_for_status()
-    data = response.json()
-    pages = data.get("query", {}).get("pages", {})
-    for page in pages.values():
-        revs = page.get("revisions")
-        if revs:
-            return revs[0]["slots"]["main"]["*"]
-    return None
+    title_map = {}
+    contents = {}
+    continuation = {}
+    while True:
+        response = requests.get(BASE_API_URL, headers=HEADERS, params={**params, **continuation})
+        response.raise_for_status()
+        data = response.json()
+        query = data.get("query", {})
+        for entry in query.get("normalized", []) + query.get("redirects", []):
+            title_map[entry["from"]] = entry["to"]
+        for page in query.get("pages", []):
+            revs = page.get("revisions")
+            if revs:
+                contents[page["title"]] = revs[0]["slots"]["main"]["content"]
+        if "continue" not in data:
+            break
+        continuation = data["continue"]
+        time.sleep(0.1)
+
+    results = {}
+    for title in titles:
+        target = title
+        seen = {target}
+        while target in title_map and title_map[target] not in seen:
+            target = title_map[target]
+            seen.add(target)
+        results[title] = contents.get(target)
+    return results
+
+def fetch_all(titles):
+    """Fetch pages in BATCH_SIZE-title requests"""
+    results = {}
+    for start in range(0, len(titles), BATCH_SIZE):
+        results.update(fetch_wikitext_batch(titles[start:start + BATCH_SIZE]))
+        time.sleep(0.1)
+    return results
 
 def save_file(path, title, content, ext):
     filename = sanitize_filename(title.replace("Template:", "").replace("Module:", "")) + ext
@@ -49,38 +85,41 @@ def save_file(path, title, content, ext):
 def extract_modules(wikitext):
     return re.findall(r"#invoke:([^\|\s}]+)", wikitext)
 
-def download_module(module_name):
-    if module_name in downloaded_modules:
-        return
-    title = f"Module:{module_name}"
-    print(f"⚙️  Fetching module: {module_name}")
-    content = fetch_wikitext(title)
-    if content:
-        save_file(MODULE_PATH, title, content, ".lua")
-        downloaded_modules.add(module_name)
-        for m in extract_modules(content):  # handle nested modules
-            download_module(m)
-    time.sleep(0.1)
-
-def download_template(template_name):
-    if template_name in downloaded_templates:
-        return
-    title = f"Template:{template_name}"
-    print(f"📄 Fetching template: {template_name}")
-    content = fetch_wikitext(title)
-    if content:
-        save_file(TEMPLATE_PATH, title, content, ".txt")
-        downloaded_templates.add(template_name)
-        for m in extract_modules(content):
-            download_module(m)
-    time.sleep(0.1)
+def download_modules(module_names):
+    """Download modules level by level, following nested #invoke calls"""
+    seen = set(downloaded_modules)
+    pending = sorted(set(module_names) - seen)
+    while pending:
+        seen.update(pending)
+        print(f"⚙️  Fetching {len(pending)} modules")
+        contents = fetch_all([f"Module:{name}" for name in pending])
+        nested = set()
+        for name in pending:
+            content = contents[f"Module:{name}"]
+            if content:
+                save_file(MODULE_PATH, f"Module:{name}", content, ".lua")
+                downloaded_modules.add(name)
+                nested.update(extract_modules(content))  # handle nested modules
+        pending = sorted(nested - seen)
+
+def download_templates(template_names):
+    pending = sorted(set(template_names) - downloaded_templates)
+    print(f"📄 Fetching {len(pending)} templates")
+    contents = fetch_all([f"Template:{name}" for name in pending])
+    modules = set()
+    for name in pending:
+        content = contents[f"Template:{name}"]
+        if content:
+            save_file(TEMPLATE_PATH, f"Template:{name}", content, ".txt")
+            downloaded_templates.add(name)
+            modules.update(extract_modules(content))
+    download_modules(modules)
 
 def main():
     with open(TEMPLATE_LIST, "r", encoding="utf-8") as f:
         template_names = [line.strip() for line in f if line.strip()]
 
-    for name in template_names:
-        download_template(name)
+    download_templates(template_names)
 
     print(f"\n✅ Done! Downloaded {len(downloaded_templates)} templates and {len(downloaded_modules)} modules.")
 
@@ -0,0 +1,347 @@
+import os
+import re
+import time
+import argparse
+from contextlib import contextmanager
+from datetime import datetime
+from functools import partial
+from multiprocessing import Pool
+from dump_source import dump_chunks
+from page_index import PageIndex, dump_title, open_current_index, page_index_path, title_chunks
+
+# Pages handed to a worker per task; large enough that pickling and IPC
+# are a small fraction of the extraction work
+PAGES_PER_CHUNK = 500
+
+# Definition rows buffered by the bulk-load writer per executemany/transaction
+BULK_BATCH_SIZE = 100000
+
+TITLE_PATTERN = re.compile(r"<title>(.*?)</title>")
+
+def extract_chunk(extract, pages):
+    """
+    Run an extraction function over a chunk of pages (in a worker process).
+
+    Args:
+        extract (callable): extract(xml_text, word) -> list of (part_of_speech, definition_text)
+        pages (iterable): A chunk from dump_source.dump_chunks, scanned or decompressed here
+
+    Returns:
+        tuple: (list of (word, entries) for pages with definitions, number of
+        candidate pages in the chunk, number of pages the chunk skipped)
+    """
+    results = []
+    page_count = 0
+    for page in pages:
+        page_count += 1
+        title_match = TITLE_PATTERN.search(page)
+        if not title_match:
+            continue
+        word = title_match.group(1).strip()
+        entries = extract(page, word)
+        if entries:
+            results.append((word, entries))
+    return results, page_count, pages.skipped_pages
+
+def extract_chunks(chunks, extract, workers, ordered=True):
+    """Yield extract_chunk results from a pool of workers (inline for workers=1),
+    in input order unless ordered is False"""
+    if workers <= 1:
+        for chunk in chunks:
+            yield extract_chunk(extract, chunk)
+        return
+
+    with Pool(workers) as pool:
+        # imap keeps only a few chunks per worker in flight and returns them
+        # in order, so word ids come out the same as in a single-process run
+        extract_all = pool.imap if ordered else pool.imap_unordered
+        yield from extract_all(partial(extract_chunk, extract), chunks)
+
+class DefinitionWriter:
+    """Single writer of extracted words and definitions into the output database"""
+
+    def __init__(self, conn, definition_column, log_message, definition_label=""):
+        self.conn = conn
+        self.cursor = conn.cursor()
+        self.log_message = log_message
+        self.definition_label = definition_label
+        self.insert_definition_sql = (
+            f"INSERT INTO definitions (word_id, part_of_speech, {definition_column}, sense_number) "
+            "VALUES (?, ?, ?, ?)"
+        )
+        self.processed_words = 0
+        self.logged_words = 0
+
+    def write(self, word, definition_entries):
+        """Insert one word and its definitions, logging the first 20 words"""
+        try:
+            # Insert the word into the words table
+            total_senses = len(definition_entries)
+            self.cursor.execute(
+                "INSERT OR IGNORE INTO words (word, total_senses) VALUES (?, ?)",
+                (word, total_senses)
+            )
+
+            # Get the word_id (either newly inserted or pre-existing)
+            self.cursor.execute("SELECT id FROM words WHERE word = ?", (word,))
+            word_id = self.cursor.fetchone()[0]
+
+            # Insert each definition
+            for i, (part_of_speech, definition_text) in enumerate(definition_entries, 1):
+                self.cursor.execute(self.insert_definition_sql, (word_id, part_of_speech, definition_text, i))
+        except Exception as e:
+            self.log_message(f"Error processing word '{word}': {str(e)}")
+            return
+
+        self._log_word(word, definition_entries)
+        self.processed_words += 1
+
+        # Commit every 1000 words
+        if self.processed_words % 1000 == 0:
+            self.conn.commit()
+            self.log_message(f"Processed {self.processed_words} words...")
+
+    def flush(self):
+        """Commit whatever has been written"""
+        self.conn.commit()
+
+    def _log_word(self, word, definition_entries):
+        """Only log the first 20 words"""
+        if self.logged_words < 20:
+            self.log_message(f"\nWord {self.logged_words+1}: {word}")
+            self.log_message(f"Total senses: {len(definition_entries)}")
+            for i, (part_of_speech, definition_text) in enumerate(definition_entries, 1):
+                self.log_message(f"  {i}. {part_of_speech} - {self.definition_label}{definition_text}")
+            self.logged_words += 1
+            if self.logged_words == 20:
+                self.log_message("\nReached 20 logged words. Continuing processing without logging...")
+
+class BulkDefinitionWriter(DefinitionWriter):
+    """Writer for loading a whole dump at once.
+
+    Word ids are assigned from an in-memory map instead of a SELECT per
+    word, and rows are inserted with executemany, batch_size definitions
+    per transaction. Repeated titles keep the first word row, as with
+    INSERT OR IGNORE, and add their definitions to it.
+    """
+
+    def __init__(self, conn, definition_column, log_message, definition_label="", batch_size=BULK_BATCH_SIZE):
+        super().__init__(conn, definition_column, log_message, definition_label)
+        self.batch_size = batch_size
+        # Continue numbering after any words already in the database
+        self.word_ids = dict(conn.execute("SELECT word, id FROM words"))
+        self.next_word_id = max(self.word_ids.values(), default=0) + 1
+        self.word_rows = []
+        self.definition_rows = []
+
+    def write(self, word, definition_entries):
+        """Buffer one word and its definitions, inserting a batch when it is full"""
+        word_id = self.word_ids.get(word)
+        if word_id is None:
+            word_id = self.word_ids[word] = self.next_word_id
+            self.next_word_id += 1
+            self.word_rows.append((word_id, word, len(definition_entries)))
+        self.definition_rows.extend(
+            (word_id, part_of_speech, definition_text, i)
+            for i, (part_of_speech, definition_text) in enumerate(definition_entries, 1)
+        )
+
+        self._log_word(word, definition_entries)
+        self.processed_words += 1
+        if len(self.definition_rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Insert the buffered rows in one transaction"""
+        self.cursor.executemany("INSERT INTO words (id, word, total_senses) VALUES (?, ?, ?)", self.word_rows)
+        self.cursor.executemany(self.insert_definition_sql, self.definition_rows)
+        self.conn.commit()
+        self.word_rows = []
+        self.definition_rows = []
+        self.log_message(f"Processed {self.processed_words} words...")
+
+@contextmanager
+def bulk_load(conn, log_message):
+    """
+    Set up conn for loading a whole dump, then restore it.
+
+    The indexes on words and definitions are dropped for the load and
+    rebuilt from their saved definitions afterwards, followed by ANALYZE,
+    so inserts do not maintain them row by row. Journaling and syncing are
+    off during the load: a crash can leave the database corrupt, which is
+    acceptable for a database that is rebuilt from the dump anyway. The
+    indexes and the previous journal_mode and synchronous settings are
+    restored even if the load fails.
+    """
+    indexes = conn.execute(
+        "SELECT name, sql FROM sqlite_master "
+        "WHERE type = 'index' AND sql IS NOT NULL AND tbl_name IN ('words', 'definitions')"
+    ).fetchall()
+    journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+    synchronous = conn.execute("PRAGMA synchronous").fetchone()[0]
+
+    conn.commit()
+    for name, _ in indexes:
+        conn.execute(f"DROP INDEX {name}")
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    try:
+        yield
+    finally:
+        conn.commit()
+        start_time = time.time()
+        for _, sql in indexes:
+            conn.execute(sql)
+        conn.execute("ANALYZE")
+        conn.commit()
+        conn.execute(f"PRAGMA synchronous = {synchronous}")
+        conn.execute(f"PRAGMA journal_mode = {journal_mode}")
+        log_message(f"Rebuilt {len(indexes)} indexes and ran ANALYZE in {time.time() - start_time:.2f} seconds")
+
+def delete_words(conn, words):
+    """Remove words and their definitions, so they can be extracted again"""
+    for word in words:
+        conn.execute("DELETE FROM definitions WHERE word_id IN (SELECT id FROM words WHERE word = ?)", (word,))
+        conn.execute("DELETE FROM words WHERE word = ?", (word,))
+    conn.commit()
+
+def ingest_dump(input_file, conn, extract, definition_column, log_message, workers=None,
+                pages_per_chunk=PAGES_PER_CHUNK, definition_label="", bulk=True, ordered=True, titles=None):
+    """
+    Extract definitions from every page of the dump and store them in conn.
+
+    The dump is split into chunks (byte ranges of a plain dump, runs of bz2
+    streams of a multistream dump, or pages read here from other .bz2
+    dumps), a pool of worker processes finds the English main-namespace
+    pages in each chunk and runs extract on them, and this process is the
+    only writer. In
+    bulk mode the writer is a BulkDefinitionWriter inside bulk_load;
+    otherwise each word is inserted as it arrives and indexes and
+    durability settings are left alone, which suits adding to a database
+    that must stay consistent.
+
+    An uncompressed dump with a current page index (see page_index.py) is
+    split along the offsets recorded there. Given titles, only those pages
+    are read, with a seek each through the page index (built first if
+    needed), and their words are replaced in the database word by word.
+
+    Args:
+        input_file (str): Path of the XML dump (.xml, .xml.bz2 or multistream .xml.bz2)
+        conn (sqlite3.Connection): Output database with words and definitions tables
+        extract (callable): Module-level extract(xml_text, word) function, run in the workers
+        definition_column (str): Column of the definitions table that receives the text
+        log_message (callable): Logging function
+        workers (int): Number of worker processes (default: CPU count; 1 runs inline)
+        pages_per_chunk (int): Pages sent to a worker per task
+        definition_label (str): Prefix of the definitions in the log
+        bulk (bool): Use the bulk-load write path
+        ordered (bool): Store pages in dump order; otherwise as chunks finish,
+            which keeps every worker busy but numbers words differently per run
+        titles (list): Re-extract only these main-namespace pages, titled as shown on
+            Wiktionary (uncompressed dumps only)
+
+    Returns:
+        int: Number of words stored
+    """
+    workers = workers or os.cpu_count() or 1
+    if titles is not None:
+        return _reingest_titles(input_file, conn, extract, definition_column, log_message, workers,
+                                pages_per_chunk, definition_label, titles)
+
+    log_message(f"Extracting with {workers} worker process(es), {pages_per_chunk} pages per chunk"
+                f"{', bulk load' if bulk else ''}")
+    page_index = None if input_file.endswith('.bz2') else open_current_index(input_file)
+    try:
+        if page_index is not None:
+            log_message(f"Splitting the dump along the page index {page_index_path(input_file)}")
+        chunks = dump_chunks(input_file, pages_per_chunk, page_index)
+        input_bytes = os.path.getsize(input_file)
+        if not bulk:
+            writer = DefinitionWriter(conn, definition_column, log_message, definition_label)
+            return _ingest(chunks, input_bytes, writer, extract, log_message, workers, ordered)
+        with bulk_load(conn, log_message):
+            writer = BulkDefinitionWriter(conn, definition_column, log_message, definition_label)
+            return _ingest(chunks, input_bytes, writer, extract, log_message, workers, ordered)
+    finally:
+        if page_index is not None:
+            page_index.close()
+
+def _reingest_titles(input_file, conn, extract, definition_column, log_message, workers,
+                     pages_per_chunk, definition_label, titles):
+    """Replace the words of the given titles with a fresh extraction of their pages"""
+    if input_file.endswith('.bz2'):
+        raise ValueError("Re-extracting single pages needs an uncompressed .xml dump")
+    # The index, the words table and extract_chunk all use the dump's form
+    titles = [dump_title(title) for title in titles]
+    page_index = open_current_index(input_file)
+    if page_index is None:
+        log_message(f"Building the page index {page_index_path(input_file)}")
+        start_time = time.time()
+        page_index = PageIndex(page_index_path(input_file))
+        page_count = page_index.build(input_file)
+        log_message(f"Indexed {page_count} pages in {time.time() - start_time:.2f} seconds")
+    try:
+        log_message(f"Re-extracting {len(titles)} page(s) through the page index")
+        delete_words(conn, titles)
+        writer = DefinitionWriter(conn, definition_column, log_message, definition_label)
+        chunks = title_chunks(input_file, page_index, titles, pages_per_chunk)
+        # A handful of pages is not worth starting a pool for
+        return _ingest(chunks, None, writer, extract, log_message, 1, True)
+    finally:
+        page_index.close()
+
+def _ingest(chunks, input_bytes, writer, extract, log_message, workers, ordered):
+    """Feed the extracted pages of the chunks to writer and log the totals"""
+    processed_pages = 0
+    skipped_pages = 0
+    start_time = time.time()
+
+    try:
+        for results, page_count, skipped_count in extract_chunks(chunks, extract, workers, ordered):
+            for word, definition_entries in results:
+                writer.write(word, definition_entries)
+            processed_pages += page_count
+            skipped_pages += skipped_count
+
+        # Final commit
+        writer.flush()
+
+        # Log final stats
+        elapsed = time.time() - start_time
+        log_message("\nProcessing complete.")
+        log_message(f"Total pages read: {processed_pages + skipped_pages} "
+                    f"({skipped_pages} skipped before decoding: not in the main namespace or no English entry)")
+        log_message(f"Total words processed: {writer.processed_words}")
+        log_message(f"Total time: {elapsed:.2f} seconds")
+        if elapsed > 0 and input_bytes is not None:
+            log_message(f"Processing rate: {writer.processed_words / elapsed:.2f} words/second "
+                        f"({(processed_pages + skipped_pages) / elapsed:.2f} pages/second, "
+                        f"{input_bytes / elapsed / 1e6:.2f} MB/second of input)")
+        log_message(f"Finished at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    except Exception as e:
+        log_message(f"Error processing file: {str(e)}")
+
+    return writer.processed_words
+
+def parse_arguments(description, input_file):
+    """Command line options shared by the dump parsers"""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--input', default=input_file,
+                        help='Path of the XML dump: .xml, .xml.bz2, or a multistream .xml.bz2 '
+                             'next to its -index.txt.bz2 for parallel decompression')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='Number of extraction processes (default: CPU count)')
+    parser.add_argument('--pages-per-chunk', type=int, default=PAGES_PER_CHUNK,
+                        help='Pages sent to a worker per task')
+    parser.add_argument('--no-bulk-load', dest='bulk_load', action='store_false',
+                        help='Insert word by word with indexes and journaling in place, '
+                             'instead of the faster bulk load meant for a fresh database')
+    parser.add_argument('--unordered', dest='ordered', action='store_false',
+                        help='Store pages as workers finish them instead of in dump order')
+    parser.add_argument('--words', nargs='+', metavar='WORD',
+                        help='Only re-extract these words, replacing them in the existing database; '
+                             'pages are found through the page index of an uncompressed dump')
+    args = parser.parse_args()
+    if args.words and args.input.endswith('.bz2'):
+        parser.error('--words needs an uncompressed .xml dump')
+    return args
\ No newline at end of file
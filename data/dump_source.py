@@ -0,0 +1,226 @@
+import bz2
+import io
+import mmap
+import os
+from multiprocessing import Pool
+
+# Wikimedia's multistream dumps compress every 100 pages as a separate bz2
+# stream, and the companion index lists "offset:page_id:title" per page
+PAGES_PER_STREAM = 100
+
+# Uncompressed dumps are scanned in place, in byte ranges of this size
+BYTES_PER_CHUNK = 32 * 1024 * 1024
+
+# Only main-namespace pages with an English part-of-speech template ({{en-noun}}
+# and the like) can produce definitions; everything else is skipped on the
+# raw bytes, before it is decoded
+PAGE_START = b'<page>'
+PAGE_END = b'</page>'
+MAIN_NAMESPACE = b'<ns>0</ns>'
+ENGLISH_MARKER = b'{{en-'
+
+def is_candidate_page(page):
+    """Whether a decoded page is in the main namespace and has an English entry"""
+    return '<ns>0</ns>' in page and '{{en-' in page
+
+def scan_candidate_pages(buffer, chunk, start=0, end=None):
+    """
+    Yield the candidate pages that start within buffer[start:end], as str.
+
+    Page boundaries, the namespace and the English marker are all found with
+    find() on the raw bytes of buffer (bytes or an mmap), so only candidate
+    pages are copied and decoded. The number of pages skipped is added to
+    chunk.skipped_pages.
+    """
+    end = len(buffer) if end is None else end
+    position = buffer.find(PAGE_START, start, end)
+    while position != -1:
+        page_end = buffer.find(PAGE_END, position)
+        if page_end == -1:
+            break
+        page_end += len(PAGE_END)
+        if (buffer.find(MAIN_NAMESPACE, position, page_end) != -1
+                and buffer.find(ENGLISH_MARKER, position, page_end) != -1):
+            yield buffer[position:page_end].decode('utf-8')
+        else:
+            chunk.skipped_pages += 1
+        position = buffer.find(PAGE_START, page_end, end)
+
+def open_dump(path):
+    """Open an XML dump for reading bytes, decompressing .bz2 dumps on the fly"""
+    if path.endswith('.bz2'):
+        return bz2.open(path, 'rb')
+    return open(path, 'rb')
+
+def open_dump_text(path):
+    """Open an XML dump for reading UTF-8 lines, decompressing .bz2 dumps on the fly"""
+    return io.TextIOWrapper(open_dump(path), encoding='utf-8')
+
+def read_pages(input_file):
+    """Yield the XML of each <page> element of the dump, in file order"""
+    with open_dump_text(input_file) as file:
+        page_buffer = []
+        inside_page = False
+        for line in file:
+            if "<page>" in line:
+                inside_page = True
+                page_buffer = [line]
+            elif "</page>" in line and inside_page:
+                page_buffer.append(line)
+                inside_page = False
+                yield "".join(page_buffer)
+            elif inside_page:
+                page_buffer.append(line)
+
+class PageList(list):
+    """A chunk of decoded candidate pages, with the number of pages left out of it"""
+    skipped_pages = 0
+
+def read_page_chunks(pages, pages_per_chunk):
+    """Group the candidate pages among pages into PageLists of pages_per_chunk"""
+    chunk = PageList()
+    for page in pages:
+        if not is_candidate_page(page):
+            chunk.skipped_pages += 1
+            continue
+        chunk.append(page)
+        if len(chunk) == pages_per_chunk:
+            yield chunk
+            chunk = PageList()
+    if chunk or chunk.skipped_pages:
+        yield chunk
+
+class MappedChunk:
+    """A byte range of an uncompressed dump.
+
+    Only the range is pickled to a worker; iterating memory-maps the dump
+    there and yields the candidate pages that start in the range.
+    """
+    __slots__ = ('dump_path', 'start', 'end', 'skipped_pages')
+
+    def __init__(self, dump_path, start, end):
+        self.dump_path = dump_path
+        self.start = start
+        self.end = end
+        self.skipped_pages = 0
+
+    def __iter__(self):
+        with open(self.dump_path, 'rb') as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                yield from scan_candidate_pages(buffer, self, self.start, self.end)
+
+def mapped_chunks(dump_path, bytes_per_chunk=BYTES_PER_CHUNK):
+    """Split an uncompressed dump into byte ranges of about bytes_per_chunk,
+    each starting at a <page> tag"""
+    size = os.path.getsize(dump_path)
+    if size == 0:
+        return []
+    offsets = [0]
+    with open(dump_path, 'rb') as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            while offsets[-1] + bytes_per_chunk < size:
+                next_page = buffer.find(PAGE_START, offsets[-1] + bytes_per_chunk)
+                if next_page == -1:
+                    break
+                offsets.append(next_page)
+    ends = offsets[1:] + [size]
+    return [MappedChunk(dump_path, start, end) for start, end in zip(offsets, ends)]
+
+def multistream_index_path(dump_path):
+    """The index of a multistream dump (...-multistream.xml.bz2 -> ...-multistream-index.txt.bz2),
+    or None if there is none"""
+    if not dump_path.endswith('.xml.bz2'):
+        return None
+    index_path = dump_path[:-len('.xml.bz2')] + '-index.txt.bz2'
+    return index_path if os.path.exists(index_path) else None
+
+def read_stream_ranges(dump_path, index_path):
+    """
+    Split a multistream dump into independently decompressible byte ranges.
+
+    Returns:
+        list: (start, end) of each bz2 stream holding pages, in file order. The
+        last range runs to the end of the file and so also covers the footer
+    """
+    offsets = set()
+    with bz2.open(index_path, 'rt', encoding='utf-8') as index:
+        for line in index:
+            offset, _, _ = line.partition(':')
+            if offset:
+                offsets.add(int(offset))
+    offsets = sorted(offsets)
+    ends = offsets[1:] + [os.path.getsize(dump_path)]
+    return list(zip(offsets, ends))
+
+class MultistreamChunk:
+    """A run of bz2 streams of a multistream dump.
+
+    Only the byte ranges are pickled to a worker; iterating decompresses
+    them there and yields their candidate pages.
+    """
+    __slots__ = ('dump_path', 'ranges', 'skipped_pages')
+
+    def __init__(self, dump_path, ranges):
+        self.dump_path = dump_path
+        self.ranges = ranges
+        self.skipped_pages = 0
+
+    def __iter__(self):
+        with open(self.dump_path, 'rb') as file:
+            file.seek(self.ranges[0][0])
+            compressed = file.read(self.ranges[-1][1] - self.ranges[0][0])
+        # Concatenated streams decompress in one call
+        return scan_candidate_pages(bz2.decompress(compressed), self)
+
+def multistream_chunks(dump_path, index_path, pages_per_chunk):
+    """Group the streams of a multistream dump into chunks of about pages_per_chunk pages"""
+    ranges = read_stream_ranges(dump_path, index_path)
+    streams_per_chunk = max(1, pages_per_chunk // PAGES_PER_STREAM)
+    for i in range(0, len(ranges), streams_per_chunk):
+        yield MultistreamChunk(dump_path, ranges[i:i + streams_per_chunk])
+
+def dump_chunks(input_file, pages_per_chunk, page_index=None):
+    """
+    Chunks of candidate pages of the dump for the extraction workers.
+
+    Uncompressed dumps are split into byte ranges that the workers scan
+    with mmap, and multistream dumps with their index into runs of streams
+    that the workers decompress; both in parallel. Other .bz2 dumps are
+    read and cut into pages here. Every chunk records how many pages it
+    skipped in skipped_pages once iterated.
+
+    With the page_index.PageIndex of an uncompressed dump, the byte ranges
+    come from its recorded page offsets instead of a pass over the dump.
+    """
+    if not input_file.endswith('.bz2'):
+        if page_index is not None:
+            return [MappedChunk(input_file, start, end) for start, end in page_index.shards(BYTES_PER_CHUNK)]
+        return mapped_chunks(input_file)
+    index_path = multistream_index_path(input_file)
+    if index_path:
+        return multistream_chunks(input_file, index_path, pages_per_chunk)
+    return read_page_chunks(read_pages(input_file), pages_per_chunk)
+
+def iter_dump_pages(input_file, workers=None, ordered=True, pages_per_chunk=500):
+    """
+    Yield the candidate pages of a dump, scanning or decompressing on a pool of workers.
+
+    Args:
+        input_file (str): Plain .xml, .xml.bz2 or multistream .xml.bz2 dump
+        workers (int): Decompression processes (default: CPU count; 1 decompresses inline)
+        ordered (bool): Keep dump order; otherwise chunks come out as they finish
+        pages_per_chunk (int): Pages decompressed per task
+    """
+    workers = workers or os.cpu_count() or 1
+    chunks = dump_chunks(input_file, pages_per_chunk)
+    # Plain .bz2 dumps are decompressed here, so a pool would only add copying
+    single_stream = input_file.endswith('.bz2') and not multistream_index_path(input_file)
+    if workers <= 1 or single_stream:
+        for chunk in chunks:
+            yield from chunk
+        return
+
+    with Pool(workers) as pool:
+        decompress = pool.imap if ordered else pool.imap_unordered
+        for pages in decompress(list, chunks):
+            yield from pages
\ No newline at end of file
@@ -1,6 +1,8 @@
 import xml.etree.ElementTree as ET
 import re
 import os
+import sys
+from dump_source import open_dump
 
 def extract_template_names(text):
     """
@@ -52,53 +54,55 @@ def process_wiktionary_dump(input_file, output_file):
     # Track progress
     page_count = 0
     
-    # Use iterparse to process the XML file incrementally
-    for event, elem in ET.iterparse(input_file, events=('end',)):
-        # Only process page elements
-        if elem.tag.endswith('page'):
-            page_count += 1
-            if page_count % 10000 == 0:
-                print(f"Processed {page_count} pages, found {len(unique_template_names)} unique template names")
-            
-            # Find the text content of the page
-            text_content = None
-            for child in elem.iter():
-                if child.tag.endswith('text') and child.text:
-                    text_content = child.text
-                    break
-            
-            if text_content:
-                # Find all English sections (content between "{{en-" and the next "==")
-                start_pos = 0
-                while True:
-                    # Find the next "{{en-" marker
-                    en_start = text_content.find('{{en-', start_pos)
-                    if en_start == -1:
+    # Use iterparse to process the XML file incrementally; .bz2 dumps are
+    # decompressed as they are read
+    with open_dump(input_file) as dump:
+        for event, elem in ET.iterparse(dump, events=('end',)):
+            # Only process page elements
+            if elem.tag.endswith('page'):
+                page_count += 1
+                if page_count % 10000 == 0:
+                    print(f"Processed {page_count} pages, found {len(unique_template_names)} unique template names")
+                
+                # Find the text content of the page
+                text_content = None
+                for child in elem.iter():
+                    if child.tag.endswith('text') and child.text:
+                        text_content = child.text
                         break
-                    
-                    # Find the next "==" marker
-                    next_header = text_content.find('==', en_start)
-                    if next_header == -1:
-                        # If no next header, consider the rest of the text
-                        next_header = len(text_content)
-                    
-                    # Extract the section
-                    section = text_content[en_start:next_header]
-                    
-                    # Extract definition lines (lines beginning with "# " or "## ")
-                    lines = section.split('\n')
-                    definition_lines = [line for line in lines if re.match(r'^#+\s+', line)]
-                    
-                    for line in definition_lines:
-                        # Extract template names from the definition line
-                        template_names = extract_template_names(line)
-                        unique_template_names.update(template_names)
-                    
-                    # Move to the position after this section
-                    start_pos = next_header
-            
-            # Clear the element to free up memory
-            elem.clear()
+                
+                if text_content:
+                    # Find all English sections (content between "{{en-" and the next "==")
+                    start_pos = 0
+                    while True:
+                        # Find the next "{{en-" marker
+                        en_start = text_content.find('{{en-', start_pos)
+                        if en_start == -1:
+                            break
+                        
+                        # Find the next "==" marker
+                        next_header = text_content.find('==', en_start)
+                        if next_header == -1:
+                            # If no next header, consider the rest of the text
+                            next_header = len(text_content)
+                        
+                        # Extract the section
+                        section = text_content[en_start:next_header]
+                        
+                        # Extract definition lines (lines beginning with "# " or "## ")
+                        lines = section.split('\n')
+                        definition_lines = [line for line in lines if re.match(r'^#+\s+', line)]
+                        
+                        for line in definition_lines:
+                            # Extract template names from the definition line
+                            template_names = extract_template_names(line)
+                            unique_template_names.update(template_names)
+                        
+                        # Move to the position after this section
+                        start_pos = next_header
+                
+                # Clear the element to free up memory
+                elem.clear()
     
     # Write the unique template names to the output file
     with open(output_file, 'w', encoding='utf-8') as f:
@@ -110,7 +114,8 @@ def process_wiktionary_dump(input_file, output_file):
     print(f"Results written to {output_file}")
 
 if __name__ == "__main__":
-    input_file = r"C:\Users\benau\wiktionary-db\data\enwiktionary-latest-pages-articles.xml"
+    # The dump may be plain XML or .xml.bz2
+    input_file = sys.argv[1] if len(sys.argv) > 1 else r"C:\Users\benau\wiktionary-db\data\enwiktionary-latest-pages-articles.xml"
     output_file = r"C:\Users\benau\wiktionary-db\data\unique_template_names.txt"
     
     # Ensure the output directory exists
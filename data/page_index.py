@@ -0,0 +1,211 @@
+import argparse
+import mmap
+import os
+import re
+import sqlite3
+import time
+from xml.sax.saxutils import escape
+from dump_source import PAGE_END, PAGE_START, PageList, is_candidate_page
+
+# Everything the index records sits in the page header, before <text>
+PAGE_HEADER_PATTERN = re.compile(
+    rb'<title>(.*?)</title>\s*<ns>(-?\d+)</ns>\s*<id>(\d+)</id>.*?<revision>\s*<id>(\d+)</id>',
+    re.DOTALL
+)
+INSERT_BATCH_SIZE = 50000
+
+def dump_title(title):
+    """A page title as written in the dump (R&D -> R&amp;D), the form the index and
+    the words table use"""
+    return escape(title, {'"': '&quot;'})
+
+def page_index_path(dump_path):
+    """Where the index of an uncompressed dump is kept: next to the dump"""
+    return dump_path + '.index.db'
+
+class PageIndex:
+    """Byte offset and length of every page of an uncompressed dump, kept in SQLite.
+
+    Built with one scan of the dump; afterwards a page is read with a seek,
+    and the dump can be split into byte ranges along page boundaries without
+    reading it. Titles are kept as written in the dump, XML escapes included,
+    like the words the parse scripts store; dump_title converts a title as
+    shown on Wiktionary.
+    """
+
+    def __init__(self, db_path):
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS pages (
+            page_id INTEGER PRIMARY KEY,
+            title TEXT NOT NULL,
+            ns INTEGER NOT NULL,
+            revid INTEGER,
+            offset INTEGER NOT NULL,
+            length INTEGER NOT NULL
+        )
+        ''')
+        # Size and modification time of the dump the index was built from
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS dump (
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL
+        )
+        ''')
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def is_current(self, dump_path):
+        """Whether the index was built from the dump as it is now"""
+        row = self.conn.execute("SELECT size, mtime_ns FROM dump").fetchone()
+        stat = os.stat(dump_path)
+        return row is not None and row == (stat.st_size, stat.st_mtime_ns)
+
+    def build(self, dump_path):
+        """
+        Index every page of the dump, replacing any previous index.
+
+        Returns:
+            int: Number of pages indexed
+        """
+        self.conn.execute("DROP INDEX IF EXISTS idx_pages_title")
+        self.conn.execute("DROP INDEX IF EXISTS idx_pages_offset")
+        self.conn.execute("DELETE FROM pages")
+        self.conn.execute("DELETE FROM dump")
+
+        page_count = 0
+        rows = []
+        stat = os.stat(dump_path)
+        if stat.st_size:
+            with open(dump_path, 'rb') as file:
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                    for row in self._scan(buffer):
+                        rows.append(row)
+                        if len(rows) == INSERT_BATCH_SIZE:
+                            self._insert(rows)
+                            page_count += len(rows)
+                            rows = []
+        self._insert(rows)
+        page_count += len(rows)
+
+        # Indexes are built once, after the load
+        self.conn.execute("CREATE INDEX idx_pages_title ON pages(title)")
+        self.conn.execute("CREATE INDEX idx_pages_offset ON pages(offset)")
+        self.conn.execute("INSERT INTO dump (size, mtime_ns) VALUES (?, ?)", (stat.st_size, stat.st_mtime_ns))
+        self.conn.commit()
+        return page_count
+
+    def _scan(self, buffer):
+        """Yield (page_id, title, ns, revid, offset, length) for each page in buffer"""
+        position = buffer.find(PAGE_START)
+        while position != -1:
+            page_end = buffer.find(PAGE_END, position)
+            if page_end == -1:
+                break
+            page_end += len(PAGE_END)
+            text_start = buffer.find(b'<text', position, page_end)
+            header = buffer[position:text_start if text_start != -1 else page_end]
+            match = PAGE_HEADER_PATTERN.search(header)
+            if match:
+                yield (int(match.group(3)), match.group(1).decode('utf-8'), int(match.group(2)), int(match.group(4)),
+                       position, page_end - position)
+            position = buffer.find(PAGE_START, page_end)
+
+    def _insert(self, rows):
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO pages (page_id, title, ns, revid, offset, length) VALUES (?, ?, ?, ?, ?, ?)",
+            rows
+        )
+
+    def lookup(self, titles, ns=0):
+        """
+        Find pages by title, as written in the dump (see dump_title).
+
+        Returns:
+            list: (title, offset, length) of the titles found, in dump order
+        """
+        found = []
+        for title in titles:
+            found.extend(self.conn.execute(
+                "SELECT title, offset, length FROM pages WHERE title = ? AND ns = ?", (title, ns)
+            ).fetchall())
+        return sorted(found, key=lambda row: row[1])
+
+    def read_pages(self, dump_path, titles, ns=0):
+        """Yield the XML of the pages with the given titles (as written in the dump), one seek each"""
+        with open(dump_path, 'rb') as file:
+            for _, offset, length in self.lookup(titles, ns):
+                file.seek(offset)
+                yield file.read(length).decode('utf-8')
+
+    def shards(self, bytes_per_shard):
+        """
+        Split the dump into byte ranges of about bytes_per_shard that start at
+        page boundaries, using the recorded offsets instead of the dump.
+
+        Returns:
+            list: (start, end) byte ranges covering the whole dump, in file order
+        """
+        row = self.conn.execute("SELECT size FROM dump").fetchone()
+        if not row or not row[0]:
+            return []
+        size = row[0]
+        offsets = [0]
+        while True:
+            next_offset = self.conn.execute(
+                "SELECT MIN(offset) FROM pages WHERE offset >= ?", (offsets[-1] + bytes_per_shard,)
+            ).fetchone()[0]
+            if next_offset is None:
+                break
+            offsets.append(next_offset)
+        return list(zip(offsets, offsets[1:] + [size]))
+
+def open_current_index(dump_path):
+    """The PageIndex of dump_path if one exists and matches the dump, else None"""
+    index_path = page_index_path(dump_path)
+    if not os.path.exists(index_path):
+        return None
+    index = PageIndex(index_path)
+    if not index.is_current(dump_path):
+        index.close()
+        return None
+    return index
+
+def title_chunks(dump_path, index, titles, pages_per_chunk):
+    """Group the candidate pages with the given titles into PageLists of
+    pages_per_chunk, reading each with a seek through index"""
+    chunk = PageList()
+    for page in index.read_pages(dump_path, titles):
+        if not is_candidate_page(page):
+            chunk.skipped_pages += 1
+            continue
+        chunk.append(page)
+        if len(chunk) == pages_per_chunk:
+            yield chunk
+            chunk = PageList()
+    if chunk or chunk.skipped_pages:
+        yield chunk
+
+def main():
+    """Build the page index of a dump, or print pages from it"""
+    parser = argparse.ArgumentParser(description="Index the pages of an uncompressed Wiktionary dump by byte offset")
+    parser.add_argument('dump', help='Path of the uncompressed XML dump')
+    parser.add_argument('--rebuild', action='store_true', help='Rebuild the index even if it is current')
+    parser.add_argument('--show', nargs='+', metavar='TITLE', help='Print the XML of these main-namespace pages')
+    args = parser.parse_args()
+
+    index = PageIndex(page_index_path(args.dump))
+    try:
+        if args.rebuild or not index.is_current(args.dump):
+            start_time = time.time()
+            page_count = index.build(args.dump)
+            print(f"Indexed {page_count} pages of {args.dump} in {time.time() - start_time:.2f} seconds")
+        for page in index.read_pages(args.dump, [dump_title(title) for title in args.show or []]):
+            print(page)
+    finally:
+        index.close()
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
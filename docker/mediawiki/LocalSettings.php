@@ -22,6 +22,9 @@ $wgExtraNamespaces[828] = 'Module';
 
 # Configure for Wiktionary-like processing
 $wgNamespacesWithSubpages[NS_MAIN] = true;
+# Wiktionary titles are case-sensitive ({{lb}} is Template:lb, not Template:Lb),
+# so missing-template names reported by the parser match the pages we download
+$wgCapitalLinks = false;
 $wgAllowExternalImages = true;
 
 # Increase limits for processing complex templates
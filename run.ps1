@@ -1,9 +1,12 @@
 ﻿# Wiktionary Definition Processor Launcher
-# Usage: .\run.ps1 [--test] [--limit N]
+# Usage: .\run.ps1 [--test] [--limit N] [--resume] [--workers N] [--prefetch]
 
 param(
     [switch]$test,
-    [int]$limit = 100
+    [switch]$resume,
+    [switch]$prefetch,
+    [int]$limit = 100,
+    [int]$workers = 4
 )
 
 $ErrorActionPreference = "Stop"
@@ -30,6 +33,10 @@ function Ensure-Python {
     # Ensure required packages
     Write-Host "Installing required Python packages..." -ForegroundColor Yellow
     python -m pip install requests
+    # Optional: faster JSON decoding of MediaWiki responses
+    python -m pip install orjson
+    # Optional: better compression of the packed template store
+    python -m pip install zstandard
 }
 
 function Ensure-Directories {
@@ -80,10 +87,20 @@ function Start-Processing {
     if ($test) {
         $args += "--test"
     }
+    if ($resume) {
+        $args += "--resume"
+    }
+    if ($prefetch) {
+        $args += "--prefetch"
+    }
     if ($limit -ne 100) {
         $args += "--limit"
         $args += $limit.ToString()
     }
+    if ($workers -ne 4) {
+        $args += "--workers"
+        $args += $workers.ToString()
+    }
     
     python src/main.py $args
 }
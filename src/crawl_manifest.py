@@ -0,0 +1,129 @@
+﻿import sqlite3
+import logging
+import threading
+import time
+
+class CrawlManifest:
+    """Persistent record of every template and module the crawler has fetched.
+
+    One row per item with its revision id, content hash and fetch time, or
+    the reason it could not be fetched and when it may be requested again.
+    Also tracks which revision was last installed into the local wiki. Safe
+    to share between fetcher threads.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.logger = logging.getLogger('wiktionary_processor')
+        self.lock = threading.Lock()
+        
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode = WAL;')
+        self.conn.execute('PRAGMA synchronous = NORMAL;')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS manifest (
+                item_type TEXT NOT NULL,
+                item_name TEXT NOT NULL,
+                status TEXT NOT NULL,
+                revid INTEGER,
+                rev_timestamp TEXT,
+                sha1 TEXT,
+                fetched_at REAL NOT NULL,
+                retry_after REAL,
+                installed_sha1 TEXT,
+                PRIMARY KEY (item_type, item_name)
+            )
+        ''')
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(manifest)")]
+        if 'rev_timestamp' not in columns:
+            self.conn.execute("ALTER TABLE manifest ADD COLUMN rev_timestamp TEXT")
+        self.conn.commit()
+        
+    def load(self):
+        """Return (downloaded, failed) sets of item keys.
+
+        Failures whose negative-cache TTL has expired are left out, so they
+        are requested again.
+        """
+        now = time.time()
+        downloaded = set()
+        failed = set()
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT item_type, item_name, status, retry_after FROM manifest"
+            ).fetchall()
+        for item_type, item_name, status, retry_after in rows:
+            if status == 'ok':
+                downloaded.add(f"{item_type}:{item_name}")
+            elif retry_after is not None and retry_after > now:
+                failed.add(f"{item_type}:{item_name}")
+        return downloaded, failed
+        
+    def record(self, fetched, failed):
+        """Record the outcome of one fetch batch.
+
+        fetched holds (item_type, item_name, revid, rev_timestamp, sha1) tuples and failed
+        holds (item_type, item_name, status, ttl) tuples.
+        """
+        now = time.time()
+        try:
+            with self.lock, self.conn:
+                self.conn.executemany('''
+                    INSERT INTO manifest (item_type, item_name, status, revid, rev_timestamp, sha1, fetched_at, retry_after)
+                    VALUES (?, ?, 'ok', ?, ?, ?, ?, NULL)
+                    ON CONFLICT (item_type, item_name) DO UPDATE SET
+                        status = 'ok', revid = excluded.revid, rev_timestamp = excluded.rev_timestamp,
+                        sha1 = excluded.sha1, fetched_at = excluded.fetched_at, retry_after = NULL
+                ''', [(item_type, item_name, revid, rev_timestamp, sha1, now)
+                      for item_type, item_name, revid, rev_timestamp, sha1 in fetched])
+                # A failed refetch keeps the last good revision on record
+                self.conn.executemany('''
+                    INSERT INTO manifest (item_type, item_name, status, fetched_at, retry_after)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (item_type, item_name) DO UPDATE SET
+                        status = excluded.status, fetched_at = excluded.fetched_at,
+                        retry_after = excluded.retry_after
+                    WHERE manifest.status != 'ok'
+                ''', [(item_type, item_name, status, now, now + ttl) for item_type, item_name, status, ttl in failed])
+        except sqlite3.Error as e:
+            self.logger.error(f"Error writing crawl manifest: {e}")
+            raise
+            
+    def uninstalled_items(self):
+        """Return (item_type, item_name) of fetched items not yet installed at their current revision"""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT item_type, item_name FROM manifest "
+                "WHERE status = 'ok' AND installed_sha1 IS NOT sha1 ORDER BY item_type, item_name"
+            ).fetchall()
+            
+    def mark_installed(self, items):
+        """Record that items were installed into the local wiki at their current revision"""
+        try:
+            with self.lock, self.conn:
+                self.conn.executemany(
+                    "UPDATE manifest SET installed_sha1 = sha1 WHERE item_type = ? AND item_name = ?",
+                    items
+                )
+        except sqlite3.Error as e:
+            self.logger.error(f"Error writing crawl manifest: {e}")
+            raise
+            
+    def reset_installed(self):
+        """Forget what was installed, e.g. after the local wiki was recreated"""
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE manifest SET installed_sha1 = NULL")
+            
+    def items(self):
+        """Return every row as a dict, ordered by title"""
+        with self.lock:
+            cursor = self.conn.execute(
+                "SELECT item_type, item_name, status, revid, rev_timestamp, sha1, fetched_at, retry_after "
+                "FROM manifest ORDER BY item_type, item_name"
+            )
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+            
+    def close(self):
+        """Close the manifest"""
+        self.conn.close()
\ No newline at end of file
@@ -1,5 +1,13 @@
 ﻿import sqlite3
 import logging
+import time
+
+# Rows that still need processing: never processed, or processing recorded an
+# error marker. The partial index below uses the same expression, so queries
+# filtering on it can be answered with an index scan.
+PENDING_CONDITION = """(processed_definition_text IS NULL
+        OR processed_definition_text LIKE 'ERROR:%'
+        OR processed_definition_text LIKE 'PROCESSING ERROR%')"""
 
 class Database:
     def __init__(self, db_path):
@@ -29,6 +37,34 @@ class Database:
             self.logger.error(f"Error resetting definitions: {e}")
             raise
             
+    def ensure_pending_index(self):
+        """Create the partial index over definitions that still need processing"""
+        try:
+            conn = self._get_connection()
+            conn.execute(f"""
+                CREATE INDEX IF NOT EXISTS idx_definitions_pending 
+                ON definitions(id) 
+                WHERE {PENDING_CONDITION}
+            """)
+            conn.commit()
+            conn.close()
+        except sqlite3.Error as e:
+            self.logger.error(f"Error creating pending definitions index: {e}")
+            raise
+            
+    def get_pending_definitions_count(self):
+        """Get the number of definitions that are unprocessed or recorded an error"""
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT COUNT(*) FROM definitions WHERE {PENDING_CONDITION}")
+            count = cursor.fetchone()[0]
+            conn.close()
+            return count
+        except sqlite3.Error as e:
+            self.logger.error(f"Error counting pending definitions: {e}")
+            raise
+            
     def get_total_definitions_count(self):
         """Get the total number of definitions"""
         try:
@@ -42,30 +78,45 @@ class Database:
             self.logger.error(f"Error counting definitions: {e}")
             raise
             
-    def get_definitions(self, limit=None):
-        """Get all definitions to process"""
+    def iter_definitions(self, batch_size=1000, limit=None, pending_only=False):
+        """Yield (id, word_id, raw_definition_text) tuples in id order.
+
+        Rows are read in keyset-paginated batches (WHERE id > last ORDER BY id),
+        so memory use stays flat regardless of the table size. With
+        pending_only, only rows matching PENDING_CONDITION are returned.
+        """
+        pending_filter = f"AND {PENDING_CONDITION}" if pending_only else ""
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
+            conn = sqlite3.connect(self.db_path)
+        except sqlite3.Error as e:
+            self.logger.error(f"Database connection error: {e}")
+            raise
             
-            if limit:
-                cursor.execute("""
+        try:
+            last_id = -1
+            remaining = limit
+            while remaining is None or remaining > 0:
+                page_size = batch_size if remaining is None else min(batch_size, remaining)
+                rows = conn.execute(f"""
                     SELECT id, word_id, raw_definition_text 
                     FROM definitions 
+                    WHERE id > ? {pending_filter}
+                    ORDER BY id 
                     LIMIT ?
-                """, (limit,))
-            else:
-                cursor.execute("""
-                    SELECT id, word_id, raw_definition_text 
-                    FROM definitions
-                """)
+                """, (last_id, page_size)).fetchall()
+                if not rows:
+                    break
+                    
+                yield from rows
                 
-            rows = cursor.fetchall()
-            conn.close()
-            return [(row['id'], row['word_id'], row['raw_definition_text']) for row in rows]
+                last_id = rows[-1][0]
+                if remaining is not None:
+                    remaining -= len(rows)
         except sqlite3.Error as e:
             self.logger.error(f"Error retrieving definitions: {e}")
             raise
+        finally:
+            conn.close()
             
     def update_processed_definition(self, definition_id, processed_text):
         """Update a definition with its processed text"""
@@ -82,3 +133,66 @@ class Database:
         except sqlite3.Error as e:
             self.logger.error(f"Error updating definition {definition_id}: {e}")
             raise
+            
+    def writer(self, batch_size=1000, flush_interval=5.0):
+        """Get a batched writer for processed definitions (use as a context manager)"""
+        return DefinitionWriter(self, batch_size=batch_size, flush_interval=flush_interval)
+
+
+class DefinitionWriter:
+    """Buffers processed definitions and writes them in batched transactions.
+
+    Holds a single connection for its lifetime. Buffered rows are flushed with
+    executemany every batch_size rows or flush_interval seconds, and once more
+    when the context exits (including on errors and KeyboardInterrupt), so an
+    interrupted run keeps everything written up to that point.
+    """
+
+    def __init__(self, database, batch_size=1000, flush_interval=5.0):
+        self.database = database
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.logger = database.logger
+        self.conn = None
+        self.buffer = []
+        self.written_count = 0
+        self.last_flush = time.monotonic()
+
+    def __enter__(self):
+        self.conn = self.database._get_connection()
+        self.last_flush = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self.flush()
+        finally:
+            self.conn.close()
+            self.conn = None
+        return False
+
+    def write(self, definition_id, processed_text):
+        """Queue a processed definition, flushing when the batch is full or stale"""
+        self.buffer.append((processed_text, definition_id))
+        if (len(self.buffer) >= self.batch_size
+                or time.monotonic() - self.last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """Write all buffered definitions in a single transaction"""
+        self.last_flush = time.monotonic()
+        if not self.buffer:
+            return
+        try:
+            with self.conn:
+                self.conn.executemany("""
+                    UPDATE definitions 
+                    SET processed_definition_text = ? 
+                    WHERE id = ?
+                """, self.buffer)
+            self.written_count += len(self.buffer)
+            self.logger.debug(f"Flushed {len(self.buffer)} processed definitions")
+            self.buffer = []
+        except sqlite3.Error as e:
+            self.logger.error(f"Error writing batch of {len(self.buffer)} definitions: {e}")
+            raise
\ No newline at end of file
@@ -0,0 +1,110 @@
+﻿import html as html_module
+import re
+
+# Elements with any of these classes carry no definition content
+SKIPPED_CLASSES = frozenset([
+    'mw-editsection',
+    'reference',
+    'references',
+    'mw-references-wrap',
+    'mw-cite-backlink',
+    'noprint',
+    'mw-empty-elt',
+])
+
+# Elements whose text is never content
+SKIPPED_TAGS = frozenset(['script', 'style', 'template'])
+
+# Elements that separate words, so their boundaries become whitespace
+BLOCK_TAGS = frozenset([
+    'address', 'blockquote', 'br', 'caption', 'dd', 'div', 'dl', 'dt', 'h1', 'h2',
+    'h3', 'h4', 'h5', 'h6', 'hr', 'li', 'ol', 'p', 'pre', 'table', 'td', 'th', 'tr', 'ul',
+])
+
+# Elements that never have an end tag
+VOID_TAGS = frozenset([
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta',
+    'param', 'source', 'track', 'wbr',
+])
+
+# Substrings that may mark non-content elements or comments; HTML without
+# any of them can take the fast path. 'reference' also covers 'references',
+# 'mw-references-wrap' and the 'mw-cite-backlink' that only occurs inside them
+SLOW_PATH_MARKERS = (
+    'reference', 'mw-editsection', 'noprint', 'mw-empty-elt',
+    '<style', '<script', '<template', '<!--',
+)
+
+# Fast path: block tags become whitespace, every other tag disappears
+BLOCK_TAG_PATTERN = re.compile(r'</?(?:%s)\b[^>]*>' % '|'.join(sorted(BLOCK_TAGS)))
+ANY_TAG_PATTERN = re.compile(r'<[^>]*>')
+
+# Slow path: one token per tag or comment; the text between tokens is content
+TAG_PATTERN = re.compile(r'<(?:(/?)([a-zA-Z][a-zA-Z0-9-]*)([^>]*)>|!--.*?-->)', re.DOTALL)
+CLASS_PATTERN = re.compile(r'''\bclass\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))''')
+
+def _has_skipped_class(attributes):
+    if 'class' not in attributes:
+        return False
+    match = CLASS_PATTERN.search(attributes)
+    if not match:
+        return False
+    classes = match.group(1) or match.group(2) or match.group(3) or ''
+    return not SKIPPED_CLASSES.isdisjoint(classes.split())
+
+def html_to_text(html):
+    """Convert rendered HTML to plain text.
+
+    Strips tags and comments, drops non-content elements (edit links,
+    reference markers and lists, scripts and styles), decodes entities and
+    collapses whitespace. Most definitions contain no non-content elements;
+    those are handled with two compiled substitutions, the rest by a
+    single-pass tokenizer that tracks which elements are open.
+    """
+    if any(marker in html for marker in SLOW_PATH_MARKERS):
+        text = _extract_content_text(html)
+    else:
+        text = ANY_TAG_PATTERN.sub('', BLOCK_TAG_PATTERN.sub(' ', html))
+        
+    if '&' in text:
+        text = html_module.unescape(text)
+    return ' '.join(text.split())
+
+def _extract_content_text(html):
+    """Tokenize html once, keeping the text outside non-content elements"""
+    parts = []
+    open_tags = []
+    skip_depth = None
+    position = 0
+    
+    for token in TAG_PATTERN.finditer(html):
+        if skip_depth is None and token.start() > position:
+            parts.append(html[position:token.start()])
+        position = token.end()
+        
+        tag = token.group(2)
+        if tag is None:
+            # Comment
+            continue
+        tag = tag.lower()
+        if tag in BLOCK_TAGS:
+            parts.append(' ')
+            
+        if token.group(1):
+            # End tag: close the element along with any children left unclosed
+            if tag not in open_tags:
+                continue
+            while open_tags:
+                closed = open_tags.pop()
+                if skip_depth is not None and len(open_tags) < skip_depth:
+                    skip_depth = None
+                if closed == tag:
+                    break
+        elif tag not in VOID_TAGS and not token.group(3).endswith('/'):
+            open_tags.append(tag)
+            if skip_depth is None and (tag in SKIPPED_TAGS or _has_skipped_class(token.group(3))):
+                skip_depth = len(open_tags)
+                
+    if skip_depth is None:
+        parts.append(html[position:])
+    return ''.join(parts)
\ No newline at end of file
@@ -0,0 +1,415 @@
+﻿import re
+import html
+from wikitext import parse_wikitext, iter_templates, render_nodes
+
+# Templates whose local rendering matches what MediaWiki produces closely
+# enough to skip the API. Anything else in a definition sends it to MediaWiki
+SUPPORTED_TEMPLATES = frozenset([
+    # Context labels and qualifiers
+    'lb', 'label', 'context', 'cx', 'qualifier', 'qual', 'q',
+    # Links
+    'l', 'm', 'w', 'wtorw',
+    # Form-of families
+    'alternative spelling of', 'alternative form of', 'alt form', 'alt sp',
+    'obsolete spelling of', 'archaic spelling of', 'obsolete form of', 'archaic form of',
+    'dated form of', 'dated spelling of', 'short for', 'abbreviation of', 'initialism of',
+    'acronym of', 'clipping of', 'ellipsis of', 'contraction of', 'plural of', 'singular of',
+    'past of', 'present participle of', 'past participle of', 'comparative of',
+    'superlative of', 'misspelling of', 'eye dialect of', 'diminutive of', 'augmentative of',
+    'feminine of', 'masculine of', 'gerund of', 'synonym of',
+    # Glosses and taxonomic names
+    'non-gloss', 'non-gloss definition', 'taxfmt', 'taxlink',
+    # Invisible in the rendered text
+    'senseid',
+])
+# Markup the local pipeline drops or renders differently from MediaWiki
+UNSUPPORTED_MARKERS = ('<ref', '&lt;ref', '{{{', '{|', '[[Category:', '[[File:', '[[Image:', '__')
+LANG_CODE_PATTERN = re.compile(r'^[a-z]{2,3}$')
+EXTERNAL_LINK_PATTERN = re.compile(r'\[https?://[^ \]]+(?: ([^\]]+))?\]')
+BOLD_PATTERN = re.compile(r"'''([^']+)'''")
+ITALIC_PATTERN = re.compile(r"''([^']+)''")
+HTML_TAG_PATTERN = re.compile(r'<[^>]+>')
+
+ORDINALS = {
+    '1': 'first', '2': 'second', '3': 'third', '4': 'fourth', '5': 'fifth',
+    '6': 'sixth', '7': 'seventh', '8': 'eighth', '9': 'ninth', '10': 'tenth',
+    '11': 'eleventh', '12': 'twelfth', '13': 'thirteenth', '14': 'fourteenth',
+    '15': 'fifteenth', '16': 'sixteenth', '17': 'seventeenth', '18': 'eighteenth',
+    '19': 'nineteenth', '20': 'twentieth', '21': 'twenty-first', '22': 'twenty-second',
+    '23': 'twenty-third', '24': 'twenty-fourth', '25': 'twenty-fifth', '26': 'twenty-sixth'
+}
+LANGUAGE_NAMES = {'en': 'English', 'fr': 'French', 'de': 'German', 'es': 'Spanish',
+                  'it': 'Italian', 'pt': 'Portuguese', 'nl': 'Dutch'}
+
+# Form-of templates that render as "<template name> <term>"
+FORM_OF_TEMPLATES = [
+    'alternative spelling of', 'alternative form of',
+    'obsolete spelling of', 'archaic spelling of',
+    'short for', 'abbreviation of', 'plural of', 'singular of',
+    'past of', 'present participle of', 'past participle of',
+    'comparative of', 'superlative of', 'misspelling of',
+    'contraction of', 'romanization of', 'combining form of',
+    'eye dialect of', 'obsolete form of', 'archaic form of',
+    'dated form of', 'dated spelling of', 'diminutive of',
+    'augmentative of', 'feminine of', 'masculine of', 'gerund of',
+    'imperative of', 'infinitive of', 'conjugation of', 'form of',
+    'initialism of', 'acronym of', 'clipping of', 'synonym of',
+    'euphemism for'
+]
+# Maintenance, date and example templates that render as nothing, by exact
+# name or by name prefix
+DROPPED_TEMPLATES = ['defdate', 'senseid', 'ISBN', 'collocation', 'coa', 'quotei']
+DROPPED_PREFIXES = ('rf', 'translation only', '&lit', 'def-uncertain', 'descendant only')
+
+def form_of_term(args):
+    """Return (term, display_text) of a form-of call: the first argument after
+    the language code, and the t= gloss"""
+    start = 1 if len(args.positional) > 1 and LANG_CODE_PATTERN.match(args.positional[0]) else 0
+    term = next((value.strip() for value in args.positional[start:] if value.strip()), '')
+    return term, args.named.get('t', '')
+
+def render_context_labels(args):
+    """{{lb|en|label|_|label}}: the labels in parentheses, skipping the language code"""
+    labels = [label.strip() for label in args.positional[1:] if label.strip() != '_']
+    joined_labels = []
+    i = 0
+    while i < len(labels):
+        # Keep "outside certain phrases" style labels with the label they qualify
+        if i < len(labels) - 1 and labels[i+1].startswith("outside"):
+            joined_labels.append(f"{labels[i]} {labels[i+1]}")
+            i += 2
+        else:
+            joined_labels.append(labels[i])
+            i += 1
+    return f"({', '.join(joined_labels)}) " if joined_labels else ""
+
+def render_grammatical_label(label):
+    """Dedicated label templates such as {{transitive}}"""
+    return lambda args: f"({label}) "
+
+def render_qualifier(args):
+    """{{q|qualifier|...}}"""
+    return f"({', '.join(args.positional)}) "
+
+def render_first_argument(args):
+    """Templates that display their first argument: non-gloss, taxfmt, taxlink, ..."""
+    return args.get(0)
+
+def render_link(args):
+    """{{l|en|word}} and {{m|en|word}}: the linked term"""
+    return args.get(1)
+
+def render_wikipedia_link(args):
+    """{{w|article|display}}: the display text, or the article title"""
+    return args.get(1) or args.get(0)
+
+def render_latin_definition(args):
+    """{{Latn-def|en|letter|1|a}}: a sentence describing a Latin-script letter"""
+    if len(args.positional) < 4:
+        return "A letter of the alphabet."
+    lang, type_param, number, letter = args.positional[:4]
+    ordinal = ORDINALS.get(number, str(number) + 'th')
+    lang_name = LANGUAGE_NAMES.get(lang, 'the')
+    if type_param == 'letter':
+        return f"The {ordinal} letter of the {lang_name} alphabet, called {letter} and written in the Latin script."
+    elif type_param == 'ordinal':
+        return f"The ordinal number {ordinal}, derived from this letter of the {lang_name} alphabet, called {letter} and written in the Latin script."
+    return f"A {type_param} based on the letter {letter} in the Latin script."
+
+def render_form_of(template_name):
+    """Form-of templates: "plural of cat", with the t= gloss in parentheses"""
+    def render(args):
+        term, display_text = form_of_term(args)
+        if not term:
+            return template_name
+        if display_text:
+            return f"{template_name} {term} (\"{display_text}\")"
+        return f"{template_name} {term}"
+    return render
+
+def render_ellipsis_of(args):
+    """{{ellipsis of|en|term}}"""
+    term = args.get(1)
+    return f"Ellipsis of {term}" if term else "Ellipsis"
+
+def render_alt_form(args):
+    """{{alt form|en|term||gloss}}: empty arguments are separators"""
+    term = args.get(1)
+    if not term:
+        return "Alternative form"
+    definition = next((value.strip() for value in args.positional[2:] if value.strip()), '')
+    if definition:
+        return f"Alternative form of {term} (\"{definition}\")"
+    return f"Alternative form of {term}"
+
+def render_alt_sp(args):
+    """{{alt sp|en|term}}"""
+    term, display_text = form_of_term(args)
+    if not term:
+        return "Alternative spelling"
+    if display_text:
+        return f"Alternative spelling of {term} (\"{display_text}\")"
+    return f"Alternative spelling of {term}"
+
+def render_inflection_of(args):
+    """{{inflection of|en|lemma||1|s|pres|ind}}: "1-s-pres-ind of lemma" """
+    term, _ = form_of_term(args)
+    if not term:
+        return "Form of"
+    attributes = [value for value in args.positional[1:] if value and value != term]
+    if attributes:
+        return f"{'-'.join(attributes)} of {term}"
+    return f"form of {term}"
+
+def render_given_name(args):
+    """{{given name|en|female|from=Latin}}"""
+    gender = "given name"
+    for value in args.positional[1:]:
+        if value in ["male", "female", "unisex"]:
+            gender = f"{value} given name"
+    origin = f" from {args.named['from']}" if args.named.get('from') else ""
+    return f"A {gender}{origin}"
+
+def render_surname(args):
+    """{{surname|en|from=Irish}}"""
+    origin = f" from {args.named['from']}" if args.named.get('from') else ""
+    return f"A surname{origin}"
+
+def render_place(args):
+    """{{place|en|city|s/Texas|c/USA}}"""
+    if len(args.positional) < 2:
+        return "A place"
+    place_type = args.positional[1]
+    locations = [value[2:] for value in args.positional[2:] if value.startswith(("p/", "s/", "c/"))]
+    if locations:
+        return f"A {place_type} in {', '.join(locations)}"
+    return f"A {place_type}"
+
+def render_demonym_noun(args):
+    """{{demonym-noun|en|place}}"""
+    place = args.get(1)
+    return f"A native or inhabitant of {place}" if place else "A native or inhabitant"
+
+def render_demonym_adj(args):
+    """{{demonym-adj|en|place}}"""
+    place = args.get(1)
+    return f"Of or relating to {place}" if place else "Of or relating to"
+
+def render_city_nickname(args):
+    """{{city nickname|en|city}}"""
+    city = args.get(1)
+    return f"A nickname for {city}" if city else "A nickname"
+
+def render_affix_usage(template_name):
+    """{{prefixusex|en|un|do}}: "un- + do → undo" and the like"""
+    def render(args):
+        if len(args.positional) < 3:
+            return ""
+        first, second = args.positional[1], args.positional[2]
+        if template_name == "prefixusex":
+            return f"{first}- + {second} → {first}{second}"
+        elif template_name == "suffixusex":
+            return f"{first} + -{second} → {first}{second}"
+        return f"{first} + {second} → {first}{second}"
+    return render
+
+def render_only_used_in(args):
+    """{{only used in|en|phrase}}"""
+    phrases = args.positional[1:]
+    return f"Only used in {', '.join(phrases)}" if phrases else "Only used in specific context"
+
+def render_phrasal_verbs(args):
+    """{{used in phrasal verbs|en|verb|...}}"""
+    verbs = args.positional[1:]
+    return f"Used in phrasal verbs such as {', '.join(verbs)}" if verbs else ""
+
+def render_construed_with(args):
+    """{{construed with|en|preposition}}"""
+    words = args.positional[1:]
+    return f"(construed with \"{', '.join(words)}\")" if words else ""
+
+def render_nothing(args):
+    """Templates that contribute no text"""
+    return ""
+
+def render_unknown_template(name, args):
+    """Templates without a handler show their first argument, unless it is lang=, t= or tr="""
+    if name.startswith(DROPPED_PREFIXES) or not args.items:
+        return ""
+    key, value = args.items[0]
+    if key in ('lang', 't', 'tr'):
+        return ""
+    return value if key is None else f"{key}={value}"
+
+# Template name -> handler(arguments) returning the rendered text
+TEMPLATE_HANDLERS = {
+    'lb': render_context_labels, 'label': render_context_labels,
+    'context': render_context_labels, 'cx': render_context_labels,
+    'qualifier': render_qualifier, 'qual': render_qualifier, 'q': render_qualifier,
+    'non-gloss': render_first_argument, 'non-gloss definition': render_first_argument,
+    'taxfmt': render_first_argument, 'taxlink': render_first_argument,
+    'taxon': render_first_argument, 'specieslink': render_first_argument,
+    'l': render_link, 'm': render_link,
+    'w': render_wikipedia_link, 'wtorw': render_wikipedia_link,
+    'Latn-def': render_latin_definition,
+    'ellipsis of': render_ellipsis_of,
+    'alt form': render_alt_form,
+    'alt sp': render_alt_sp,
+    'inflection of': render_inflection_of,
+    'given name': render_given_name,
+    'surname': render_surname,
+    'place': render_place,
+    'demonym-noun': render_demonym_noun,
+    'demonym-adj': render_demonym_adj,
+    'city nickname': render_city_nickname,
+    'only used in': render_only_used_in,
+    'used in phrasal verbs': render_phrasal_verbs,
+    'construed with': render_construed_with,
+}
+TEMPLATE_HANDLERS.update((label, render_grammatical_label(label))
+                         for label in ["transitive", "intransitive", "countable", "uncountable"])
+TEMPLATE_HANDLERS.update((name, render_form_of(name)) for name in FORM_OF_TEMPLATES)
+TEMPLATE_HANDLERS.update((name, render_affix_usage(name)) for name in ["affixusex", "prefixusex", "suffixusex"])
+TEMPLATE_HANDLERS.update((name, render_nothing) for name in DROPPED_TEMPLATES)
+
+def transform_formatting(text):
+    """Strip external link, bold and italic markup and HTML tags, and decode entities"""
+    text = EXTERNAL_LINK_PATTERN.sub(lambda m: m.group(1) or '', text)
+    text = BOLD_PATTERN.sub(r'\1', text)
+    text = ITALIC_PATTERN.sub(r'\1', text)
+    text = html.unescape(text)
+    return HTML_TAG_PATTERN.sub('', text)
+
+def clean_whitespace(text):
+    """Clean up whitespace and normalize punctuation."""
+    try:
+        # Replace multiple spaces with a single space
+        text = re.sub(r'\s+', ' ', text)
+        
+        # Remove space before punctuation
+        text = re.sub(r' ([.,;:!?])', r'\1', text)
+        
+        # Ensure there's a space after punctuation if followed by a letter
+        text = re.sub(r'([.,;:!?])([a-zA-Z])', r'\1 \2', text)
+        
+        # Remove extra spaces around 'or' and 'and'
+        text = re.sub(r' (or|and) ', r' \1 ', text)
+        
+        # Ensure proper spacing for parenthesized content
+        text = re.sub(r'\( ', r'(', text)
+        text = re.sub(r' \)', r')', text)
+        
+        # Fix capitalization at the beginning
+        def fix_capitalization(match):
+            try:
+                word = match.group(2) if match.group(2) else ""
+                # Keep these words lowercase even at the start of a sentence
+                if word.lower() in ['alternative', 'short', 'plural', 'singular', 'obsolete', 
+                                   'abbreviation', 'initialism', 'acronym', 'clipping',
+                                   'contraction', 'diminutive', 'feminine', 'masculine',
+                                   'ellipsis']:
+                    return (match.group(1) if match.group(1) else "") + word.lower()
+                return (match.group(1) if match.group(1) else "") + word
+            except Exception:
+                return match.group(0) if match and match.group(0) else ""
+        
+        text = re.sub(r'^(\([^)]+\) )?([\w]+)', fix_capitalization, text)
+        
+        # Normalize punctuation around or/and
+        text = re.sub(r' or\s+', ' or ', text)
+        text = re.sub(r' and\s+', ' and ', text)
+        
+        # Remove leading/trailing whitespace
+        text = text.strip()
+        
+        return text
+    except Exception:
+        return text
+
+def strip_definition_marker(definition_text):
+    """Remove the leading "# " (or "## ") of a definition line, if present"""
+    if definition_text.startswith("# "):
+        return definition_text[2:]
+    if definition_text.startswith("## "):
+        return definition_text[3:]
+    return definition_text
+
+def parse_definition(definition_text):
+    """Parse a definition line, without its leading "# ", into a template/link tree"""
+    return parse_wikitext(strip_definition_marker(definition_text))
+
+def render_definition_text(definition_text, nodes=None):
+    """
+    Turn the markup of one Wiktionary definition line into plain text.
+    
+    The line is parsed into a template/link tree once and rendered in a
+    single walk that dispatches on template names through TEMPLATE_HANDLERS.
+    Unlike parse_wiktionary_definition, errors propagate and no final
+    period is added, so the output can be compared with MediaWiki's.
+    
+    Args:
+        definition_text (str): Raw Wiktionary definition text, with or without the leading "# "
+        nodes (list): The tree parse_definition returns for definition_text, if already parsed
+        
+    Returns:
+        str: Cleaned definition text
+    """
+    if nodes is None:
+        nodes = parse_definition(definition_text)
+    text = render_nodes(nodes, TEMPLATE_HANDLERS, render_unknown_template)
+    return clean_whitespace(transform_formatting(text))
+
+def parse_wiktionary_definition(definition_text):
+    """
+    Process a Wiktionary definition line to clean up markup and return plain text.
+    
+    Args:
+        definition_text (str): Raw Wiktionary definition text starting with "# "
+        
+    Returns:
+        str: Cleaned definition text
+    """
+    try:
+        current_text = render_definition_text(definition_text)
+        
+        # Add final period if needed
+        if current_text and not current_text.endswith(('.', '!', '?')):
+            current_text += '.'
+        
+        return current_text
+    except Exception:
+        return "Definition parsing error."  # Fallback definition
+
+class LocalRenderer:
+    """Renders definitions that only use SUPPORTED_TEMPLATES without MediaWiki.
+
+    Rendering is one parse and one tree walk in Python, so a definition
+    takes microseconds instead of an API round trip; definitions using
+    anything else are left to MediaWiki.
+    """
+    
+    def __init__(self, supported_templates=SUPPORTED_TEMPLATES):
+        self.supported_templates = supported_templates
+        
+    def can_render(self, raw_text):
+        """Whether every template and markup construct in raw_text is supported"""
+        if any(marker in raw_text for marker in UNSUPPORTED_MARKERS):
+            return False
+        return self._supports(parse_definition(raw_text))
+        
+    def _supports(self, nodes):
+        """Whether every template in a parsed definition is supported"""
+        return all(template.name in self.supported_templates for template in iter_templates(nodes))
+        
+    def render(self, raw_text):
+        """Return the plain text of raw_text, or None if it needs MediaWiki"""
+        if any(marker in raw_text for marker in UNSUPPORTED_MARKERS):
+            return None
+        try:
+            # One parse serves both the support check and the render
+            nodes = parse_definition(raw_text)
+            if not self._supports(nodes):
+                return None
+            return render_definition_text(raw_text, nodes)
+        except Exception:
+            return None
\ No newline at end of file
@@ -1,9 +1,17 @@
-﻿import logging
+﻿import atexit
+import itertools
+import logging
 import os
-from logging.handlers import RotatingFileHandler
+import queue
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 
 def setup_logger(name, log_file, level=logging.INFO):
-    """Set up a logger with file and console handlers"""
+    """Set up a logger with file and console handlers.
+
+    Records are handed to a queue and written by a background listener, so
+    callers never block on file or console I/O. Calling it again for the
+    same logger only updates the level.
+    """
     # Create logs directory if it doesn't exist
     os.makedirs(os.path.dirname(log_file), exist_ok=True)
     
@@ -11,6 +19,10 @@ def setup_logger(name, log_file, level=logging.INFO):
     logger = logging.getLogger(name)
     logger.setLevel(level)
     
+    # Already set up: another queue and listener would log every record twice
+    if any(isinstance(handler, QueueHandler) for handler in logger.handlers):
+        return logger
+    
     # Create formatter
     formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
     
@@ -19,11 +31,54 @@ def setup_logger(name, log_file, level=logging.INFO):
         log_file, maxBytes=10*1024*1024, backupCount=5
     )
     file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
     
     # Console Handler
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
     
-    return logger
\ No newline at end of file
+    # Queue Handler: the only handler on the logger, drained by the listener
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(QueueHandler(log_queue))
+    listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    listener.start()
+    
+    # Flush whatever is still queued when the process exits
+    atexit.register(listener.stop)
+    
+    return logger
+
+
+class RequestTracer:
+    """Sampled, structured trace of API requests.
+
+    Every Nth request is logged at INFO as key=value fields; requests flagged
+    as errors are always logged, at WARNING. Fields are only formatted for
+    requests that are actually logged. every=0 disables sampling.
+    """
+
+    def __init__(self, logger, every=1000, max_field_length=200):
+        self.logger = logger
+        self.every = every
+        self.max_field_length = max_field_length
+        self.counter = itertools.count(1)
+
+    def trace(self, error=False, **fields):
+        """Record one request, logging it if it is sampled or failed"""
+        request_number = next(self.counter)
+        if error:
+            level = logging.WARNING
+        elif self.every and request_number % self.every == 0:
+            level = logging.INFO
+        else:
+            return
+            
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, "request_trace n=%d %s", request_number, self._format_fields(fields))
+
+    def _format_fields(self, fields):
+        parts = []
+        for key, value in fields.items():
+            if isinstance(value, (str, bytes)) and len(value) > self.max_field_length:
+                value = value[:self.max_field_length]
+            parts.append(f"{key}={value!r}")
+        return " ".join(parts)
\ No newline at end of file
@@ -5,13 +5,46 @@ import sys
 import os
 from database import Database
 from wiki_processor import WikiProcessor
+from local_renderer import LocalRenderer
 from template_manager import TemplateManager
+from render_cache import RenderCache
+from wiki_installer import WikiInstaller, docker_import_command
 from logger import setup_logger
 
 def main():
     parser = argparse.ArgumentParser(description='Wiktionary Definition Processor')
     parser.add_argument('--test', action='store_true', help='Run in test mode with limited processing')
     parser.add_argument('--limit', type=int, default=100, help='Limit number of entries to process in test mode')
+    parser.add_argument('--resume', action='store_true',
+                        help='Only process definitions that are unprocessed or recorded an error, keeping earlier results')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Number of parse requests to keep in flight against MediaWiki')
+    parser.add_argument('--batch-size', type=int, default=10,
+                        help='Maximum number of definitions packed into one parse request (1 disables batching)')
+    parser.add_argument('--trace-every', type=int, default=1000,
+                        help='Log a trace line for every Nth API request (failed requests are always logged, 0 disables sampling)')
+    parser.add_argument('--prefetch', nargs='?', metavar='NAMES_FILE',
+                        const=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'unique_template_names.txt'),
+                        help='Download and install the dependency closure of the templates listed in NAMES_FILE '
+                             '(default: data/unique_template_names.txt) before processing')
+    parser.add_argument('--reinstall', action='store_true',
+                        help='Install every fetched template and module into the local wiki again (after recreating it)')
+    parser.add_argument('--install', action='store_true',
+                        help='Install the fetched templates and modules the local wiki does not have yet '
+                             '(done after --prefetch, --refresh and --reinstall without asking)')
+    parser.add_argument('--refresh', action='store_true',
+                        help='Re-fetch cached templates and modules that have a newer revision on Wiktionary '
+                             'and invalidate the cached renders that used them')
+    parser.add_argument('--export-pages', metavar='XML_FILE',
+                        help='Write every cached template and module to XML_FILE as a MediaWiki XML export and exit')
+    parser.add_argument('--local-render', action='store_true',
+                        help='Render definitions that only use common templates without MediaWiki')
+    parser.add_argument('--parity', action='store_true',
+                        help='With --local-render, render those definitions with MediaWiki too and log differences')
+    parser.add_argument('--fetch-workers', type=int, default=4,
+                        help='Number of templates and modules fetched from Wiktionary at once')
+    parser.add_argument('--fetch-rate', type=float, default=10,
+                        help='Maximum Wiktionary API requests per second across all fetchers (0 disables the limit)')
     args = parser.parse_args()
     
     # Set up logging
@@ -24,54 +57,133 @@ def main():
     logger.info(f'Connected to database: {db_path}')
     
     # Initialize the template manager
-    template_manager = TemplateManager('cache')
+    template_manager = TemplateManager('cache', workers=args.fetch_workers,
+                                       requests_per_second=args.fetch_rate)
+    
+    if args.export_pages:
+        count = len(template_manager.store.export_xml(args.export_pages))
+        logger.info(f'Exported {count} templates and modules to {args.export_pages}')
+        template_manager.close()
+        return
+    
+    # Initialize the render cache
+    render_cache = RenderCache(os.path.join('cache', 'render_cache.db'))
+    
+    # Initialize the installer that pushes fetched templates into the local wiki
+    api_url = 'http://localhost:8080/api.php'
+    compose_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'docker', 'docker-compose.yml')
+    installer = WikiInstaller(api_url, template_manager, import_command=docker_import_command(compose_file))
+    if args.reinstall:
+        template_manager.manifest.reset_installed()
+    
+    # Bring cached templates up to date, dropping the renders that used changed ones
+    if args.refresh:
+        changed_titles = template_manager.refresh()
+        render_cache.invalidate_titles(changed_titles)
+        logger.info(f'Refreshed {len(changed_titles)} changed templates and modules')
+    
+    # Warm up the local wiki so the render retry loop rarely has to fire
+    if args.prefetch:
+        prefetch_templates(template_manager, args.prefetch, logger)
+    
+    # Load whatever the local wiki does not have yet in one import, when
+    # this run fetched something or was asked to; pages downloaded while
+    # processing are installed as they arrive
+    if args.install or args.prefetch or args.refresh or args.reinstall:
+        installed = installer.bulk_import()
+        logger.info(f'Installed {installed} templates and modules into the local wiki '
+                    f'({installer.failed_count} failed)')
     
     # Initialize the wiki processor
-    wiki_processor = WikiProcessor('http://localhost:8080/api.php', template_manager)
+    wiki_processor = WikiProcessor(api_url, template_manager, render_cache,
+                                   pool_size=args.workers, max_batch_size=args.batch_size,
+                                   trace_every=args.trace_every, installer=installer,
+                                   local_renderer=LocalRenderer() if args.local_render else None,
+                                   parity=args.parity)
     
-    # Reset all processed definition text to NULL
-    db.reset_processed_definitions()
-    logger.info('Reset all processed definition text fields to NULL')
+    if args.resume:
+        # Keep earlier results and pick up only the pending rows
+        db.ensure_pending_index()
+        logger.info('Resuming: only unprocessed and failed definitions will be processed')
+    else:
+        # Reset all processed definition text to NULL
+        db.reset_processed_definitions()
+        logger.info('Reset all processed definition text fields to NULL')
     
     # Process definitions
-    process_definitions(db, wiki_processor, logger, test_mode=args.test, limit=args.limit)
+    try:
+        process_definitions(db, wiki_processor, logger, test_mode=args.test, limit=args.limit,
+                            resume=args.resume, workers=args.workers)
+    finally:
+        wiki_processor.close()
+        installer.close()
+        template_manager.close()
+        render_cache.close()
+    logger.info(f'Render cache hits: {render_cache.hits}, misses: {render_cache.misses}')
+    logger.info(f'Request metrics: {wiki_processor.metrics.summary()}')
     
     logger.info('Processing complete')
 
-def process_definitions(db, wiki_processor, logger, test_mode=False, limit=100):
-    """Process all definitions in the database"""
-    total_definitions = db.get_total_definitions_count()
+def prefetch_templates(template_manager, names_file, logger):
+    """Download the templates used by the dump, with their dependencies"""
+    if not os.path.exists(names_file):
+        logger.error(f'Template names file not found: {names_file}. '
+                     f'Run data/extract_templates.py on the dump to create it')
+        return
+        
+    with open(names_file, 'r', encoding='utf-8') as f:
+        names = [line.strip() for line in f if line.strip()]
+    logger.info(f'Loaded {len(names)} template names from {names_file}')
+    
+    template_manager.prefetch(names)
+
+def process_definitions(db, wiki_processor, logger, test_mode=False, limit=100, resume=False, workers=4):
+    """Process all definitions in the database (or only the pending ones when resuming)"""
+    if resume:
+        total_definitions = db.get_pending_definitions_count()
+    else:
+        total_definitions = db.get_total_definitions_count()
     logger.info(f'Found {total_definitions} definitions to process')
     
+    # Definitions are streamed in batches rather than loaded all at once
     if test_mode:
         logger.info(f'Running in test mode. Processing only {limit} definitions')
-        definitions = db.get_definitions(limit=limit)
+        definitions = db.iter_definitions(limit=limit, pending_only=resume)
     else:
-        definitions = db.get_definitions()
+        definitions = db.iter_definitions(pending_only=resume)
     
     processed_count = 0
     error_count = 0
     
-    for definition in definitions:
-        definition_id, word_id, raw_text = definition
-        logger.debug(f'Processing definition ID {definition_id}')
-        
-        try:
-            # Process the definition
-            processed_text = wiki_processor.process_definition(raw_text)
-            
+    # Parse requests run on a worker pool; results are written here, by a
+    # single writer, in whatever order they complete. The writer buffers rows
+    # and leaving the block flushes whatever is pending, even if the run is
+    # interrupted
+    results = wiki_processor.process_definitions_concurrently(definitions, workers=workers)
+    with db.writer() as writer:
+        for definition_id, processed_text, error in results:
+            if error is not None:
+                logger.error(f'Error processing definition ID {definition_id}: {str(error)}')
+                error_count += 1
+                continue
+                
             # Store the processed result
-            db.update_processed_definition(definition_id, processed_text)
+            writer.write(definition_id, processed_text)
             
             processed_count += 1
-            if processed_count % 100 == 0:
+            if processed_count % 1000 == 0:
                 logger.info(f'Processed {processed_count}/{total_definitions} definitions')
-                
-        except Exception as e:
-            logger.error(f'Error processing definition ID {definition_id}: {str(e)}')
-            error_count += 1
     
     logger.info(f'Processing complete. Processed {processed_count} definitions. Errors: {error_count}')
+    if wiki_processor.local_renderer is not None and processed_count:
+        if wiki_processor.parity:
+            checks = wiki_processor.metrics.get('parity_checks')
+            mismatches = wiki_processor.metrics.get('parity_mismatches')
+            logger.info(f'Parity: {mismatches} of {checks} local renders differ from MediaWiki')
+        else:
+            local_count = wiki_processor.metrics.get('local_renders')
+            logger.info(f'Rendered {local_count} of {processed_count} definitions locally '
+                        f'({local_count / processed_count:.1%})')
     # Generate summary report
     wiki_processor.template_manager.generate_summary_report()
 
@@ -0,0 +1,36 @@
+﻿import threading
+from collections import defaultdict
+
+class Metrics:
+    """Thread-safe counters and timers for a processing run"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = defaultdict(int)
+        self.timers = defaultdict(float)
+        self.timer_counts = defaultdict(int)
+
+    def increment(self, name, amount=1):
+        """Add amount to a counter"""
+        with self.lock:
+            self.counters[name] += amount
+
+    def add_time(self, name, seconds):
+        """Record one timed occurrence of name"""
+        with self.lock:
+            self.timers[name] += seconds
+            self.timer_counts[name] += 1
+
+    def get(self, name):
+        """Get the current value of a counter"""
+        with self.lock:
+            return self.counters[name]
+
+    def summary(self):
+        """Format all counters and timers (total and average per occurrence)"""
+        with self.lock:
+            parts = [f"{name}={value}" for name, value in sorted(self.counters.items())]
+            for name, total in sorted(self.timers.items()):
+                average_ms = total / self.timer_counts[name] * 1000
+                parts.append(f"{name}_time={total:.2f}s ({average_ms:.3f} ms avg)")
+        return ", ".join(parts)
\ No newline at end of file
@@ -0,0 +1,207 @@
+﻿import os
+import re
+import sqlite3
+import logging
+import hashlib
+import threading
+import zlib
+from datetime import datetime, timezone
+from xml.sax.saxutils import escape
+
+# zstd compresses wikitext and Lua better and faster than zlib; fall back
+# to zlib when the package is not installed
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+NAMESPACE_IDS = {'Template': 10, 'Module': 828}
+
+class PageStore:
+    """Packed store of template and module source, one SQLite row per page.
+
+    Content is kept compressed (zstd when available, zlib otherwise) and
+    looked up by (item_type, item_name) through the primary key. Safe to
+    share between fetcher threads.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.logger = logging.getLogger('wiktionary_processor')
+        self.lock = threading.Lock()
+        self.codec = 'zstd' if zstandard is not None else 'zlib'
+        self.compressor = zstandard.ZstdCompressor(level=3) if zstandard is not None else None
+        self.decompressor = zstandard.ZstdDecompressor() if zstandard is not None else None
+        
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode = WAL;')
+        self.conn.execute('PRAGMA synchronous = NORMAL;')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS pages (
+                item_type TEXT NOT NULL,
+                item_name TEXT NOT NULL,
+                sha1 TEXT NOT NULL,
+                codec TEXT NOT NULL,
+                content BLOB NOT NULL,
+                PRIMARY KEY (item_type, item_name)
+            )
+        ''')
+        self.conn.commit()
+        
+    def _compress(self, content):
+        data = content.encode('utf-8')
+        if self.compressor is not None:
+            return self.compressor.compress(data)
+        return zlib.compress(data, 6)
+        
+    def _decompress(self, codec, blob):
+        if codec == 'zstd':
+            if self.decompressor is None:
+                raise RuntimeError("Page store holds zstd-compressed pages; install zstandard to read them")
+            return self.decompressor.decompress(blob).decode('utf-8')
+        return zlib.decompress(blob).decode('utf-8')
+        
+    def get(self, item_type, item_name):
+        """Return the content of a page, or None if it is not stored"""
+        # zstd (de)compressor objects must not be used by two threads at once
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT codec, content FROM pages WHERE item_type = ? AND item_name = ?",
+                (item_type, item_name)
+            ).fetchone()
+            return self._decompress(*row) if row else None
+        
+    def put_many(self, pages):
+        """Store (item_type, item_name, content) tuples in one transaction.
+
+        Pages whose content is unchanged are left alone. Returns the
+        (item_type, item_name) pairs that replaced different content.
+        """
+        rows = []
+        for item_type, item_name, content in pages:
+            sha1 = hashlib.sha1(content.encode('utf-8')).hexdigest()
+            rows.append((item_type, item_name, sha1, content))
+            
+        changed = []
+        try:
+            with self.lock, self.conn:
+                for item_type, item_name, sha1, content in rows:
+                    existing = self.conn.execute(
+                        "SELECT sha1 FROM pages WHERE item_type = ? AND item_name = ?",
+                        (item_type, item_name)
+                    ).fetchone()
+                    if existing and existing[0] == sha1:
+                        continue
+                    if existing:
+                        changed.append((item_type, item_name))
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO pages (item_type, item_name, sha1, codec, content) VALUES (?, ?, ?, ?, ?)",
+                        (item_type, item_name, sha1, self.codec, self._compress(content))
+                    )
+        except sqlite3.Error as e:
+            self.logger.error(f"Error writing page store: {e}")
+            raise
+        return changed
+        
+    def count(self):
+        """Number of stored pages"""
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+            
+    def iter_pages(self):
+        """Yield (item_type, item_name, content) for every page, in title order"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT item_type, item_name FROM pages ORDER BY item_type, item_name"
+            ).fetchall()
+        for item_type, item_name in rows:
+            content = self.get(item_type, item_name)
+            if content is not None:
+                yield item_type, item_name, content
+                
+    def export_xml(self, path, items=None):
+        """Write pages as a MediaWiki XML export, ready for importDump.php.
+
+        Exports every page, or only the given (item_type, item_name) pairs;
+        pairs the store has no content for are left out. Every revision is
+        stamped with the current time: importDump.php only makes an imported
+        revision the page's current one if it is newer than what the wiki
+        already has. Returns the (item_type, item_name) pairs written.
+        """
+        if items is None:
+            pages = self.iter_pages()
+        else:
+            pages = ((item_type, item_name, self.get(item_type, item_name)) for item_type, item_name in items)
+            
+        timestamp = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        exported = []
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.11/" version="0.11" xml:lang="en">\n')
+            for item_type, item_name, content in pages:
+                if content is None:
+                    continue
+                # Module documentation subpages are wikitext, not Lua
+                if item_type == 'Module' and not item_name.endswith('/doc'):
+                    model, content_format = 'Scribunto', 'text/plain'
+                else:
+                    model, content_format = 'wikitext', 'text/x-wiki'
+                f.write(
+                    f'  <page>\n'
+                    f'    <title>{escape(f"{item_type}:{item_name}")}</title>\n'
+                    f'    <ns>{NAMESPACE_IDS[item_type]}</ns>\n'
+                    f'    <revision>\n'
+                    f'      <timestamp>{timestamp}</timestamp>\n'
+                    f'      <contributor><ip>127.0.0.1</ip></contributor>\n'
+                    f'      <comment>Imported from en.wiktionary</comment>\n'
+                    f'      <model>{model}</model>\n'
+                    f'      <format>{content_format}</format>\n'
+                    f'      <text xml:space="preserve">{escape(content)}</text>\n'
+                    f'    </revision>\n'
+                    f'  </page>\n'
+                )
+                exported.append((item_type, item_name))
+            f.write('</mediawiki>\n')
+        return exported
+        
+    def migrate_directory(self, cache_dir, names):
+        """Import the old one-file-per-page cache (cache/Template, cache/Module).
+
+        File names were sanitized, so the real titles come from `names`
+        ((item_type, item_name) pairs, e.g. from the crawl manifest); other
+        files are imported under their file name when that name has no
+        replaced characters. Returns the number of pages imported.
+        """
+        pages = []
+        claimed = set()
+        for item_type, item_name in names:
+            safe_name = re.sub(r'[\\/*?:"<>|]', '_', item_name)
+            file_path = os.path.join(cache_dir, item_type, f"{safe_name}.txt")
+            if os.path.exists(file_path):
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    pages.append((item_type, item_name, f.read()))
+                claimed.add(file_path)
+                
+        skipped = 0
+        for item_type in NAMESPACE_IDS:
+            directory = os.path.join(cache_dir, item_type)
+            if not os.path.isdir(directory):
+                continue
+            for entry in os.scandir(directory):
+                if not entry.name.endswith('.txt') or entry.path in claimed:
+                    continue
+                item_name = entry.name[:-len('.txt')]
+                if '_' in item_name:
+                    # Could stand for any of the sanitized characters
+                    skipped += 1
+                    continue
+                with open(entry.path, 'r', encoding='utf-8') as f:
+                    pages.append((item_type, item_name, f.read()))
+                    
+        self.put_many(pages)
+        self.logger.info(f"Migrated {len(pages)} cached pages into {self.db_path} "
+                         f"({skipped} files with ambiguous names left to be fetched again)")
+        return len(pages)
+        
+    def close(self):
+        """Close the store"""
+        self.conn.close()
\ No newline at end of file
@@ -0,0 +1,31 @@
+﻿import threading
+import time
+
+class TokenBucket:
+    """Thread-safe token bucket shared by all fetchers.
+
+    Allows bursts of up to `capacity` requests and `rate` requests per
+    second on average; a rate of 0 or less disables the limit.
+    """
+    
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        
+    def acquire(self):
+        """Block until a request may be made"""
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
\ No newline at end of file
@@ -0,0 +1,158 @@
+﻿import re
+import sqlite3
+import logging
+import hashlib
+import threading
+import unicodedata
+
+# Spaces and tabs at the end of a line, and runs of them inside one
+TRAILING_SPACE_PATTERN = re.compile(r'[ \t]+$', re.MULTILINE)
+INNER_SPACE_PATTERN = re.compile(r'(?<=\S)[ \t]{2,}')
+
+class RenderCache:
+    """Persistent cache of rendered definitions keyed on their wikitext.
+
+    Keys are a hash of the normalized wikitext. Each entry records the
+    templates and modules its render transcluded, so when one of them
+    changes only the entries that used it are invalidated. Safe to share
+    between worker threads.
+    """
+
+    def __init__(self, db_path, batch_size=500):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.logger = logging.getLogger('wiktionary_processor')
+        self.hits = 0
+        self.misses = 0
+        self.pending = {}
+        self.lock = threading.Lock()
+        
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode = WAL;')
+        self.conn.execute('PRAGMA synchronous = NORMAL;')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS render_cache (
+                key TEXT PRIMARY KEY,
+                processed_text TEXT NOT NULL
+            )
+        ''')
+        # Which entries transcluded which Template:/Module: pages
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS render_dependencies (
+                title TEXT NOT NULL,
+                key TEXT NOT NULL,
+                PRIMARY KEY (title, key)
+            ) WITHOUT ROWID
+        ''')
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_render_dependencies_key ON render_dependencies(key)"
+        )
+        self.conn.commit()
+        
+    @staticmethod
+    def normalize(raw_text):
+        """Normalize wikitext so trivially different copies share an entry.
+
+        Newlines and the whitespace a line starts with are kept, since they
+        change how wikitext renders (lists, preformatted text); only
+        trailing whitespace and runs of spaces within a line are dropped.
+        """
+        text = TRAILING_SPACE_PATTERN.sub('', unicodedata.normalize('NFC', raw_text))
+        return INNER_SPACE_PATTERN.sub(' ', text).rstrip()
+        
+    def _key(self, raw_text):
+        return hashlib.sha256(self.normalize(raw_text).encode('utf-8')).hexdigest()
+        
+    def get(self, raw_text):
+        """Return the cached rendering of raw_text, or None on a miss"""
+        key = self._key(raw_text)
+        
+        with self.lock:
+            if key in self.pending:
+                processed_text = self.pending[key][0]
+            else:
+                row = self.conn.execute(
+                    "SELECT processed_text FROM render_cache WHERE key = ?", (key,)
+                ).fetchone()
+                processed_text = row[0] if row else None
+                
+            if processed_text is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return processed_text
+        
+    def put(self, raw_text, processed_text, dependencies=()):
+        """Store a rendering and the titles it transcluded.
+
+        Writes are batched and flushed every batch_size entries.
+        """
+        key = self._key(raw_text)
+        with self.lock:
+            self.pending[key] = (processed_text, tuple(dependencies))
+            if len(self.pending) >= self.batch_size:
+                self._flush()
+            
+    def flush(self):
+        """Write pending entries to disk"""
+        with self.lock:
+            self._flush()
+            
+    def _flush(self):
+        if not self.pending:
+            return
+        try:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO render_cache (key, processed_text) VALUES (?, ?)",
+                    [(key, text) for key, (text, _) in self.pending.items()]
+                )
+                self.conn.executemany(
+                    "DELETE FROM render_dependencies WHERE key = ?",
+                    [(key,) for key in self.pending]
+                )
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO render_dependencies (title, key) VALUES (?, ?)",
+                    [(title, key) for key, (_, titles) in self.pending.items() for title in titles]
+                )
+            self.pending = {}
+        except sqlite3.Error as e:
+            self.logger.error(f"Error writing render cache: {e}")
+            raise
+            
+    def invalidate_titles(self, titles):
+        """Delete the entries whose render transcluded any of the given titles.
+
+        Returns the number of entries deleted.
+        """
+        titles = list(titles)
+        if not titles:
+            return 0
+        try:
+            with self.lock:
+                self._flush()
+                with self.conn:
+                    self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS changed_titles (title TEXT PRIMARY KEY)")
+                    self.conn.execute("DELETE FROM changed_titles")
+                    self.conn.executemany(
+                        "INSERT OR IGNORE INTO changed_titles (title) VALUES (?)", [(title,) for title in titles]
+                    )
+                    stale = '''
+                        SELECT key FROM render_dependencies
+                        WHERE title IN (SELECT title FROM changed_titles)
+                    '''
+                    cursor = self.conn.execute(f"DELETE FROM render_cache WHERE key IN ({stale})")
+                    self.conn.execute(f"DELETE FROM render_dependencies WHERE key IN ({stale})")
+            if cursor.rowcount:
+                self.logger.info(f"Invalidated {cursor.rowcount} render cache entries using {len(titles)} changed titles")
+            return cursor.rowcount
+        except sqlite3.Error as e:
+            self.logger.error(f"Error invalidating render cache: {e}")
+            raise
+            
+    def close(self):
+        """Flush pending entries and close the cache"""
+        try:
+            self.flush()
+        finally:
+            self.conn.close()
\ No newline at end of file
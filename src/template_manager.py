@@ -4,143 +4,451 @@ import logging
 import json
 import time
 import re
+import threading
+import hashlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from urllib.parse import quote
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from rate_limiter import TokenBucket
+from crawl_manifest import CrawlManifest
+from page_store import PageStore, NAMESPACE_IDS
+
+WIKTIONARY_API_URL = 'https://en.wiktionary.org/w/api.php'
+USER_AGENT = 'wiktionary-db/1.0 (template and module cache)'
+# The query API accepts up to 50 titles per request for regular clients
+MAX_TITLES_PER_QUERY = 50
+# How long a failed title is remembered before it is requested again
+MISSING_TTL = 7 * 24 * 3600
+ERROR_TTL = 3600
+
+# {{name|...}} and {{#invoke:module|function|...}} calls in wikitext
+TEMPLATE_CALL_PATTERN = re.compile(r'(?<!{){{(?!{)\s*([^{}|\n]+)')
+# require("Module:x") and mw.loadData("Module:x") calls in Lua
+MODULE_LOAD_PATTERN = re.compile(r'(?:require|mw\.loadData|mw\.loadJsonData)\s*\(?\s*["\']Module:([^"\']+)["\']')
+# Magic words that look like templates but are never pages
+MAGIC_WORDS = frozenset([
+    '!', '=', 'PAGENAME', 'PAGENAMEE', 'FULLPAGENAME', 'BASEPAGENAME', 'SUBPAGENAME',
+    'ROOTPAGENAME', 'NAMESPACE', 'TALKPAGENAME', 'SITENAME', 'SERVER', 'CURRENTYEAR',
+    'DISPLAYTITLE', 'DEFAULTSORT', 'NOTOC', '__NOTOC__', 'lc', 'uc', 'lcfirst', 'ucfirst',
+    'urlencode', 'anchorencode', 'fullurl', 'localurl', 'ns', 'padleft', 'padright', 'formatnum'
+])
+
+def parse_item_reference(name):
+    """Map a transclusion name to an (item_type, item_name) pair, or None.
+
+    Handles #invoke calls, explicit Template:/Module: prefixes and subst:,
+    and skips parser functions, magic words and parameter placeholders.
+    """
+    name = name.strip().replace('_', ' ')
+    if not name or '{' in name or '}' in name:
+        return None
+    for prefix in ('subst:', 'safesubst:', 'msgnw:'):
+        if name.lower().startswith(prefix):
+            name = name[len(prefix):].strip()
+    if name.lower().startswith('#invoke:'):
+        module = name[len('#invoke:'):].strip()
+        return ('Module', module) if module else None
+    # Other parser functions (#if:, #switch:, ...) and main-namespace transclusions
+    if name.startswith('#') or name.startswith(':'):
+        return None
+    head, sep, rest = name.partition(':')
+    if sep:
+        namespace = head.strip().lower()
+        if namespace == 'template':
+            return ('Template', rest.strip()) if rest.strip() else None
+        if namespace == 'module':
+            return ('Module', rest.strip()) if rest.strip() else None
+        # Magic words with arguments ({{lc:...}}) and other namespaces
+        return None
+    if name in MAGIC_WORDS:
+        return None
+    return ('Template', name)
+
+def resolve_title(title, title_map):
+    """Follow normalization and redirects from a requested title to the page title"""
+    seen = {title}
+    while title in title_map and title_map[title] not in seen:
+        title = title_map[title]
+        seen.add(title)
+    return title
+
+def extract_dependencies(content, item_type='Template'):
+    """Return the set of (item_type, item_name) pairs referenced by a page"""
+    dependencies = set()
+    if item_type == 'Module':
+        for module in MODULE_LOAD_PATTERN.findall(content):
+            dependencies.add(('Module', module.strip()))
+        return dependencies
+    for name in TEMPLATE_CALL_PATTERN.findall(content):
+        item = parse_item_reference(name)
+        if item is not None:
+            dependencies.add(item)
+    return dependencies
 
 class TemplateManager:
-    def __init__(self, cache_dir):
+    def __init__(self, cache_dir, api_url=WIKTIONARY_API_URL, workers=4, requests_per_second=10):
         self.cache_dir = cache_dir
+        self.api_url = api_url
         self.logger = logging.getLogger('wiktionary_processor')
-        self.downloaded_items = set()
-        self.failed_items = set()
+        # Guards the item sets; held only briefly, never across a request
+        self.lock = threading.RLock()
+        # Items currently being fetched, so concurrent crawls wait on them
+        # instead of fetching them twice
+        self.in_flight = {}
+        
+        # Dependency crawling: a pool of fetchers behind one global rate limit
+        self.workers = max(1, workers)
+        self.rate_limiter = TokenBucket(requests_per_second)
+        self.session = self._create_session()
+        
+        # What earlier runs fetched, or failed to fetch, is kept in a manifest
+        # so it is neither downloaded nor requested again
+        os.makedirs(cache_dir, exist_ok=True)
+        self.manifest = CrawlManifest(os.path.join(cache_dir, 'manifest.db'))
+        self.downloaded_items, self.failed_items = self.manifest.load()
+        
+        # Page source lives in one packed store; caches from before it
+        # existed (one .txt file per page) are imported on first use
+        self.store = PageStore(os.path.join(cache_dir, 'pages.db'))
+        if self.store.count() == 0 and any(
+                os.path.isdir(os.path.join(cache_dir, item_type)) for item_type in NAMESPACE_IDS):
+            names = [(item['item_type'], item['item_name']) for item in self.manifest.items() if item['status'] == 'ok']
+            self.store.migrate_directory(cache_dir, names)
         
-        # Create cache directories if they don't exist
-        os.makedirs(os.path.join(cache_dir, 'Template'), exist_ok=True)
-        os.makedirs(os.path.join(cache_dir, 'Module'), exist_ok=True)
+        # Titles whose cached content was replaced by a different revision,
+        # so renders that used them can be invalidated
+        self.changed_titles = set()
+        
+    def _create_session(self):
+        """Create a keep-alive session with one pooled connection per fetcher"""
+        retries = Retry(total=3, backoff_factor=1.0, status_forcelist=(429, 502, 503, 504),
+                        allowed_methods=frozenset(['GET']))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers, max_retries=retries)
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers.update({'User-Agent': USER_AGENT})
+        return session
+        
+    def close(self):
+        """Close the pooled HTTP connections and the manifest"""
+        self.session.close()
+        self.manifest.close()
+        self.store.close()
         
     def download_item(self, item_type, item_name):
-        """Download a template or module from Wiktionary API"""
-        # Check if we already tried to download this item
-        item_key = f"{item_type}:{item_name}"
-        if item_key in self.downloaded_items or item_key in self.failed_items:
-            return
+        """Download a template or module, and its dependencies, from Wiktionary API"""
+        self.crawl([(item_type, item_name)])
+        
+    def crawl(self, items, refetch=False):
+        """Download items and their dependency closure breadth-first.
 
-        try:
-            self.logger.info(f"Downloading {item_type}: {item_name}")
-            
-            # Determine the appropriate namespace prefix
-            namespace = item_type
+        Items are fetched from a FIFO work queue by up to `workers` fetchers
+        at once, each taking up to MAX_TITLES_PER_QUERY titles per request,
+        so the traversal depth is bounded by memory rather than the call
+        stack. Items another crawl is fetching are waited for and then
+        walked like any cached item, so the whole closure is in the cache
+        when this returns. With refetch, the given items are downloaded again even if
+        they were fetched before. Returns the number of items fetched by
+        this call.
+        """
+        frontier = deque()
+        waiting = []
+        visited = set()
+        self._enqueue(items, frontier, waiting, visited, refetch=refetch)
+        
+        fetched = 0
+        if frontier or waiting:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = {}
+                while frontier or futures or waiting:
+                    # Keep every fetcher busy, in queue order
+                    while frontier and len(futures) < self.workers:
+                        batch = [frontier.popleft() for _ in range(min(MAX_TITLES_PER_QUERY, len(frontier)))]
+                        futures[executor.submit(self._fetch_batch, batch)] = batch
+                        
+                    if futures:
+                        done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            futures.pop(future)
+                            for (item_type, item_name), content in future.result().items():
+                                fetched += 1
+                                self._enqueue(extract_dependencies(content, item_type), frontier, waiting, visited)
+                    else:
+                        # Only items another crawl is fetching are left
+                        waiting[0][1].wait()
+                        
+                    # Walk the dependencies of the items other crawls finished
+                    finished = [item for item, event in waiting if event.is_set()]
+                    waiting[:] = [(item, event) for item, event in waiting if not event.is_set()]
+                    visited.difference_update(finished)
+                    self._enqueue(finished, frontier, waiting, visited)
+        return fetched
+        
+    def refresh(self):
+        """Re-fetch the cached items that changed on Wiktionary since they were fetched.
+
+        Only revision ids and timestamps are requested for the whole set,
+        MAX_TITLES_PER_QUERY titles at a time; the items whose revision
+        differs are then downloaded again, along with any dependencies they
+        gained. Returns the titles whose cached content changed.
+        """
+        known = {
+            (item['item_type'], item['item_name']): item['revid']
+            for item in self.manifest.items() if item['status'] == 'ok'
+        }
+        self.logger.info(f"Checking {len(known)} cached templates and modules for new revisions")
+        
+        items = sorted(known)
+        batches = [items[start:start + MAX_TITLES_PER_QUERY] for start in range(0, len(items), MAX_TITLES_PER_QUERY)]
+        changed = []
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for batch, revisions in zip(batches, executor.map(self._query_revision_ids, batches)):
+                changed.extend(item for item in batch if item in revisions and revisions[item] != known[item])
+                
+        self.logger.info(f"{len(changed)} templates and modules have new revisions")
+        with self.lock:
+            self.changed_titles = set()
+        self.crawl(changed, refetch=True)
+        with self.lock:
+            return set(self.changed_titles)
             
-            # Construct the API URL
-            api_url = f"https://en.wiktionary.org/w/api.php"
+    def _query_revision_ids(self, items):
+        """Return {item: current revision id} for the items that still exist"""
+        titles = {f"{item_type}:{item_name}": (item_type, item_name) for item_type, item_name in items}
+        try:
+            pages, title_map = self._query_revisions(list(titles), 'ids|timestamp')
+        except Exception as e:
+            self.logger.error(f"Error checking revisions of {', '.join(titles)}: {str(e)}")
+            return {}
             
-            # Get the content of the template/module
-            params = {
-                'action': 'query',
-                'titles': f"{namespace}:{item_name}",
-                'prop': 'revisions',
-                'rvprop': 'content',
-                'format': 'json'
-            }
+        revisions = {}
+        for title, item in titles.items():
+            page = pages.get(resolve_title(title, title_map))
+            if page is None or page.get('missing') or not page.get('revisions'):
+                # Keep the cached copy of pages deleted since
+                self.logger.warning(f"{title} no longer exists on Wiktionary; keeping the cached copy")
+                continue
+            revisions[item] = page['revisions'][0].get('revid')
+        return revisions
+        
+    def _enqueue(self, items, frontier, waiting, visited, refetch=False):
+        """Queue the items nobody has fetched or is fetching yet.
+
+        Items fetched by an earlier run are not fetched again, but their
+        cached content is walked so that a crawl interrupted part way
+        through the closure is completed. Items another crawl is fetching
+        go to waiting with the event set once it has finished them.
+        """
+        local = deque(items)
+        forced = set(local) if refetch else set()
+        while local:
+            item = local.popleft()
+            if item in visited:
+                continue
+            visited.add(item)
+            item_type, item_name = item
+            item_key = f"{item_type}:{item_name}"
             
-            response = requests.get(api_url, params=params, timeout=30)
-            response.raise_for_status()
-            data = response.json()
+            with self.lock:
+                downloaded = item_key in self.downloaded_items and item not in forced
+            if downloaded:
+                content = self.load_item(item_type, item_name)
+                if content is not None:
+                    local.extend(extract_dependencies(content, item_type))
+                    continue
+                    
+            with self.lock:
+                if item_key in self.failed_items:
+                    continue
+                if item_key in self.in_flight:
+                    waiting.append((item, self.in_flight[item_key]))
+                    continue
+                if not downloaded and item not in forced and item_key in self.downloaded_items:
+                    # Another crawl fetched it since the check above: walk
+                    # its content instead of fetching it again
+                    visited.discard(item)
+                    local.appendleft(item)
+                    continue
+                # Not fetched yet, or its cache file has gone
+                self.in_flight[item_key] = threading.Event()
+                frontier.append(item)
+                
+    def _finish(self, item_key, downloaded):
+        """Record the outcome of a fetch and wake anyone waiting on it"""
+        with self.lock:
+            if downloaded:
+                self.downloaded_items.add(item_key)
+            else:
+                self.failed_items.add(item_key)
+            self.in_flight.pop(item_key).set()
             
-            # Process the response
-            pages = data.get('query', {}).get('pages', {})
+    def _fetch_batch(self, items):
+        """Fetch a batch of templates and modules and save them to the cache.
+
+        Returns a dict of (item_type, item_name) -> content for the items
+        that could be downloaded.
+        """
+        titles = {f"{item_type}:{item_name}": (item_type, item_name) for item_type, item_name in items}
+        contents = {}
+        fetched = []
+        failed = []
+        saved = []
+        try:
+            self.logger.info(f"Downloading {len(titles)} templates and modules")
+            pages, title_map = self._query_revisions(list(titles), 'ids|timestamp|content')
             
-            if pages:
-                # Get the first (and should be only) page
-                page_id = next(iter(pages))
-                page = pages[page_id]
-                
-                # Check if the page exists
-                if 'missing' in page:
+            for title, (item_type, item_name) in titles.items():
+                # Follow normalization and redirects back from the requested name
+                page = pages.get(resolve_title(title, title_map))
+                if page is None or page.get('missing') or page.get('invalid'):
                     self.logger.warning(f"{item_type} {item_name} not found on Wiktionary")
-                    self.failed_items.add(item_key)
-                    return
-                
-                revisions = page.get('revisions', [])
-                if revisions:
-                    content = revisions[0].get('*', '')
-                    
-                    # Save the content to the cache
-                    self._save_to_cache(item_type, item_name, content)
-                    self.downloaded_items.add(item_key)
+                    failed.append((item_type, item_name, 'missing', MISSING_TTL))
+                    continue
                     
-                    # Check for dependencies in the content
-                    self._check_for_dependencies(content)
-                else:
+                revisions = page.get('revisions', [])
+                if not revisions:
                     self.logger.warning(f"No revisions found for {item_type} {item_name}")
-                    self.failed_items.add(item_key)
-            else:
-                self.logger.warning(f"No pages found for {item_type} {item_name}")
-                self.failed_items.add(item_key)
+                    failed.append((item_type, item_name, 'missing', MISSING_TTL))
+                    continue
+                revision = revisions[0]
+                content = revision['slots']['main'].get('content', '')
                 
-        except Exception as e:
-            self.logger.error(f"Error downloading {item_type} {item_name}: {str(e)}")
-            self.failed_items.add(item_key)
-    
-    def _save_to_cache(self, item_type, item_name, content):
-        """Save template/module content to cache"""
-        try:
-            # Sanitize the filename
-            safe_name = re.sub(r'[\\/*?:"<>|]', '_', item_name)
-            
-            # Create the file path
-            file_path = os.path.join(self.cache_dir, item_type, f"{safe_name}.txt")
-            
-            # Save the content
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(content)
+                # Saved to the cache under the requested name
+                saved.append((item_type, item_name, content))
+                contents[(item_type, item_name)] = content
+                sha1 = hashlib.sha1(content.encode('utf-8')).hexdigest()
+                fetched.append((item_type, item_name, revision.get('revid'), revision.get('timestamp'), sha1))
                 
-            self.logger.info(f"Saved {item_type} {item_name} to cache")
+            self._save_to_cache(saved)
             
         except Exception as e:
-            self.logger.error(f"Error saving {item_type} {item_name} to cache: {str(e)}")
+            self.logger.error(f"Error downloading {', '.join(titles)}: {str(e)}")
+            # Nothing reached the page store, so nothing counts as fetched
+            fetched = []
+            contents.clear()
+            # Transient failures are retried sooner than missing pages
+            recorded = {(item_type, item_name) for item_type, item_name, *_ in failed}
+            failed.extend((item_type, item_name, 'error', ERROR_TTL)
+                          for item_type, item_name in items if (item_type, item_name) not in recorded)
+        finally:
+            try:
+                self.manifest.record(fetched, failed)
+            finally:
+                for item_type, item_name in items:
+                    self._finish(f"{item_type}:{item_name}", (item_type, item_name) in contents)
+        return contents
+        
+    def _query_revisions(self, titles, rvprop):
+        """Query the latest revision of several pages, following continuations.
+
+        Returns (pages, title_map): pages by their final title, and the
+        normalized and redirects mappings from requested to final titles.
+        """
+        params = {
+            'action': 'query',
+            'titles': '|'.join(titles),
+            'prop': 'revisions',
+            'rvprop': rvprop,
+            'rvslots': 'main',
+            'redirects': 1,
+            'format': 'json',
+            'formatversion': 2
+        }
+        pages = {}
+        title_map = {}
+        continuation = {}
+        
+        while True:
+            self.rate_limiter.acquire()
+            response = self.session.get(self.api_url, params={**params, **continuation}, timeout=60)
+            response.raise_for_status()
+            data = response.json()
+            if 'error' in data:
+                raise RuntimeError(data['error'].get('info', data['error'].get('code')))
+                
+            query = data.get('query', {})
+            for entry in query.get('normalized', []) + query.get('redirects', []):
+                title_map[entry['from']] = entry['to']
+            for page in query.get('pages', []):
+                # Large responses are split; content arrives in later parts
+                if 'revisions' in page or page['title'] not in pages:
+                    pages[page['title']] = page
+                    
+            if 'continue' not in data:
+                return pages, title_map
+            continuation = data['continue']
     
-    def _check_for_dependencies(self, content):
-        """Check for dependencies in the content and download them"""
-        # Look for template dependencies
-        template_pattern = r'{{([^}|]+)'
-        template_matches = re.findall(template_pattern, content)
-        
-        for template in template_matches:
-            # Clean up the template name
-            template = template.strip()
+    def load_item(self, item_type, item_name):
+        """Return the cached content of a template or module (None if not cached)"""
+        return self.store.get(item_type, item_name)
             
-            # Skip some common non-template uses of double braces
-            if template.lower() in ['if', 'ifeq', 'switch', 'for', '#invoke']:
-                continue
-                
-            self.download_item('Template', template)
+    def uninstalled_items(self):
+        """Return the fetched items whose current revision is not in the local wiki yet"""
+        return self.manifest.uninstalled_items()
         
-        # Look for module dependencies
-        module_pattern = r'require\s*\(\s*["\']Module:([^"\']+)["\']'
-        module_matches = re.findall(module_pattern, content)
+    def mark_installed(self, items):
+        """Record that items were installed into the local wiki"""
+        self.manifest.mark_installed(items)
+            
+    def prefetch(self, names):
+        """Download the full dependency closure of the given template names.
+
+        Names are taken as they appear in transclusions, so #invoke calls,
+        parser functions and magic words are handled like in page content.
+        Returns the number of items fetched.
+        """
+        items = set()
+        for name in names:
+            item = parse_item_reference(name)
+            if item is not None:
+                items.add(item)
+        self.logger.info(f"Prefetching {len(items)} templates and modules and their dependencies")
         
-        for module in module_matches:
-            # Clean up the module name
-            module = module.strip()
-            self.download_item('Module', module)
+        fetched = self.crawl(sorted(items))
+        self.logger.info(f"Prefetch complete: {fetched} items fetched, {len(self.failed_items)} failed")
+        return fetched
+    
+    def _save_to_cache(self, pages):
+        """Save (item_type, item_name, content) tuples to the page store.
+
+        Errors are logged and raised, so the fetch is recorded as failed.
+        """
+        try:
+            # Unchanged pages are left alone; replaced ones invalidate renders
+            changed = self.store.put_many(pages)
+            with self.lock:
+                self.changed_titles.update(f"{item_type}:{item_name}" for item_type, item_name in changed)
+            self.logger.info(f"Saved {len(pages)} templates and modules to cache")
+            
+        except Exception as e:
+            self.logger.error(f"Error saving {len(pages)} templates and modules to cache: {str(e)}")
+            raise
     
     def generate_summary_report(self):
-        """Generate a summary report of downloaded and failed items"""
+        """Generate a summary report of downloaded and failed items from the manifest"""
         report_path = os.path.join(self.cache_dir, 'download_report.json')
         
-        report = {
-            'downloaded_items': list(self.downloaded_items),
-            'failed_items': list(self.failed_items),
-            'total_downloaded': len(self.downloaded_items),
-            'total_failed': len(self.failed_items)
-        }
-        
         try:
+            items = self.manifest.items()
+            downloaded = [f"{item['item_type']}:{item['item_name']}" for item in items if item['status'] == 'ok']
+            failed = [item for item in items if item['status'] != 'ok']
+            report = {
+                'downloaded_items': downloaded,
+                'failed_items': [f"{item['item_type']}:{item['item_name']}" for item in failed],
+                'missing_items': [f"{item['item_type']}:{item['item_name']}" for item in failed if item['status'] == 'missing'],
+                'total_downloaded': len(downloaded),
+                'total_failed': len(failed),
+                'items': items
+            }
+            
             with open(report_path, 'w', encoding='utf-8') as f:
                 json.dump(report, f, indent=2)
                 
             self.logger.info(f"Generated download report: {report_path}")
-            self.logger.info(f"Total items downloaded: {len(self.downloaded_items)}, failed: {len(self.failed_items)}")
+            self.logger.info(f"Total items downloaded: {len(downloaded)}, failed: {len(failed)}")
             
         except Exception as e:
             self.logger.error(f"Error generating download report: {str(e)}")
\ No newline at end of file
@@ -3,21 +3,337 @@ import logging
 import re
 import time
 import json
-from urllib.parse import quote
+import threading
+import html as html_module
+from itertools import islice
+from logger import RequestTracer
+from metrics import Metrics
+from html_text import html_to_text
+
+# Use the faster orjson decoder when it is installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import quote, unquote
+
+# Prefixes of the results recorded when a definition could not be processed
+ERROR_PREFIXES = ('ERROR:', 'PROCESSING ERROR')
+
+UTF8_BOM = b'\xef\xbb\xbf'
+
+# Sentinel wrapped around each definition of a batched parse request
+BATCH_ITEM_TEMPLATE = '<div id="wdb-item-{index}">{raw_text}</div>'
+BATCH_ITEM_PATTERN = re.compile(r'<div id="wdb-item-(\d+)">')
+DIV_TAG_PATTERN = re.compile(r'<(/?)div\b[^>]*>')
+
+# Namespaces of the pages we download, as listed in parse templates metadata
+NAMESPACE_ITEM_TYPES = {10: 'Template', 828: 'Module'}
+
+# Red links to missing templates/modules, and Scribunto's missing-module errors
+MISSING_ITEM_PATTERN = re.compile(
+    r'title=(?P<redlink_type>Template|Module):(?P<redlink_name>[^"&]+)&amp;action=edit&amp;redlink=1'
+    r'|No such module (?:&quot;|")(?P<no_such_module>[^"&<]+)(?:&quot;|")'
+    r'|module (?:&#39;|\')Module:(?P<required_module>[^\'&<]+)(?:&#39;|\') not found'
+)
+
+# Errors MediaWiki renders inline (Lua errors, template loops, #expr errors)
+RENDER_ERROR_PATTERN = re.compile(r'<strong class="error">(.*?)</strong>', re.DOTALL)
+
+def decode_json(content):
+    """Parse a JSON response body in a single pass, ignoring a leading UTF-8 BOM"""
+    if orjson is not None:
+        # Slicing a memoryview skips the BOM without copying the body
+        if content.startswith(UTF8_BOM):
+            return orjson.loads(memoryview(content)[len(UTF8_BOM):])
+        return orjson.loads(content)
+    # Given bytes, json.loads detects and strips the BOM while decoding
+    return json.loads(content)
 
 class WikiProcessor:
-    def __init__(self, api_url, template_manager):
+    def __init__(self, api_url, template_manager, render_cache=None, pool_size=4,
+                 max_batch_size=1, target_batch_latency=2.0, max_batch_html_size=1024*1024,
+                 trace_every=1000, installer=None, local_renderer=None, parity=False):
         self.api_url = api_url
         self.template_manager = template_manager
+        # Pushes templates downloaded on a miss into the local wiki
+        self.installer = installer
+        self.render_cache = render_cache
+        # Definitions the local renderer supports skip MediaWiki entirely,
+        # unless parity mode asks for both renders to be compared
+        self.local_renderer = local_renderer
+        self.parity = parity
         self.logger = logging.getLogger('wiktionary_processor')
+        self.tracer = RequestTracer(self.logger, every=trace_every)
+        self.metrics = Metrics()
+        self.session = self._create_session(pool_size)
+        
+        # Multi-definition batching (max_batch_size=1 disables it). The batch
+        # size starts small and adapts to observed latency and response size
+        self.max_batch_size = max(1, max_batch_size)
+        self.batch_size = min(4, self.max_batch_size)
+        self.target_batch_latency = target_batch_latency
+        self.max_batch_html_size = max_batch_html_size
+        self.batch_lock = threading.Lock()
+        
+    def _create_session(self, pool_size):
+        """Create a keep-alive session with one pooled connection per worker"""
+        # Parsing is idempotent, so POSTs are safe to retry on transient failures
+        retries = Retry(
+            total=3,
+            connect=3,
+            read=2,
+            backoff_factor=0.5,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(['GET', 'POST']),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            pool_block=True,
+            max_retries=retries
+        )
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers.update({'Accept': 'application/json'})
+        return session
+        
+    def close(self):
+        """Close the pooled HTTP connections"""
+        self.session.close()
         
     def process_definition(self, raw_text):
-        """Process a raw definition text using MediaWiki API"""
-        # First, attempt to process with what we have
-        processed_text = self._try_process_definition(raw_text)
+        """Process a raw definition text, locally or from the render cache when possible"""
+        local_text = self._render_locally(raw_text)
+        if local_text is not None and not self.parity:
+            return local_text
+            
+        processed_text = self.render_cache.get(raw_text) if self.render_cache is not None else None
+        if processed_text is None:
+            processed_text = self._store(raw_text, *self._render_definition(raw_text))
+        if local_text is not None:
+            self._check_parity(raw_text, local_text, processed_text)
+        return processed_text
+        
+    def _render_locally(self, raw_text):
+        """Render a definition without MediaWiki, or return None if it needs the API"""
+        if self.local_renderer is None:
+            return None
+        start = time.monotonic()
+        local_text = self.local_renderer.render(raw_text)
+        if local_text is not None:
+            self.metrics.add_time('local_render', time.monotonic() - start)
+            if not self.parity:
+                self.metrics.increment('local_renders')
+        return local_text
+        
+    def _check_parity(self, raw_text, local_text, processed_text):
+        """Compare a local render with MediaWiki's, ignoring whitespace differences"""
+        if processed_text.startswith(ERROR_PREFIXES):
+            return
+        self.metrics.increment('parity_checks')
+        if ' '.join(local_text.split()) != ' '.join(processed_text.split()):
+            self.metrics.increment('parity_mismatches')
+            self.logger.warning(f"Local render differs from MediaWiki for {raw_text!r}: "
+                                f"local={local_text!r} mediawiki={processed_text!r}")
+        
+    def _store(self, raw_text, processed_text, dependencies=()):
+        """Add a rendered definition, and the titles it used, to the render cache and return it"""
+        # Only successful renders are cached, so failures get retried
+        if self.render_cache is not None and not processed_text.startswith(ERROR_PREFIXES):
+            self.render_cache.put(raw_text, processed_text, dependencies)
+        return processed_text
+        
+    def process_batch(self, raw_texts):
+        """Process several definitions, packing the ones that are neither rendered
+        locally nor cached into one parse request.
+
+        Returns the processed texts in input order. Definitions whose batched
+        render reports missing templates or modules or shows an error, or all
+        of them if the batch could not be split back apart, go through the
+        single-definition path instead.
+        """
+        results = [None] * len(raw_texts)
+        local_texts = {}
+        pending = []
+        for index, raw_text in enumerate(raw_texts):
+            local_text = self._render_locally(raw_text)
+            if local_text is not None:
+                local_texts[index] = local_text
+                if not self.parity:
+                    results[index] = local_text
+                    continue
+            cached_text = self.render_cache.get(raw_text) if self.render_cache is not None else None
+            if cached_text is None:
+                pending.append(index)
+            else:
+                results[index] = cached_text
+                
+        segments = None
+        retry_individually = set()
+        if len(pending) > 1:
+            segments, batch_missing, batch_dependencies = self._render_batch([raw_texts[index] for index in pending])
+            if segments is not None and (batch_missing is None or batch_missing):
+                # Work out which definitions the missing items belong to;
+                # those are downloaded and retried one definition at a time
+                retry_individually = {
+                    position for position, segment in enumerate(segments)
+                    if self._extract_missing_items(segment)
+                }
+                if batch_missing and not retry_individually:
+                    retry_individually = set(range(len(segments)))
+            if segments is not None:
+                # Definitions that rendered an error are recorded as errors
+                # by the single-definition path
+                retry_individually.update(
+                    position for position, segment in enumerate(segments)
+                    if self._is_render_error(segment)
+                )
+            
+        for position, index in enumerate(pending):
+            raw_text = raw_texts[index]
+            processed_text = None
+            if segments is not None and position not in retry_individually:
+                # The batch only reports what all its definitions used together
+                processed_text = self._clean_html(segments[position])
+                dependencies = batch_dependencies
+            if processed_text is None:
+                processed_text, dependencies = self._render_definition(raw_text)
+            results[index] = self._store(raw_text, processed_text, dependencies)
+            
+        if self.parity:
+            for index, local_text in local_texts.items():
+                self._check_parity(raw_texts[index], local_text, results[index])
+        return results
+        
+    def _render_batch(self, raw_texts):
+        """Parse several definitions in one request.
+
+        Returns (segments, missing_items, dependencies): the per-definition
+        HTML fragments (None if the batch failed or could not be split), and
+        the missing items (None if the metadata is absent) and templates and
+        modules the templates metadata reports for the whole batch.
+        """
+        wikitext = "\n".join(
+            BATCH_ITEM_TEMPLATE.format(index=index, raw_text=raw_text)
+            for index, raw_text in enumerate(raw_texts)
+        )
+        
+        start = time.monotonic()
+        parse, error = self._parse_wikitext(wikitext)
+        elapsed = time.monotonic() - start
+        html = parse['text'] if parse else ''
+        
+        segments = None
+        missing_items = None
+        dependencies = ()
+        if parse is not None and not error:
+            segments = self._split_batch_html(html, len(raw_texts))
+            if 'templates' in parse:
+                missing_items = self._extract_missing_items(html, parse['templates'])
+                dependencies = self._extract_dependencies(parse['templates'])
+        if segments is None:
+            self.logger.warning(f"Could not split batch of {len(raw_texts)} definitions; parsing them individually")
+            
+        self._adapt_batch_size(elapsed, len(html), segments is not None)
+        return segments, missing_items, dependencies
+        
+    def _split_batch_html(self, html, count):
+        """Split batched HTML back into per-definition fragments along the sentinels.
+
+        Returns None unless every sentinel appears once, in order, and its <div>
+        closes (by depth) before the next sentinel starts, which catches
+        definitions with unbalanced markup that swallowed or broke a wrapper.
+        """
+        matches = list(BATCH_ITEM_PATTERN.finditer(html))
+        if [int(match.group(1)) for match in matches] != list(range(count)):
+            return None
+            
+        segments = []
+        for index, match in enumerate(matches):
+            is_last = index == count - 1
+            next_start = len(html) if is_last else matches[index + 1].start()
+            
+            depth = 0
+            closing_tag = None
+            for tag in DIV_TAG_PATTERN.finditer(html, match.start(), next_start):
+                depth += -1 if tag.group(1) else 1
+                if depth == 0:
+                    closing_tag = tag
+                    break
+                    
+            if closing_tag is None:
+                return None
+            if not is_last and html[closing_tag.end():next_start].strip():
+                return None
+            segments.append(html[match.end():closing_tag.start()])
+            
+        return segments
+        
+    def _adapt_batch_size(self, elapsed, html_size, split_ok):
+        """Grow the batch size additively while batches stay fast and small, halve it otherwise"""
+        with self.batch_lock:
+            if (not split_ok or elapsed > self.target_batch_latency
+                    or html_size > self.max_batch_html_size):
+                self.batch_size = max(1, self.batch_size // 2)
+            elif self.batch_size < self.max_batch_size:
+                self.batch_size += 1
+        
+    def process_definitions_concurrently(self, definitions, workers=4):
+        """Process (definition_id, word_id, raw_text) rows with N requests in flight.
+
+        Yields (definition_id, processed_text, error) in completion order, with
+        error set to the exception if processing raised. Rows are submitted in
+        batches of the current adaptive batch size, and at most 2 * workers
+        batches are submitted ahead of the consumer, so the input iterator is
+        only drained as fast as results are taken and memory stays bounded.
+        """
+        max_in_flight = workers * 2
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='parse')
+        in_flight = {}
+        definitions = iter(definitions)
+        exhausted = False
+        
+        try:
+            while True:
+                # Top up the in-flight set (backpressure: never more than max_in_flight)
+                while not exhausted and len(in_flight) < max_in_flight:
+                    batch = list(islice(definitions, self.batch_size))
+                    if not batch:
+                        exhausted = True
+                        break
+                    definition_ids = [definition[0] for definition in batch]
+                    raw_texts = [definition[2] for definition in batch]
+                    in_flight[executor.submit(self.process_batch, raw_texts)] = definition_ids
+                    
+                if not in_flight:
+                    break
+                    
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    definition_ids = in_flight.pop(future)
+                    error = future.exception()
+                    processed_texts = [None] * len(definition_ids) if error else future.result()
+                    for definition_id, processed_text in zip(definition_ids, processed_texts):
+                        yield definition_id, processed_text, error
+        finally:
+            # Drop queued work on early exit; running requests finish on their own
+            executor.shutdown(wait=True, cancel_futures=True)
         
-        # Check for missing template or module errors
-        missing_items = self._extract_missing_items(processed_text)
+    def _render_definition(self, raw_text):
+        """Process a raw definition text using MediaWiki API.
+
+        Returns (processed_text, dependencies), the latter being the titles
+        of the templates and modules the final render used.
+        """
+        # First, attempt to process with what we have, checking for missing
+        # templates or modules
+        processed_text, missing_items, dependencies = self._try_process_definition(raw_text)
         
         # If there are missing templates/modules, download them and retry
         retry_count = 0
@@ -30,143 +346,159 @@ class WikiProcessor:
             # Download all missing templates and modules
             for item_type, item_name in missing_items:
                 self.template_manager.download_item(item_type, item_name)
+            if self.installer is not None:
+                self.installer.install_pending()
                 
-            # Retry processing
-            processed_text = self._try_process_definition(raw_text)
-            
-            # Check for any new missing items
-            missing_items = self._extract_missing_items(processed_text)
+            # Retry processing, checking for any new missing items
+            processed_text, missing_items, dependencies = self._try_process_definition(raw_text)
         
         if missing_items:
             self.logger.warning(f"Still have missing items after {max_retries} retries: {missing_items}")
             processed_text = f"ERROR: Could not process due to missing items: {missing_items}"
         
-        return processed_text
+        return processed_text, dependencies
         
     def _try_process_definition(self, raw_text):
-        """Attempt to process the definition with MediaWiki"""
+        """Attempt to process the definition with MediaWiki.
+
+        Returns (processed_text, missing_items, dependencies).
+        """
+        # Prepare the definition text for processing
+        parse, error = self._parse_wikitext(f"<div>{raw_text}</div>")
+        if error:
+            return error, set(), ()
+        if parse is None:
+            # For now, if result doesn't contain parsed text, return raw definition
+            # This helps us see if API is working at all
+            return f"PROCESSING ERROR - USING RAW: {raw_text}", set(), ()
+        html = parse['text']
+        templates = parse.get('templates')
+        missing_items = self._extract_missing_items(html, templates)
+        if not missing_items and self._is_render_error(html):
+            # Nothing to download would fix it, so record it as an error
+            # rather than storing the error message as the definition
+            error = RENDER_ERROR_PATTERN.search(html)
+            message = self._clean_html(error.group(1) if error else html)
+            return f"ERROR: MediaWiki rendered an error: {message}", set(), ()
+        return (self._clean_html(html), missing_items,
+                self._extract_dependencies(templates or ()))
+        
+    def _parse_wikitext(self, wikitext):
+        """Send wikitext to action=parse.
+
+        Returns (parse, error): the parse result (HTML under 'text', the
+        transcluded templates and modules under 'templates'), or an ERROR
+        string describing why the request failed. Both are None if the
+        response had no parsed text.
+        """
+        start = time.monotonic()
         try:
-            # Prepare the definition text for processing
-            wikitext = f"<div>{raw_text}</div>"
-            
-            self.logger.info(f"Sending request to MediaWiki API at: {self.api_url}")
-            self.logger.info(f"Input wikitext: {wikitext}")
-            
-            # Make API request to parse the wikitext
-            response = requests.post(
+            # Make API request to parse the wikitext. formatversion=2 returns
+            # the HTML directly as parse.text instead of nesting it under '*'
+            response = self.session.post(
                 self.api_url,
                 data={
                     'action': 'parse',
                     'text': wikitext,
                     'contentmodel': 'wikitext',
                     'format': 'json',
+                    'formatversion': 2,
                     'disablelimitreport': 1,
-                    'prop': 'text'
-                },
-                headers={
-                    'Accept': 'application/json',
-                    'Content-Type': 'application/x-www-form-urlencoded'
+                    'prop': 'text|templates'
                 },
                 timeout=30
             )
+            request_seconds = time.monotonic() - start
+            self.metrics.increment('requests')
+            self.metrics.add_time('request', request_seconds)
             
-            # Log response details
-            self.logger.info(f"Response status code: {response.status_code}")
-            self.logger.info(f"Response headers: {response.headers}")
+            content = response.content
+            if not response.ok:
+                self.tracer.trace(error=True, status=response.status_code,
+                                  seconds=round(request_seconds, 4), size=len(content), wikitext=wikitext)
+                response.raise_for_status()
             
-            # Log the raw response content (first 200 chars)
-            content_preview = response.content[:200] if response.content else b"(empty)"
-            self.logger.info(f"Raw response content (first 200 chars): {content_preview}")
-            
-            response.raise_for_status()
-            
-            # Try multiple parsing approaches
-            result = None
-            parsing_errors = []
-            
-            # Approach 1: Handle UTF-8 BOM
+            # Decode the body exactly once
+            decode_start = time.monotonic()
             try:
-                content = response.content.decode('utf-8-sig')
-                result = json.loads(content)
-                self.logger.info("Successfully parsed response with utf-8-sig encoding")
-            except Exception as e:
-                parsing_errors.append(f"UTF-8-sig parsing failed: {str(e)}")
-            
-            # Approach 2: Standard JSON parsing
-            if result is None:
-                try:
-                    result = response.json()
-                    self.logger.info("Successfully parsed response with standard json()")
-                except Exception as e:
-                    parsing_errors.append(f"Standard JSON parsing failed: {str(e)}")
+                result = decode_json(content)
+            except ValueError as e:
+                # Fatal MediaWiki errors come back as an HTML page instead of JSON
+                body = content[len(UTF8_BOM):] if content.startswith(UTF8_BOM) else content
+                if body.lstrip().startswith(b'<'):
+                    self.logger.error(f"Received HTML error response: {content[:200]!r}...")
+                    return None, "ERROR: MediaWiki API returned HTML error"
+                self.logger.error(f"JSON parsing failed. Error: {e}")
+                return None, f"ERROR: Failed to parse MediaWiki API response - {e}"
+            finally:
+                decode_seconds = time.monotonic() - decode_start
+                self.metrics.add_time('decode', decode_seconds)
             
-            # Approach 3: Try to extract JSON from HTML error response
-            if result is None and b'<' in response.content:
-                try:
-                    # Some error responses might contain HTML
-                    error_text = response.content.decode('utf-8-sig')
-                    self.logger.error(f"Received HTML error response: {error_text[:200]}...")
-                    return f"ERROR: MediaWiki API returned HTML error"
-                except Exception as e:
-                    parsing_errors.append(f"HTML parsing failed: {str(e)}")
-            
-            # If all parsing attempts failed
-            if result is None:
-                error_msg = "; ".join(parsing_errors)
-                self.logger.error(f"All JSON parsing attempts failed. Error: {error_msg}")
-                return f"ERROR: Failed to parse MediaWiki API response - {error_msg}"
+            # Sampled trace of the request
+            self.tracer.trace(
+                status=response.status_code,
+                seconds=round(request_seconds, 4),
+                decode_seconds=round(decode_seconds, 6),
+                size=len(content),
+                wikitext=wikitext
+            )
             
-            # Extract the parsed HTML if successful
-            if 'parse' in result and 'text' in result['parse']:
-                html = result['parse']['text']['*']
-                cleaned_text = self._clean_html(html)
-                return cleaned_text
+            # Extract the parse result if successful
+            parse = result.get('parse') if isinstance(result, dict) else None
+            if isinstance(parse, dict) and isinstance(parse.get('text'), str):
+                return parse, None
             else:
-                # For now, if result doesn't contain parsed text, return raw definition
-                # This helps us see if API is working at all
                 self.logger.warning(f"API response did not contain parsed text: {result}")
-                return f"PROCESSING ERROR - USING RAW: {raw_text}"
+                return None, None
                 
         except requests.RequestException as e:
             self.logger.error(f"API request error: {e}")
-            return f"ERROR: API request failed - {str(e)}"
+            return None, f"ERROR: API request failed - {str(e)}"
             
         except Exception as e:
             self.logger.error(f"Processing error: {e}")
-            return f"ERROR: {str(e)}"
+            return None, f"ERROR: {str(e)}"
     
-    def _extract_missing_items(self, text):
-        """Extract references to missing templates or modules from error text"""
-        missing_items = []
-        
-        # Look for template errors
-        template_pattern = r"Template:([^\s]+) not found"
-        template_matches = re.findall(template_pattern, text)
-        for template in template_matches:
-            missing_items.append(('Template', template))
-            
-        # Look for module errors
-        module_pattern = r"Module:([^\s]+) not found"
-        module_matches = re.findall(module_pattern, text)
-        for module in module_matches:
-            missing_items.append(('Module', module))
-            
-        # Look for Lua errors that might indicate missing modules
-        lua_pattern = r"Lua error in Module:([^\s:]+)"
-        lua_matches = re.findall(lua_pattern, text)
-        for module in lua_matches:
-            if ('Module', module) not in missing_items:
-                missing_items.append(('Module', module))
+    def _extract_dependencies(self, templates):
+        """Titles of the Template: and Module: pages a parse transcluded"""
+        return tuple(sorted(
+            template['title'] for template in templates
+            if template.get('ns') in NAMESPACE_ITEM_TYPES and template.get('exists')
+        ))
+        
+    def _extract_missing_items(self, html, templates=None):
+        """Find the templates and modules a parse result reports as missing.
+
+        Returns a set of (item_type, item_name) tuples. When the parse API's
+        templates metadata is available it is used directly: Scribunto lists
+        invoked modules there too (namespace 828), without 'exists' when the
+        page is missing. The HTML is only scanned when there is no metadata,
+        or for Scribunto errors (e.g. a require() of a missing module).
+        """
+        missing_items = set()
+        if templates is not None:
+            for template in templates:
+                item_type = NAMESPACE_ITEM_TYPES.get(template.get('ns'))
+                if item_type and not template.get('exists'):
+                    missing_items.add((item_type, template['title'].split(':', 1)[1]))
+            if 'scribunto-error' not in html:
+                return missing_items
+                
+        # One scan for red links to Template:/Module: pages and Scribunto errors
+        for match in MISSING_ITEM_PATTERN.finditer(html):
+            if match.group('redlink_type'):
+                name = unquote(html_module.unescape(match.group('redlink_name'))).replace('_', ' ')
+                missing_items.add((match.group('redlink_type'), name))
+            else:
+                name = match.group('no_such_module') or match.group('required_module')
+                missing_items.add(('Module', html_module.unescape(name)))
                 
         return missing_items
     
+    def _is_render_error(self, html):
+        """Whether MediaWiki rendered an inline error into the HTML"""
+        return 'scribunto-error' in html or RENDER_ERROR_PATTERN.search(html) is not None
+        
     def _clean_html(self, html):
         """Clean HTML to get plain text"""
-        # Remove HTML tags
-        text = re.sub(r'<[^>]+>', ' ', html)
-        
-        # Clean up whitespace
-        text = re.sub(r'\s+', ' ', text)
-        text = text.strip()
-        
-        return text
\ No newline at end of file
+        return html_to_text(html)
\ No newline at end of file
@@ -0,0 +1,168 @@
+﻿import re
+
+# Everything the tokenizer cares about; the text between matches is literal.
+# References are matched whole so they drop out of the tree
+TOKEN_PATTERN = re.compile(
+    r'\{\{|\}\}|\[\[|\]\]|\|'
+    r'|<ref[^>]*/>|<ref[^>]*>.*?</ref>|&lt;ref&gt;.*?&lt;/ref&gt;',
+    re.DOTALL
+)
+CLOSERS = {'}}': '{{', ']]': '[['}
+
+class Template:
+    """A {{name|arg|key=value}} call; name_nodes and argument values are node lists"""
+    __slots__ = ('name_nodes', 'args')
+
+    def __init__(self, name_nodes, args):
+        self.name_nodes = name_nodes
+        # (key, nodes) pairs in call order, key None for positional arguments
+        self.args = args
+
+    @property
+    def name(self):
+        """The normalized template name, or None if it is built by nested markup"""
+        if not all(isinstance(node, str) for node in self.name_nodes):
+            return None
+        return normalize_name(''.join(self.name_nodes))
+
+class WikiLink:
+    """A [[target|label]] link; target and label are node lists, label None if absent"""
+    __slots__ = ('target', 'label')
+
+    def __init__(self, target, label):
+        self.target = target
+        self.label = label
+
+class Arguments:
+    """Rendered template arguments, handed to the template handlers"""
+    __slots__ = ('items', 'positional', 'named')
+
+    def __init__(self, items):
+        self.items = items
+        self.positional = [value for key, value in items if key is None]
+        self.named = {key: value for key, value in items if key is not None}
+
+    def get(self, index, default=''):
+        """The positional argument at index (0-based), or default"""
+        return self.positional[index] if index < len(self.positional) else default
+
+def normalize_name(name):
+    """Template names ignore surrounding whitespace and treat _ as a space"""
+    return name.strip().replace('_', ' ')
+
+def parse_wikitext(text):
+    """Parse wikitext into a list of str, Template and WikiLink nodes in one pass.
+
+    Nesting follows the brace and bracket pairs. A closer without a matching
+    opener is kept as text, as are unclosed templates and links together with
+    everything they contained.
+    """
+    root = []
+    # Open templates and links, innermost last: [opener, parts], where each
+    # part is the node list of one |-separated section
+    stack = []
+    position = 0
+
+    for match in TOKEN_PATTERN.finditer(text):
+        current = stack[-1][1][-1] if stack else root
+        if match.start() > position:
+            current.append(text[position:match.start()])
+        position = match.end()
+        token = match.group()
+
+        if token == '{{' or token == '[[':
+            stack.append([token, [[]]])
+        elif token == '|':
+            if stack:
+                stack[-1][1].append([])
+            else:
+                current.append(token)
+        elif token in CLOSERS:
+            opener = CLOSERS[token]
+            depth = next((depth for depth in range(len(stack) - 1, -1, -1) if stack[depth][0] == opener), None)
+            if depth is None:
+                current.append(token)
+                continue
+            # Anything opened inside the matched pair and left unclosed is text
+            while len(stack) > depth + 1:
+                _unwind(stack, root)
+            _, parts = stack.pop()
+            if opener == '{{':
+                node = _make_template(parts)
+            else:
+                node = WikiLink(parts[0], _join_parts(parts[1:]) if len(parts) > 1 else None)
+            (stack[-1][1][-1] if stack else root).append(node)
+        # Anything else is a reference, which renders as nothing
+
+    current = stack[-1][1][-1] if stack else root
+    if position < len(text):
+        current.append(text[position:])
+    while stack:
+        _unwind(stack, root)
+    return root
+
+def _unwind(stack, root):
+    """Turn the innermost open template or link back into literal text"""
+    opener, parts = stack.pop()
+    parent = stack[-1][1][-1] if stack else root
+    parent.append(opener)
+    parent.extend(_join_parts(parts))
+
+def _join_parts(parts):
+    """Concatenate |-separated node lists back together with the pipes"""
+    nodes = list(parts[0])
+    for part in parts[1:]:
+        nodes.append('|')
+        nodes.extend(part)
+    return nodes
+
+def _make_template(parts):
+    """Build a Template, splitting key=value arguments on the first top-level ="""
+    args = []
+    for part in parts[1:]:
+        if part and isinstance(part[0], str) and '=' in part[0]:
+            key, _, rest = part[0].partition('=')
+            value = [rest] + part[1:] if rest else part[1:]
+            args.append((key.strip(), value))
+        else:
+            args.append((None, part))
+    return Template(parts[0], args)
+
+def iter_templates(nodes):
+    """Yield every Template in the tree, outermost first"""
+    for node in nodes:
+        if isinstance(node, Template):
+            yield node
+            yield from iter_templates(node.name_nodes)
+            for _, value in node.args:
+                yield from iter_templates(value)
+        elif isinstance(node, WikiLink):
+            yield from iter_templates(node.target)
+            if node.label is not None:
+                yield from iter_templates(node.label)
+
+def render_nodes(nodes, handlers, default_handler):
+    """Render a tree to text in one walk.
+
+    Arguments are rendered first, so handlers receive plain strings; a
+    template's handler is looked up by name in handlers, falling back to
+    default_handler(name, arguments). Links render as their label, or their
+    target when they have none.
+    """
+    out = []
+    for node in nodes:
+        if isinstance(node, str):
+            out.append(node)
+        elif isinstance(node, Template):
+            name = normalize_name(render_nodes(node.name_nodes, handlers, default_handler))
+            items = []
+            for key, value in node.args:
+                value = render_nodes(value, handlers, default_handler)
+                items.append((key, value if key is None else value.strip()))
+            arguments = Arguments(items)
+            handler = handlers.get(name) or handlers.get(name[:1].lower() + name[1:])
+            out.append(handler(arguments) if handler else default_handler(name, arguments))
+        else:
+            out.append(render_nodes(node.label if node.label is not None else node.target,
+                                    handlers, default_handler))
+    return ''.join(out)
\ No newline at end of file
@@ -0,0 +1,57 @@
+﻿#!/usr/bin/env python3
+import bz2
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add parent directory to path for imports (data scripts import each other by name)
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent / 'data'))
+
+from dump_source import is_candidate_page, iter_dump_pages, mapped_chunks, read_pages
+from tests.dump_fixture import write_dump, write_multistream_dump
+
+PAGE_COUNT = 100000
+
+def measure(label, pages, xml_size):
+    start = time.perf_counter()
+    candidate_count = sum(1 for _ in pages)
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<34} {elapsed:6.2f}s {PAGE_COUNT / elapsed:9.0f} pages/s "
+          f"{xml_size / elapsed / 1e6:6.1f} MB/s of XML")
+    return candidate_count
+
+def run_benchmark():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_dir = Path(temp_dir)
+        xml_path = temp_dir / 'dump.xml'
+        write_dump(xml_path, PAGE_COUNT)
+        bz2_path = temp_dir / 'dump.xml.bz2'
+        with open(xml_path, 'rb') as source, bz2.open(bz2_path, 'wb') as target:
+            shutil.copyfileobj(source, target)
+        multistream_path = temp_dir / 'dump-multistream.xml.bz2'
+        write_multistream_dump(multistream_path, temp_dir / 'dump-multistream-index.txt.bz2', PAGE_COUNT)
+        
+        workers = os.cpu_count() or 1
+        print(f"Fixture: {PAGE_COUNT} pages, {xml_path.stat().st_size / 1e6:.1f} MB of XML")
+        size = xml_path.stat().st_size
+        
+        # Plain XML: decode and join every line of every page, or find pages
+        # and filter them on the raw bytes of a memory map
+        measure('line reader + filter', (page for page in read_pages(str(xml_path)) if is_candidate_page(page)), size)
+        chunks = mapped_chunks(str(xml_path))
+        candidates = measure('mmap scanner', (page for chunk in chunks for page in chunk), size)
+        print(f"  {sum(chunk.skipped_pages for chunk in chunks)} pages skipped, {candidates} decoded")
+        
+        measure('bz2.open + filter, one process',
+                (page for page in read_pages(str(bz2_path)) if is_candidate_page(page)), size)
+        measure('multistream, inline', iter_dump_pages(str(multistream_path), workers=1), size)
+        measure(f'multistream, {workers} processes', iter_dump_pages(str(multistream_path), workers=workers), size)
+        measure(f'multistream, {workers} processes, unordered',
+                iter_dump_pages(str(multistream_path), workers=workers, ordered=False), size)
+
+if __name__ == "__main__":
+    run_benchmark()
\ No newline at end of file
@@ -0,0 +1,45 @@
+﻿#!/usr/bin/env python3
+import re
+import sys
+import time
+from pathlib import Path
+
+# Add parent directory to path for imports (src modules import each other by name)
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent / 'src'))
+
+from src.html_text import html_to_text
+
+CORPUS_PATH = Path(__file__).parent / 'fixtures' / 'rendered_definitions.html'
+ROUNDS = 500
+
+def clean_html_regex(html):
+    """The previous _clean_html: two regex passes, no entity decoding"""
+    text = re.sub(r'<[^>]+>', ' ', html)
+    text = re.sub(r'\s+', ' ', text)
+    return text.strip()
+
+def measure(label, convert, corpus):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        for html in corpus:
+            convert(html)
+    elapsed = time.perf_counter() - start
+    per_definition_us = elapsed / (ROUNDS * len(corpus)) * 1e6
+    print(f"  {label:<22} {per_definition_us:8.1f} us/definition")
+
+def run_benchmark():
+    corpus = [line for line in CORPUS_PATH.read_text(encoding='utf-8').splitlines() if line.strip()]
+    print(f"Corpus: {len(corpus)} rendered definitions x {ROUNDS} rounds")
+    measure('regex _clean_html', clean_html_regex, corpus)
+    measure('html_to_text', html_to_text, corpus)
+    print()
+    
+    # Show what the extra work buys on a few samples
+    for html in corpus[3:6]:
+        print(f"  regex:        {clean_html_regex(html)}")
+        print(f"  html_to_text: {html_to_text(html)}")
+        print()
+
+if __name__ == "__main__":
+    run_benchmark()
\ No newline at end of file
@@ -0,0 +1,77 @@
+﻿#!/usr/bin/env python3
+import sys
+import tempfile
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Add parent directory to path for imports (src modules import each other by name)
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent / 'src'))
+
+from src.wiki_processor import WikiProcessor
+from src.template_manager import TemplateManager
+from tests.stub_server import StubWikiServer
+
+REQUESTS_PER_RUN = 2000
+DEFINITION = "{{lb|en|transitive}} To [[transport]] (someone) from one place to another."
+
+PARSE_PARAMS = {
+    'action': 'parse',
+    'text': f"<div>{DEFINITION}</div>",
+    'contentmodel': 'wikitext',
+    'format': 'json',
+    'disablelimitreport': 1,
+    'prop': 'text'
+}
+
+def post_without_session(api_url):
+    """The old request path: a fresh connection for every definition"""
+    response = requests.post(
+        api_url,
+        data=PARSE_PARAMS,
+        headers={
+            'Accept': 'application/json',
+            'Content-Type': 'application/x-www-form-urlencoded'
+        },
+        timeout=30
+    )
+    response.raise_for_status()
+
+def post_with_session(wiki_processor):
+    """The pooled path used by WikiProcessor"""
+    response = wiki_processor.session.post(wiki_processor.api_url, data=PARSE_PARAMS, timeout=30)
+    response.raise_for_status()
+
+def measure(label, call, workers):
+    """Run REQUESTS_PER_RUN calls on a pool of workers and report requests/sec"""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for _ in executor.map(lambda _: call(), range(REQUESTS_PER_RUN)):
+            pass
+    elapsed = time.perf_counter() - start
+    rate = REQUESTS_PER_RUN / elapsed
+    print(f"  {label:<28} {rate:8.0f} requests/sec")
+    return rate
+
+def run_benchmark():
+    with tempfile.TemporaryDirectory() as cache_dir, StubWikiServer() as server:
+        for workers in (1, 4):
+            print(f"Workers: {workers}")
+            before = measure('requests.post (no session)', lambda: post_without_session(server.api_url), workers)
+
+            template_manager = TemplateManager(cache_dir, api_url=server.api_url)
+            wiki_processor = WikiProcessor(server.api_url, template_manager, pool_size=workers)
+            try:
+                after = measure('pooled WikiProcessor session',
+                                lambda: post_with_session(wiki_processor), workers)
+            finally:
+                wiki_processor.close()
+                template_manager.close()
+
+            print(f"  Speedup: {after / before:.2f}x")
+            print()
+
+if __name__ == "__main__":
+    run_benchmark()
\ No newline at end of file
@@ -0,0 +1,59 @@
+﻿#!/usr/bin/env python3
+import random
+import sys
+import time
+from pathlib import Path
+
+# Add parent directory to path for imports (src modules import each other by name)
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent / 'src'))
+
+from src.local_renderer import render_definition_text
+from tests.regex_baseline import render_definition_text as render_definition_text_regex
+
+SAMPLE_SIZE = 100000
+
+# Definition shapes seen in the dump; {w} is filled with a random word
+DEFINITION_SHAPES = [
+    "{{{{lb|en|transitive}}}} To [[{w}]] (someone) from one place to another.",
+    "{{{{lb|en|computer science|_|informal}}}} A [[finite]] [[{w}|{w}s]] that is [[not]] a [[command]]. {{{{defdate|from 20th c.}}}}",
+    "{{{{plural of|en|{w}}}}}",
+    "{{{{alternative form of|en|{w}|t=a {w}}}}}",
+    "{{{{q|informal}}}} A ''[[{w}]]''; a '''[[thing]]''' of the {{{{l|en|{w}}}}} kind.",
+    "{{{{lb|en|obsolete}}}} {{{{non-gloss definition|Used to express {{{{m|en|{w}}}}}.}}}}",
+    "A [[{w}]] of the genus {{{{taxfmt|Felis|genus}}}}, see {{{{w|{w} (animal)|{w}}}}}.&lt;ref&gt;{{{{cite-book|title={w}}}}}&lt;/ref&gt;",
+    "{{{{inflection of|en|{w}||3|s|pres|ind}}}}",
+    "{{{{given name|en|female|from=Latin}}}} {{{{rfv-sense|en}}}}",
+    "{{{{senseid|en|{w}}}}}Someone who [[{w}#Verb|{w}s]], especially &quot;{w}&quot; [https://example.org/{w} online].",
+]
+WORDS = ['cat', 'dog', 'string', 'walk', 'tree', 'run', 'house', 'light', 'stone', 'river']
+
+def generate_sample(size=SAMPLE_SIZE, seed=0):
+    """Build a reproducible sample of definition lines in the dump's shapes"""
+    rng = random.Random(seed)
+    return [rng.choice(DEFINITION_SHAPES).format(w=rng.choice(WORDS)) for _ in range(size)]
+
+def measure(label, render, sample):
+    start = time.perf_counter()
+    results = [render(line) for line in sample]
+    elapsed = time.perf_counter() - start
+    per_definition_us = elapsed / len(sample) * 1e6
+    print(f"  {label:<22} {elapsed:7.2f}s {per_definition_us:8.1f} us/definition")
+    return results, elapsed
+
+def run_benchmark():
+    sample = generate_sample()
+    print(f"Sample: {len(sample)} generated definition lines")
+    regex_results, regex_elapsed = measure('regex pipeline', render_definition_text_regex, sample)
+    tree_results, tree_elapsed = measure('tokenizer + tree walk', render_definition_text, sample)
+    print(f"  speedup: {regex_elapsed / tree_elapsed:.1f}x")
+    
+    differences = {(line, old, new) for line, old, new in zip(sample, regex_results, tree_results) if old != new}
+    print(f"  {len(differences)} distinct lines render differently")
+    for line, old, new in sorted(differences)[:10]:
+        print(f"    {line}")
+        print(f"      regex: {old}")
+        print(f"      tree:  {new}")
+
+if __name__ == "__main__":
+    run_benchmark()
\ No newline at end of file
@@ -0,0 +1,92 @@
+﻿#!/usr/bin/env python3
+import bz2
+import random
+from xml.sax.saxutils import escape
+
+WORDS = ['cat', 'dog', 'string', 'walk', 'tree', 'run', 'house', 'light', 'stone', 'river']
+
+# Page texts in the shapes of the dump: English entries with definitions,
+# entries in other languages only, and pages outside the main namespace
+ENGLISH_TEXT = """==English==
+
+===Noun===
+{{{{en-noun}}}}
+
+# {{{{lb|en|informal}}}} A [[{word}]] of some kind.
+# {{{{plural of|en|{word}}}}}
+## A sub-sense of [[{word}]].
+# Related terms:
+
+===Verb===
+{{{{en-verb}}}}
+
+# To [[{word}]].
+"""
+FOREIGN_TEXT = """==French==
+
+===Noun===
+{{{{fr-noun|m}}}}
+
+# [[{word}]]
+"""
+
+def page_xml(title, ns, page_id, revid, text):
+    """One <page> element as it appears in pages-articles.xml"""
+    return (
+        "  <page>\n"
+        f"    <title>{escape(title)}</title>\n"
+        f"    <ns>{ns}</ns>\n"
+        f"    <id>{page_id}</id>\n"
+        "    <revision>\n"
+        f"      <id>{revid}</id>\n"
+        "      <model>wikitext</model>\n"
+        "      <format>text/x-wiki</format>\n"
+        f"      <text bytes=\"{len(text.encode('utf-8'))}\" xml:space=\"preserve\">{escape(text)}</text>\n"
+        "    </revision>\n"
+        "  </page>\n"
+    )
+
+def generate_pages(page_count, seed=0):
+    """Yield (title, ns, page_id, revid, text) for a reproducible mix of pages"""
+    rng = random.Random(seed)
+    for page_id in range(1, page_count + 1):
+        word = f"{rng.choice(WORDS)}{page_id}"
+        kind = rng.random()
+        if kind < 0.4:
+            yield word, 0, page_id, page_id * 10, ENGLISH_TEXT.format(word=word)
+        elif kind < 0.8:
+            yield word, 0, page_id, page_id * 10, FOREIGN_TEXT.format(word=word)
+        else:
+            yield f"Template:{word}", 10, page_id, page_id * 10, "{{{1}}}"
+
+def dump_header():
+    return ('<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.11/" version="0.11" xml:lang="en">\n'
+            '  <siteinfo>\n    <sitename>Wiktionary</sitename>\n  </siteinfo>\n')
+
+def dump_footer():
+    return '</mediawiki>\n'
+
+def write_dump(path, page_count, seed=0):
+    """Write a pages-articles style XML dump of page_count generated pages"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(dump_header())
+        for page in generate_pages(page_count, seed):
+            f.write(page_xml(*page))
+        f.write(dump_footer())
+
+def write_multistream_dump(path, index_path, page_count, seed=0, pages_per_stream=100):
+    """Write a dump the way pages-articles-multistream.xml.bz2 is built: the
+    header, every pages_per_stream pages and the footer are separate bz2
+    streams, and the bz2 index lists "offset:page_id:title" for each page"""
+    index_lines = []
+    with open(path, 'wb') as f:
+        f.write(bz2.compress(dump_header().encode('utf-8')))
+        pages = list(generate_pages(page_count, seed))
+        for start in range(0, len(pages), pages_per_stream):
+            offset = f.tell()
+            stream_pages = pages[start:start + pages_per_stream]
+            f.write(bz2.compress(''.join(page_xml(*page) for page in stream_pages).encode('utf-8')))
+            index_lines.extend(f"{offset}:{page[2]}:{page[0]}\n" for page in stream_pages)
+        f.write(bz2.compress(dump_footer().encode('utf-8')))
+    with bz2.open(index_path, 'wt', encoding='utf-8') as index:
+        index.writelines(index_lines)
\ No newline at end of file
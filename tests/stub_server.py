@@ -0,0 +1,165 @@
+﻿#!/usr/bin/env python3
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+class StubWikiHandler(BaseHTTPRequestHandler):
+    """Answers api.php requests the way the local MediaWiki does"""
+    # Keep-alive needs HTTP/1.1 and an explicit Content-Length
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out as separate writes; without this, Nagle's
+    # algorithm stalls every keep-alive response on a delayed ACK
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self._handle(parse_qs(urlparse(self.path).query))
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length).decode('utf-8')
+        self._handle(parse_qs(body))
+
+    def _handle(self, params):
+        params = {key: values[0] for key, values in params.items()}
+        if params.get('action') == 'parse':
+            result = self.server.handle_parse(params)
+        elif params.get('action') == 'query':
+            result = self.server.handle_query(params)
+        elif params.get('action') == 'edit':
+            result = self.server.handle_edit(params)
+        else:
+            result = {'error': {'code': 'badvalue', 'info': 'Unsupported action'}}
+
+        content = json.dumps(result).encode('utf-8')
+        if self.server.bom:
+            # The local MediaWiki prefixes its responses with a UTF-8 BOM
+            content = b'\xef\xbb\xbf' + content
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubWikiServer(ThreadingHTTPServer):
+    """A local stand-in for the MediaWiki API, run on a background thread"""
+    daemon_threads = True
+
+    def __init__(self, bom=True, source_pages=None, redirects=None, query_delay=0.0, content_limit=None,
+                 render=None):
+        super().__init__(('127.0.0.1', 0), StubWikiHandler)
+        self.bom = bom
+        self.thread = None
+        # Pages saved through action=edit, by title
+        self.pages = {}
+        # Fixture pages served to action=query&prop=revisions, by title
+        self.source_pages = source_pages or {}
+        self.redirects = redirects or {}
+        # Current revision id of each fixture page (1 unless set)
+        self.revids = {}
+        self.content_limit = content_limit
+        # render(text) -> (html, templates) replaces the default echo of
+        # action=parse; templates None leaves them out of the response
+        self.render = render
+        self.query_delay = query_delay
+        self.parse_count = 0
+        self.query_counts = Counter()
+        self.queried_titles = []
+        self.query_batches = []
+        self.active_queries = 0
+        self.max_active_queries = 0
+        self.stats_lock = threading.Lock()
+
+    @property
+    def api_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/api.php"
+
+    def handle_parse(self, params):
+        with self.stats_lock:
+            self.parse_count += 1
+        text = params.get('text', '')
+        templates = []
+        if self.render is not None:
+            text, templates = self.render(text)
+        html = f'<div class="mw-parser-output"><p>{text}</p></div>'
+        if params.get('formatversion') == '2':
+            parse = {'title': 'API', 'pageid': 0, 'text': html}
+        else:
+            parse = {'title': 'API', 'pageid': 0, 'text': {'*': html}}
+        if 'templates' in params.get('prop', '').split('|') and templates is not None:
+            parse['templates'] = templates
+        return {'parse': parse}
+
+    def handle_query(self, params):
+        titles = params.get('titles', '').split('|')
+        with self.stats_lock:
+            self.query_counts.update(titles)
+            self.queried_titles.extend(titles)
+            self.query_batches.append(titles)
+            self.active_queries += 1
+            self.max_active_queries = max(self.max_active_queries, self.active_queries)
+        try:
+            time.sleep(self.query_delay)
+            query = {'normalized': [], 'redirects': [], 'pages': []}
+            resolved = []
+            for title in titles:
+                target = title.replace('_', ' ')
+                if target != title:
+                    query['normalized'].append({'from': title, 'to': target})
+                if target in self.redirects:
+                    query['redirects'].append({'from': target, 'to': self.redirects[target]})
+                    target = self.redirects[target]
+                if target not in resolved:
+                    resolved.append(target)
+
+            # Like the real API, serve at most content_limit pages of content
+            # per response and ask for the rest through rvcontinue
+            start = int(params.get('rvcontinue', 0))
+            end = len(resolved) if self.content_limit is None else start + self.content_limit
+            for index, title in enumerate(resolved):
+                page = {'ns': 10, 'title': title}
+                if title not in self.source_pages:
+                    page['missing'] = True
+                else:
+                    page['pageid'] = index + 1
+                    revision = {'revid': self.revids.get(title, 1), 'timestamp': '2024-01-01T00:00:00Z'}
+                    if 'content' not in params.get('rvprop', '').split('|'):
+                        page['revisions'] = [revision]
+                    elif start <= index < end:
+                        revision['slots'] = {'main': {'content': self.source_pages[title]}}
+                        page['revisions'] = [revision]
+                query['pages'].append(page)
+
+            result = {'query': {key: value for key, value in query.items() if value}}
+            if end < len(resolved):
+                result['continue'] = {'rvcontinue': str(end), 'continue': '||'}
+            return result
+        finally:
+            with self.stats_lock:
+                self.active_queries -= 1
+
+    def handle_edit(self, params):
+        if params.get('token') != '+\\':
+            return {'error': {'code': 'badtoken', 'info': 'Invalid CSRF token.'}}
+        title = params['title']
+        if self.pages.get(title) == params.get('text', ''):
+            return {'edit': {'result': 'Success', 'title': title, 'nochange': True}}
+        self.pages[title] = params.get('text', '')
+        return {'edit': {'result': 'Success', 'title': title}}
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+        self.server_close()
+        return False
\ No newline at end of file
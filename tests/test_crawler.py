@@ -0,0 +1,319 @@
+﻿#!/usr/bin/env python3
+import os
+import sys
+import json
+import sqlite3
+import tempfile
+import threading
+import xml.etree.ElementTree as ET
+import time
+from pathlib import Path
+
+# Add parent directory to path for imports (src modules import each other by name)
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent / 'src'))
+
+from src.template_manager import TemplateManager
+from src.rate_limiter import TokenBucket
+from src.crawl_manifest import CrawlManifest
+from tests.stub_server import StubWikiServer
+
+def chain_pages(depth):
+    """A module chain deeper than the default recursion limit"""
+    pages = {'Template:deep': '{{#invoke:chain0|main}}'}
+    for level in range(depth):
+        pages[f'Module:chain{level}'] = f'local next = require("Module:chain{level + 1}")'
+    pages[f'Module:chain{depth}'] = 'return {}'
+    return pages
+
+def fixture_pages():
+    return {
+        'Template:lb': '{{#invoke:labels/templates|show}} {{lb-top}}',
+        'Template:lb-top': '{{#invoke:labels/templates|top}}',
+        'Module:labels/templates': 'local labels = require("Module:labels")\nlocal data = mw.loadData("Module:labels/data")',
+        'Module:labels': 'local utilities = require("Module:utilities")',
+        'Module:labels/data': 'return {}',
+        'Module:utilities': 'local gone = require("Module:missing")',
+    }
+
+def test_crawl_resolves_closure_breadth_first():
+    with tempfile.TemporaryDirectory() as cache_dir, StubWikiServer(bom=False, source_pages=fixture_pages()) as server:
+        template_manager = TemplateManager(cache_dir, api_url=server.api_url, workers=1, requests_per_second=0)
+        try:
+            assert template_manager.crawl([('Template', 'lb')]) == 6
+            assert template_manager.failed_items == {'Module:missing'}
+            assert template_manager.load_item('Module', 'labels/data') == 'return {}'
+        finally:
+            template_manager.close()
+        
+        # Each title is requested once, level by level
+        assert set(server.query_counts.values()) == {1}
+        order = server.queried_titles
+        assert order.index('Template:lb-top') < order.index('Module:labels')
+        assert order.index('Module:labels/templates') < order.index('Module:utilities')
+
+def test_crawl_deep_graph():
+    depth = sys.getrecursionlimit() + 100
+    with tempfile.TemporaryDirectory() as cache_dir, StubWikiServer(bom=False, source_pages=chain_pages(depth)) as server:
+        template_manager = TemplateManager(cache_dir, api_url=server.api_url, workers=4, requests_per_second=0)
+        try:
+            assert template_manager.crawl([('Template', 'deep')]) == depth + 2
+        finally:
+            template_manager.close()
+        assert not template_manager.failed_items
+
+def test_concurrent_fetchers_and_dedupe():
+    pages = {f'Template:t{index}': '{{#invoke:shared|main}}' for index in range(200)}
+    pages['Module:shared'] = 'return {}'
+    with tempfile.TemporaryDirectory() as cache_dir, StubWikiServer(bom=False, source_pages=pages, query_delay=0.05) as server:
+        template_manager = TemplateManager(cache_dir, api_url=server.api_url, workers=4, requests_per_second=0)
+        try:
+            assert template_manager.crawl([('Template', f't{index}') for index in range(200)]) == 201
+        finally:
+            template_manager.close()
+        assert server.max_active_queries == 4
+        assert server.query_counts['Module:shared'] == 1
+
+def test_concurrent_crawls_share_the_closure():
+    closure = [('Template', 'lb'), ('Template', 'lb-top'), ('Module', 'labels/templates'), ('Module', 'labels'),
+               ('Module', 'labels/data'), ('Module', 'utilities')]
+    with tempfile.TemporaryDirectory() as cache_dir, \
+            StubWikiServer(bom=False, source_pages=fixture_pages(), query_delay=0.1) as server:
+        template_manager = TemplateManager(cache_dir, api_url=server.api_url, workers=4, requests_per_second=0)
+        fetched = {}
+        complete = {}
+        def crawl(name):
+            fetched[name] = template_manager.crawl([('Template', 'lb')])
+            # What the crawl leaves in the cache the moment it returns
+            complete[name] = all(template_manager.load_item(*item) is not None for item in closure)
+        try:
+            first = threading.Thread(target=crawl, args=('first',))
+            first.start()
+            while 'Template:lb' not in template_manager.in_flight:
+                time.sleep(0.001)
+            # The second crawl finds the root in flight and waits on it
+            second = threading.Thread(target=crawl, args=('second',))
+            second.start()
+            first.join()
+            second.join()
+        finally:
+            template_manager.close()
+        assert complete == {'first': True, 'second': True}
+        assert fetched['first'] + fetched['second'] == 6
+        assert set(server.query_counts.values()) == {1}
+
+def test_batched_titles():
+    pages = {f'Template:t{index}': '{{#invoke:m' + str(index % 10) + '|main}}' for index in range(446)}
+    pages.update({f'Module:m{index}': 'return {}' for index in range(10)})
+    with tempfile.TemporaryDirectory() as cache_dir, StubWikiServer(bom=False, source_pages=pages) as server:
+        template_manager = TemplateManager(cache_dir, api_url=server.api_url, workers=4, requests_per_second=0)
+        try:
+            assert template_manager.crawl([('Template', f't{index}') for index in range(446)]) == 456
+        finally:
+            template_manager.close()
+        # 9 requests for the templates, then one for the modules they invoke
+        assert sum(server.query_counts.values()) == 456
+        assert len(server.queried_titles) == 456
+        assert max(len(batch) for batch in server.query_batches) == 50
+        assert len(server.query_batches) == 10
+
+def test_normalized_redirects_and_continue():
+    pages = {
+        'Template:label': '{{#invoke:labels|show}}',
+        'Template:context': 'context',
+        'Module:labels': 'return {}',
+    }
+    redirects = {'Template:lb': 'Template:label', 'Template:lbl': 'Template:label'}
+    with tempfile.TemporaryDirectory() as cache_dir, \
+            StubWikiServer(bom=False, source_pages=pages, redirects=redirects, content_limit=1) as server:
+        template_manager = TemplateManager(cache_dir, api_url=server.api_url, workers=1, requests_per_second=0)
+        try:
+            items = [('Template', 'lb'), ('Template', 'lbl'), ('Template', 'context_label'),
+                     ('Template', 'context'), ('Template', 'gone')]
+            assert template_manager.crawl(items) == 4
+            # Redirected and normalized names are saved under the name that was asked for
+            assert template_manager.load_item('Template', 'lb') == '{{#invoke:labels|show}}'
+            assert template_manager.load_item('Template', 'lbl') == '{{#invoke:labels|show}}'
+            assert template_manager.load_item('Template', 'context') == 'context'
+            assert template_manager.failed_items == {'Template:context_label', 'Template:gone'}
+            assert template_manager.load_item('Module', 'labels') == 'return {}'
+        finally:
+            template_manager.close()
+        # The four resolved titles come back one per continued response,
+        # followed by one request for the module
+        assert len(server.query_batches) == 5
+        assert server.query_batches[0] == server.query_batches[3]
+
+def test_manifest_persists_across_runs():
+    with tempfile.TemporaryDirectory() as cache_dir, StubWikiServer(bom=False, source_pages=fixture_pages()) as server:
+        template_manager = TemplateManager(cache_dir, api_url=server.api_url, requests_per_second=0)
+        try:
+            assert template_manager.crawl([('Template', 'lb')]) == 6
+        finally:
+            template_manager.close()
+        requests_made = len(server.query_batches)
+        
+        # Nothing is fetched again, known-missing pages included
+        template_manager = TemplateManager(cache_dir, api_url=server.api_url, requests_per_second=0)
+        try:
+            assert template_manager.failed_items == {'Module:missing'}
+            assert template_manager.crawl([('Template', 'lb')]) == 0
+            assert len(server.query_batches) == requests_made
+            
+            # Simulate a crawl interrupted before Module:utilities was fetched,
+            # and an expired negative-cache entry
+            with template_manager.manifest.conn as conn:
+                conn.execute("DELETE FROM manifest WHERE item_name = 'utilities'")
+                conn.execute("UPDATE manifest SET retry_after = 0 WHERE item_name = 'missing'")
+        finally:
+            template_manager.close()
+            
+        template_manager = TemplateManager(cache_dir, api_url=server.api_url, requests_per_second=0)
+        try:
+            assert template_manager.crawl([('Template', 'lb')]) == 1
+            assert server.queried_titles[-2:] == ['Module:utilities', 'Module:missing']
+            template_manager.generate_summary_report()
+        finally:
+            template_manager.close()
+        with open(Path(cache_dir) / 'download_report.json', encoding='utf-8') as f:
+            report = json.load(f)
+        assert report['total_downloaded'] == 6
+        assert report['missing_items'] == ['Module:missing']
+
+def test_store_failure_is_recorded_as_error():
+    with tempfile.TemporaryDirectory() as cache_dir, StubWikiServer(bom=False, source_pages=fixture_pages()) as server:
+        template_manager = TemplateManager(cache_dir, api_url=server.api_url, requests_per_second=0)
+        put_many = template_manager.store.put_many
+        def failing_put_many(pages):
+            raise sqlite3.OperationalError('disk I/O error')
+        template_manager.store.put_many = failing_put_many
+        try:
+            assert template_manager.crawl([('Module', 'labels/data')]) == 0
+            assert [(item['item_name'], item['status']) for item in template_manager.manifest.items()] == \
+                [('labels/data', 'error')]
+            assert template_manager.failed_items == {'Module:labels/data'}
+            assert template_manager.uninstalled_items() == []
+            
+            # Once the store works again, the expired error is fetched again
+            template_manager.store.put_many = put_many
+            with template_manager.manifest.conn as conn:
+                conn.execute("UPDATE manifest SET retry_after = 0")
+        finally:
+            template_manager.close()
+            
+        template_manager = TemplateManager(cache_dir, api_url=server.api_url, requests_per_second=0)
+        try:
+            assert template_manager.crawl([('Module', 'labels/data')]) == 1
+            assert template_manager.load_item('Module', 'labels/data') == 'return {}'
+            assert template_manager.uninstalled_items() == [('Module', 'labels/data')]
+        finally:
+            template_manager.close()
+
+def test_refresh_refetches_changed_revisions():
+    with tempfile.TemporaryDirectory() as cache_dir, StubWikiServer(bom=False, source_pages=fixture_pages()) as server:
+        template_manager = TemplateManager(cache_dir, api_url=server.api_url, requests_per_second=0)
+        try:
+            template_manager.crawl([('Template', 'lb')])
+            
+            # Nothing changed: one cheap revision query for all six pages
+            requests_made = len(server.query_batches)
+            assert template_manager.refresh() == set()
+            assert len(server.query_batches) == requests_made + 1
+            
+            # Module:labels gains a dependency; Template:lb-top is re-saved unchanged
+            server.source_pages['Module:labels'] = 'local utilities = require("Module:utilities")\nrequire("Module:new")'
+            server.source_pages['Module:new'] = 'return {}'
+            server.revids['Module:labels'] = 2
+            server.revids['Template:lb-top'] = 2
+            assert template_manager.refresh() == {'Module:labels'}
+            assert template_manager.load_item('Module', 'new') == 'return {}'
+            revids = {(item['item_type'], item['item_name']): item['revid'] for item in template_manager.manifest.items()}
+            assert revids[('Module', 'labels')] == 2
+            assert server.queried_titles[-3:] == ['Module:labels', 'Template:lb-top', 'Module:new']
+        finally:
+            template_manager.close()
+
+def test_page_store_export_and_migration():
+    with tempfile.TemporaryDirectory() as cache_dir:
+        # An old-style cache: one sanitized .txt file per page
+        os.makedirs(os.path.join(cache_dir, 'Template'))
+        os.makedirs(os.path.join(cache_dir, 'Module'))
+        old_files = {
+            ('Template', 'lb.txt'): '{{#invoke:labels/templates|show}}',
+            ('Module', 'labels_templates.txt'): 'return {}',
+            ('Module', 'unknown_name.txt'): 'return {}',
+        }
+        for (item_type, file_name), content in old_files.items():
+            with open(os.path.join(cache_dir, item_type, file_name), 'w', encoding='utf-8') as f:
+                f.write(content)
+        manifest = CrawlManifest(os.path.join(cache_dir, 'manifest.db'))
+        manifest.record([('Module', 'labels/templates', 1, None, 'x')], [])
+        manifest.close()
+        
+        template_manager = TemplateManager(cache_dir, requests_per_second=0)
+        try:
+            # The manifest supplies the real name of sanitized files
+            assert template_manager.store.count() == 2
+            assert template_manager.load_item('Module', 'labels/templates') == 'return {}'
+            assert template_manager.load_item('Template', 'lb') == '{{#invoke:labels/templates|show}}'
+            
+            assert template_manager.store.put_many([('Template', 'lb', '{{#invoke:labels/templates|show}}'),
+                                                    ('Template', 'x', 'a < b & c')]) == []
+            assert template_manager.store.put_many([('Template', 'x', 'changed')]) == [('Template', 'x')]
+            
+            export_path = os.path.join(cache_dir, 'export.xml')
+            assert len(template_manager.store.export_xml(export_path)) == 3
+            tree = ET.parse(export_path)
+        finally:
+            template_manager.close()
+            
+        namespace = {'mw': 'http://www.mediawiki.org/xml/export-0.11/'}
+        pages = {
+            page.findtext('mw:title', namespaces=namespace): (
+                page.findtext('mw:revision/mw:model', namespaces=namespace),
+                page.findtext('mw:revision/mw:text', namespaces=namespace)
+            )
+            for page in tree.getroot().findall('mw:page', namespace)
+        }
+        assert pages == {
+            'Module:labels/templates': ('Scribunto', 'return {}'),
+            'Template:lb': ('wikitext', '{{#invoke:labels/templates|show}}'),
+            'Template:x': ('wikitext', 'changed'),
+        }
+
+def test_rate_limit():
+    pages = {f'Template:t{index}': '' for index in range(30)}
+    with tempfile.TemporaryDirectory() as cache_dir, StubWikiServer(bom=False, source_pages=pages) as server:
+        template_manager = TemplateManager(cache_dir, api_url=server.api_url, workers=4, requests_per_second=2)
+        template_manager.rate_limiter.capacity = template_manager.rate_limiter.tokens = 1
+        try:
+            started = time.monotonic()
+            items = [('Template', f't{index}') for index in range(30)]
+            for index in range(0, 30, 10):
+                template_manager.crawl(items[index:index + 10])
+            elapsed = time.monotonic() - started
+        finally:
+            template_manager.close()
+        # One request straight away, then the other two at 2 per second
+        assert len(server.query_batches) == 3
+        assert elapsed >= 0.95
+        
+    bucket = TokenBucket(0)
+    started = time.monotonic()
+    for _ in range(100):
+        bucket.acquire()
+    assert time.monotonic() - started < 0.1
+
+if __name__ == "__main__":
+    test_crawl_resolves_closure_breadth_first()
+    test_crawl_deep_graph()
+    test_concurrent_fetchers_and_dedupe()
+    test_concurrent_crawls_share_the_closure()
+    test_batched_titles()
+    test_normalized_redirects_and_continue()
+    test_manifest_persists_across_runs()
+    test_store_failure_is_recorded_as_error()
+    test_refresh_refetches_changed_revisions()
+    test_page_store_export_and_migration()
+    test_rate_limit()
+    print('All crawler tests passed')
\ No newline at end of file
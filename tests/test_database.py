@@ -0,0 +1,120 @@
+﻿#!/usr/bin/env python3
+import sys
+import sqlite3
+import tempfile
+from pathlib import Path
+
+# Add parent directory to path for imports (src modules import each other by name)
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent / 'src'))
+
+from src.database import PENDING_CONDITION, Database
+
+def make_database(directory, count):
+    """A definitions table with ids 1..count, every third id missing"""
+    db_path = str(Path(directory) / 'test.db')
+    conn = sqlite3.connect(db_path)
+    conn.execute('''
+        CREATE TABLE definitions (
+            id INTEGER PRIMARY KEY,
+            word_id INTEGER,
+            raw_definition_text TEXT,
+            processed_definition_text TEXT
+        )
+    ''')
+    conn.executemany(
+        "INSERT INTO definitions (id, word_id, raw_definition_text) VALUES (?, ?, ?)",
+        [(index, index // 2, f"raw {index}") for index in range(1, count + 1) if index % 3]
+    )
+    conn.commit()
+    conn.close()
+    return Database(db_path)
+
+def processed(db):
+    conn = sqlite3.connect(db.db_path)
+    try:
+        return dict(conn.execute(
+            "SELECT id, processed_definition_text FROM definitions WHERE processed_definition_text IS NOT NULL"
+        ))
+    finally:
+        conn.close()
+
+def test_writer_flushes_on_exit():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db = make_database(temp_dir, 10)
+        with db.writer(batch_size=100, flush_interval=3600) as writer:
+            writer.write(1, 'one')
+            writer.write(2, 'two')
+            assert processed(db) == {}
+        assert processed(db) == {1: 'one', 2: 'two'}
+        assert writer.written_count == 2
+        
+        # Rows written before an exception are kept, and the exception propagates
+        try:
+            with db.writer(batch_size=100, flush_interval=3600) as writer:
+                writer.write(4, 'four')
+                raise KeyboardInterrupt
+        except KeyboardInterrupt:
+            pass
+        else:
+            assert False, 'KeyboardInterrupt was swallowed'
+        assert processed(db) == {1: 'one', 2: 'two', 4: 'four'}
+
+def test_writer_batch_size():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db = make_database(temp_dir, 10)
+        with db.writer(batch_size=2, flush_interval=3600) as writer:
+            writer.write(1, 'one')
+            assert processed(db) == {}
+            writer.write(2, 'two')
+            assert processed(db) == {1: 'one', 2: 'two'}
+            assert writer.buffer == []
+            writer.write(4, 'four')
+            assert 4 not in processed(db)
+        assert writer.written_count == 3
+
+def test_iter_definitions_pages_by_id():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db = make_database(temp_dir, 30)
+        ids = [index for index in range(1, 31) if index % 3]
+        assert [row[0] for row in db.iter_definitions(batch_size=4)] == ids
+        assert list(db.iter_definitions(batch_size=4))[0] == (1, 0, 'raw 1')
+        
+        # A limit that is not a multiple of the page size stops mid-page
+        assert [row[0] for row in db.iter_definitions(batch_size=4, limit=10)] == ids[:10]
+        assert [row[0] for row in db.iter_definitions(batch_size=50, limit=3)] == ids[:3]
+        assert list(db.iter_definitions(limit=0)) == []
+
+def test_pending_definitions():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db = make_database(temp_dir, 10)
+        with db.writer() as writer:
+            writer.write(1, 'done')
+            writer.write(2, 'ERROR: API request failed')
+            writer.write(4, 'PROCESSING ERROR - USING RAW: raw 4')
+            writer.write(5, 'Mentions ERROR: in the middle')
+        # Unprocessed (7, 8, 10) and error rows (2, 4), in id order across pages
+        pending = [row[0] for row in db.iter_definitions(batch_size=2, pending_only=True)]
+        assert pending == [2, 4, 7, 8, 10]
+        assert [row[0] for row in db.iter_definitions(batch_size=2, limit=3, pending_only=True)] == [2, 4, 7]
+        assert db.get_pending_definitions_count() == 5
+        assert db.get_total_definitions_count() == 7
+        
+        db.ensure_pending_index()
+        db.ensure_pending_index()
+        conn = sqlite3.connect(db.db_path)
+        try:
+            plan = conn.execute(
+                f"EXPLAIN QUERY PLAN SELECT id FROM definitions WHERE id > ? AND {PENDING_CONDITION} ORDER BY id",
+                (0,)
+            ).fetchall()
+        finally:
+            conn.close()
+        assert any('idx_definitions_pending' in row[-1] for row in plan)
+
+if __name__ == "__main__":
+    test_writer_flushes_on_exit()
+    test_writer_batch_size()
+    test_iter_definitions_pages_by_id()
+    test_pending_definitions()
+    print('All database tests passed')
\ No newline at end of file
@@ -0,0 +1,212 @@
+﻿#!/usr/bin/env python3
+import bz2
+import shutil
+import sys
+import sqlite3
+import tempfile
+from pathlib import Path
+
+# Add parent directory to path for imports (data scripts import each other by name)
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent / 'data'))
+
+import parse_full_wiktionary as raw_parser
+import parse_full_wiktionary1 as clean_parser
+from dump_ingest import ingest_dump
+from dump_source import iter_dump_pages, is_candidate_page, mapped_chunks, read_pages
+from extract_templates import process_wiktionary_dump
+from page_index import PageIndex, page_index_path
+from dump_source import MappedChunk
+from tests.dump_fixture import (ENGLISH_TEXT, dump_footer, dump_header, generate_pages, page_xml,
+                                write_dump, write_multistream_dump)
+
+def ingest(parser, extract, column, dump_path, db_path, workers, bulk=True, titles=None):
+    parser.output_db = str(db_path)
+    parser.log_file = str(db_path) + '.log'
+    conn = parser.create_database()
+    try:
+        ingest_dump(str(dump_path), conn, extract, column, parser.log_message,
+                    workers=workers, pages_per_chunk=7, bulk=bulk, titles=titles)
+        words = conn.execute("SELECT id, word, total_senses FROM words ORDER BY id").fetchall()
+        definitions = conn.execute(
+            f"SELECT word_id, part_of_speech, {column}, sense_number FROM definitions ORDER BY id").fetchall()
+    finally:
+        conn.close()
+    return words, definitions
+
+def test_read_pages():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        dump_path = Path(temp_dir) / 'dump.xml'
+        write_dump(dump_path, 25)
+        pages = list(read_pages(str(dump_path)))
+        assert len(pages) == 25
+        assert all(page.lstrip().startswith('<page>') and page.rstrip().endswith('</page>') for page in pages)
+
+def test_parallel_matches_single_process():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        dump_path = Path(temp_dir) / 'dump.xml'
+        write_dump(dump_path, 200)
+        
+        single = ingest(raw_parser, raw_parser.extract_definitions, 'raw_definition_text',
+                        dump_path, Path(temp_dir) / 'single.db', workers=1)
+        parallel = ingest(raw_parser, raw_parser.extract_definitions, 'raw_definition_text',
+                          dump_path, Path(temp_dir) / 'parallel.db', workers=3)
+        assert single == parallel
+        words, definitions = single
+        assert words and all(total_senses == 4 for _, _, total_senses in words)
+        assert definitions[0][1:] == ('Noun', '{{lb|en|informal}} A [[' + words[0][1] + ']] of some kind.', 1)
+        
+        # Local-clean mode renders the same pages
+        words, definitions = ingest(clean_parser, clean_parser.extract_and_clean_definitions, 'definition_text',
+                                    dump_path, Path(temp_dir) / 'clean.db', workers=2)
+        assert len(words) == len(single[0])
+        assert definitions[0][1:] == ('Noun', f'(informal) A {words[0][1]} of some kind.', 1)
+
+def test_bulk_load_matches_incremental():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        dump_path = Path(temp_dir) / 'dump.xml'
+        write_dump(dump_path, 150)
+        # Repeated titles keep their first word row in both modes (the
+        # page reader does not care that the copies follow </mediawiki>)
+        repeated_pages = list(read_pages(str(dump_path)))[:20]
+        with open(dump_path, 'a', encoding='utf-8') as f:
+            f.write(''.join(repeated_pages))
+        
+        incremental = ingest(raw_parser, raw_parser.extract_definitions, 'raw_definition_text',
+                             dump_path, Path(temp_dir) / 'incremental.db', workers=1, bulk=False)
+        bulk = ingest(raw_parser, raw_parser.extract_definitions, 'raw_definition_text',
+                      dump_path, Path(temp_dir) / 'bulk.db', workers=1)
+        assert bulk == incremental
+        
+        # Indexes, statistics and durability settings are back after the load
+        conn = sqlite3.connect(str(Path(temp_dir) / 'bulk.db'))
+        try:
+            indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+            assert {'idx_word', 'idx_word_sense'} <= indexes
+            assert conn.execute("SELECT COUNT(*) FROM sqlite_stat1").fetchone()[0] > 0
+            assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+        finally:
+            conn.close()
+
+def test_compressed_dumps():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_dir = Path(temp_dir)
+        xml_path = temp_dir / 'dump.xml'
+        write_dump(xml_path, 450)
+        bz2_path = temp_dir / 'dump.xml.bz2'
+        with open(xml_path, 'rb') as source, bz2.open(bz2_path, 'wb') as target:
+            shutil.copyfileobj(source, target)
+        multistream_path = temp_dir / 'dump-multistream.xml.bz2'
+        write_multistream_dump(multistream_path, temp_dir / 'dump-multistream-index.txt.bz2', 450)
+        
+        # Only English main-namespace pages come out
+        titles = [page.split('<title>')[1].split('<')[0]
+                  for page in read_pages(str(xml_path)) if is_candidate_page(page)]
+        assert 0 < len(titles) < 450
+        for path in (xml_path, bz2_path, multistream_path):
+            for workers in (1, 2):
+                pages = list(iter_dump_pages(str(path), workers=workers, pages_per_chunk=200))
+                assert [page.split('<title>')[1].split('<')[0] for page in pages] == titles
+        unordered = list(iter_dump_pages(str(multistream_path), workers=2, ordered=False, pages_per_chunk=100))
+        assert len(unordered) == len(titles)
+        
+        # The mmap scanner splits a plain dump along page boundaries and
+        # counts the pages it skipped without decoding them
+        chunks = mapped_chunks(str(xml_path), bytes_per_chunk=20000)
+        assert len(chunks) > 5
+        assert [page.split('<title>')[1].split('<')[0] for chunk in chunks for page in chunk] == titles
+        assert sum(chunk.skipped_pages for chunk in chunks) == 450 - len(titles)
+        
+        expected = ingest(raw_parser, raw_parser.extract_definitions, 'raw_definition_text',
+                          xml_path, temp_dir / 'xml.db', workers=1)
+        for name, path, workers in (('bz2', bz2_path, 2), ('multistream', multistream_path, 1),
+                                    ('multistream-parallel', multistream_path, 2)):
+            assert ingest(raw_parser, raw_parser.extract_definitions, 'raw_definition_text',
+                          path, temp_dir / f'{name}.db', workers=workers) == expected
+        
+        # Template name extraction reads .bz2 dumps too
+        process_wiktionary_dump(str(xml_path), str(temp_dir / 'names.txt'))
+        process_wiktionary_dump(str(bz2_path), str(temp_dir / 'names-bz2.txt'))
+        assert (temp_dir / 'names.txt').read_text() == (temp_dir / 'names-bz2.txt').read_text()
+
+def test_page_index():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_dir = Path(temp_dir)
+        xml_path = temp_dir / 'dump.xml'
+        write_dump(xml_path, 300)
+        expected = ingest(raw_parser, raw_parser.extract_definitions, 'raw_definition_text',
+                          xml_path, temp_dir / 'expected.db', workers=1)
+        
+        index = PageIndex(page_index_path(str(xml_path)))
+        try:
+            assert not index.is_current(str(xml_path))
+            assert index.build(str(xml_path)) == 300
+            assert index.is_current(str(xml_path))
+            rows = index.conn.execute("SELECT title, ns, page_id, revid FROM pages ORDER BY offset").fetchall()
+            assert rows == [(title, ns, page_id, revid) for title, ns, page_id, revid, _ in generate_pages(300)]
+            
+            # Pages are read back by title with a seek, in dump order
+            pages = {page.split('<title>')[1].split('<')[0]: page for page in read_pages(str(xml_path))}
+            main_titles = [title for title, ns, _, _ in rows if ns == 0]
+            titles = [main_titles[-1], main_titles[2], 'missing']
+            assert (list(index.read_pages(str(xml_path), titles))
+                    == [pages[main_titles[2]].strip(), pages[main_titles[-1]].strip()])
+            
+            # Shards from the index match the chunks of a scan of the dump
+            shards = [MappedChunk(str(xml_path), start, end) for start, end in index.shards(20000)]
+            assert len(shards) > 5
+            assert ([page for chunk in shards for page in chunk]
+                    == [page for chunk in mapped_chunks(str(xml_path), bytes_per_chunk=20000) for page in chunk])
+        finally:
+            index.close()
+        
+        # A current index is used to split the dump
+        assert ingest(raw_parser, raw_parser.extract_definitions, 'raw_definition_text',
+                      xml_path, temp_dir / 'indexed.db', workers=2) == expected
+        
+        # Re-extracting a few words replaces only them
+        words = [word for _, word, _ in expected[0][:3]]
+        conn = sqlite3.connect(str(temp_dir / 'indexed.db'))
+        conn.execute("UPDATE definitions SET raw_definition_text = 'stale'")
+        conn.commit()
+        conn.close()
+        reextracted = ingest(raw_parser, raw_parser.extract_definitions, 'raw_definition_text',
+                             xml_path, temp_dir / 'indexed.db', workers=2, titles=words)
+        by_word = lambda result: {word: [row[1:] for row in result[1] if row[0] == word_id]
+                                  for word_id, word, _ in result[0]}
+        current = by_word(reextracted)
+        assert current.keys() == by_word(expected).keys()
+        assert all(current[word] == by_word(expected)[word] for word in words)
+        assert all(definition == 'stale' for word in current if word not in words for _, definition, _ in current[word])
+        
+        # Changing the dump makes the index stale
+        with open(xml_path, 'a', encoding='utf-8') as f:
+            f.write('\n')
+        index = PageIndex(page_index_path(str(xml_path)))
+        try:
+            assert not index.is_current(str(xml_path))
+        finally:
+            index.close()
+        
+        # Titles with XML escapes are looked up, deleted and stored in the
+        # dump's form, whichever the --words title was given in
+        escaped_path = temp_dir / 'escaped.xml'
+        with open(escaped_path, 'w', encoding='utf-8') as f:
+            f.write(dump_header() + ''.join(page_xml(*page) for page in generate_pages(20)))
+            f.write(page_xml('R&D', 0, 1000, 10000, ENGLISH_TEXT.format(word='R&D')) + dump_footer())
+        escaped_db = temp_dir / 'escaped.db'
+        words, definitions = ingest(raw_parser, raw_parser.extract_definitions, 'raw_definition_text',
+                                    escaped_path, escaped_db, workers=1)
+        assert 'R&amp;D' in [word for _, word, _ in words]
+        reextracted = ingest(raw_parser, raw_parser.extract_definitions, 'raw_definition_text',
+                             escaped_path, escaped_db, workers=1, titles=['R&D'])
+        assert len(reextracted[0]) == len(words) and len(reextracted[1]) == len(definitions)
+        assert reextracted[0][-1][1:] == ('R&amp;D', 4)
+
+if __name__ == "__main__":
+    test_read_pages()
+    test_parallel_matches_single_process()
+    test_bulk_load_matches_incremental()
+    test_compressed_dumps()
+    test_page_index()
+    print('All dump ingestion tests passed')
\ No newline at end of file
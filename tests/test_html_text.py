@@ -0,0 +1,64 @@
+﻿#!/usr/bin/env python3
+import sys
+from pathlib import Path
+
+# Add parent directory to path for imports (src modules import each other by name)
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent / 'src'))
+
+from src.html_text import html_to_text
+from tests.bench_html_text import CORPUS_PATH, clean_html_regex
+
+def test_matches_old_output():
+    # Without entities or non-content elements, the text is what the old
+    # regex cleanup produced, apart from where whitespace falls
+    corpus = [line for line in CORPUS_PATH.read_text(encoding='utf-8').splitlines() if line.strip()]
+    compared = 0
+    for html in corpus:
+        text = html.replace('&amp;action', '')
+        if '&' in text or any(marker in text for marker in ('reference', 'mw-editsection', '<style')):
+            continue
+        assert html_to_text(html).replace(' ', '') == clean_html_regex(html).replace(' ', '')
+        compared += 1
+    assert compared > 5
+
+def test_entities():
+    html = '<p>R&amp;D &lt;tag&gt; it&#39;s&nbsp;a &quot;test&quot; &#x2014; caf&eacute;</p>'
+    assert clean_html_regex(html) == 'R&amp;D &lt;tag&gt; it&#39;s&nbsp;a &quot;test&quot; &#x2014; caf&eacute;'
+    assert html_to_text(html) == 'R&D <tag> it\'s a "test" — café'
+
+def test_dropped_elements():
+    html = ('<h3>Noun<span class="mw-editsection"><span class="mw-editsection-bracket">[</span>'
+            '<a href="/index.php?title=cat&amp;action=edit&amp;section=1">edit</a>]</span></h3>'
+            '<p>A cat.<sup id="cite_ref-1" class="reference"><a href="#cite_note-1">[1]</a></sup></p>'
+            '<div class="mw-references-wrap"><ol class="references"><li id="cite_note-1">'
+            '<span class="mw-cite-backlink"><a href="#cite_ref-1">↑</a></span> A source.</li></ol></div>'
+            '<style>.x { color: red }</style><span class="noprint">[more]</span> Tail.')
+    assert clean_html_regex(html) == ('Noun [ edit ] A cat. [1] ↑ A source. .x { color: red } [more] Tail.')
+    assert html_to_text(html) == 'Noun A cat. Tail.'
+
+def test_comments():
+    assert html_to_text('A <!-- hidden <b>text</b> -->cat<!---->.') == 'A cat.'
+    assert html_to_text('<p>one<!--\nmulti-line\n--></p><p>two</p>') == 'one two'
+
+def test_inline_and_block_spacing():
+    # Inline tags do not split words; block tags separate them
+    assert clean_html_regex('A <b>c</b>at') == 'A c at'
+    assert html_to_text('A <b>c</b>at') == 'A cat'
+    assert html_to_text('<a href="/wiki/cat">cat</a>s and <i>dog</i>s') == 'cats and dogs'
+    assert html_to_text('<ul><li>one</li><li>two</li></ul>line<br>break<br/>end') == 'one two line break end'
+    assert html_to_text('<div>a</div><div>b</div><span>c</span><span>d</span>') == 'a b cd'
+    assert html_to_text('<p>\n  spaced \t out\n</p>') == 'spaced out'
+    
+    # The tokenizer used when non-content elements may be present spaces the same way
+    for html in ('A <b>c</b>at', '<ul><li>one</li><li>two</li></ul>line<br>break',
+                 '<div>a</div><div>b</div><span>c</span><span>d</span>'):
+        assert html_to_text(html + '<!-- -->') == html_to_text(html)
+
+if __name__ == "__main__":
+    test_matches_old_output()
+    test_entities()
+    test_dropped_elements()
+    test_comments()
+    test_inline_and_block_spacing()
+    print('All HTML text tests passed')
\ No newline at end of file
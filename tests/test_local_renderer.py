@@ -0,0 +1,113 @@
+﻿#!/usr/bin/env python3
+import sys
+import tempfile
+from pathlib import Path
+
+# Add parent directory to path for imports (src modules import each other by name)
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent / 'src'))
+
+import src.local_renderer as local_renderer_module
+from src.local_renderer import LocalRenderer, parse_wiktionary_definition, render_definition_text
+from src.wikitext import Template, WikiLink, parse_wikitext
+from src.template_manager import TemplateManager
+from src.wiki_processor import WikiProcessor
+from tests.stub_server import StubWikiServer
+
+def test_parse_wikitext():
+    nodes = parse_wikitext("{{l|en|{{m|en|x}}|t=a {{q|b}}}} [[a|b|c]] tail")
+    template, space, link, tail = nodes
+    assert isinstance(template, Template) and template.name == 'l'
+    assert [key for key, _ in template.args] == [None, None, 't']
+    assert isinstance(template.args[1][1][0], Template)
+    assert isinstance(link, WikiLink) and link.target == ['a'] and link.label == ['b', '|', 'c']
+    assert tail == ' tail'
+    
+    # Stray closers and unclosed openers stay text; references drop out
+    assert parse_wikitext("a]] b}} c") == ['a', ']]', ' b', '}}', ' c']
+    assert parse_wikitext("{{q|a [[b") == ['{{', 'q', '|', 'a ', '[[', 'b']
+    assert parse_wikitext("x<ref>{{cite|y}}</ref>z<ref name=\"n\"/>") == ['x', 'z']
+
+def test_render_nesting():
+    # Nested calls render inside out in one walk
+    assert render_definition_text("{{plural of|en|{{l|en|cat}}|t=a {{m|en|feline}}}}") == 'plural of cat ("a feline")'
+    assert render_definition_text("{{lb|en|US|_|informal}} {{unknown|{{w|Foo}}}} bar") == "(US, informal) Foo bar"
+    assert render_definition_text("{{rfdef|en}}{{defdate|1900}}A [[cat]].") == "A cat."
+
+def test_render():
+    renderer = LocalRenderer()
+    assert renderer.render("{{lb|en|transitive}} To [[transport]] (someone) from one place to another.") == \
+        "(transitive) To transport (someone) from one place to another."
+    assert renderer.render("{{plural of|en|cat}}") == "plural of cat"
+    assert renderer.render("{{q|informal}} A ''[[feline|cat]]''.") == "(informal) A cat."
+    
+    # Anything outside the whitelist goes to MediaWiki
+    assert renderer.render("{{lb|en|computer science}} A [[string]]. {{defdate|from 20th c.}}") is None
+    assert renderer.render("A [[cat]].&lt;ref&gt;Source&lt;/ref&gt;") is None
+    assert renderer.render("{{n-g|Used as a [[euphemism]]}}") is None
+    
+    # The dump parser keeps adding its final period
+    assert parse_wiktionary_definition("# {{plural of|en|cat}}") == "plural of cat."
+
+def test_render_parses_once():
+    parsed = []
+    # The renderer's own copy: src modules import wikitext by name
+    module_parse_wikitext = local_renderer_module.parse_wikitext
+    def counting_parse_wikitext(text):
+        parsed.append(text)
+        return module_parse_wikitext(text)
+    local_renderer_module.parse_wikitext = counting_parse_wikitext
+    try:
+        renderer = LocalRenderer()
+        assert renderer.render("# {{q|informal}} A [[cat]].") == "(informal) A cat."
+        assert renderer.render("{{n-g|Used as a [[euphemism]]}}") is None
+        # Marked-up text that is never rendered locally is not parsed at all
+        assert renderer.render("A [[cat]].&lt;ref&gt;Source&lt;/ref&gt;") is None
+    finally:
+        local_renderer_module.parse_wikitext = module_parse_wikitext
+    assert parsed == ["{{q|informal}} A [[cat]].", "{{n-g|Used as a [[euphemism]]}}"]
+
+def test_processor_local_first():
+    definitions = ["A [[cat]].", "{{q|informal}} A cat.", "{{unknown|x}} A dog."]
+    with tempfile.TemporaryDirectory() as cache_dir, StubWikiServer() as server:
+        template_manager = TemplateManager(cache_dir, api_url=server.api_url, requests_per_second=0)
+        wiki_processor = WikiProcessor(server.api_url, template_manager, max_batch_size=4,
+                                       local_renderer=LocalRenderer())
+        try:
+            results = wiki_processor.process_batch(definitions)
+            assert results[:2] == ["A cat.", "(informal) A cat."]
+            assert server.parse_count == 1
+            assert wiki_processor.metrics.get('local_renders') == 2
+            
+            assert wiki_processor.process_definition("{{l|en|dog}}") == "dog"
+            assert server.parse_count == 1
+        finally:
+            wiki_processor.close()
+            template_manager.close()
+
+def test_parity():
+    # The stub echoes wikitext back, so only markup-free definitions match
+    with tempfile.TemporaryDirectory() as cache_dir, StubWikiServer() as server:
+        template_manager = TemplateManager(cache_dir, api_url=server.api_url, requests_per_second=0)
+        wiki_processor = WikiProcessor(server.api_url, template_manager, max_batch_size=4,
+                                       local_renderer=LocalRenderer(), parity=True)
+        try:
+            results = wiki_processor.process_batch(["A cat.", "{{q|informal}} A cat."])
+            # Parity mode keeps MediaWiki's output
+            assert results == ["A cat.", "{{q|informal}} A cat."]
+            assert server.parse_count == 1
+            assert wiki_processor.metrics.get('parity_checks') == 2
+            assert wiki_processor.metrics.get('parity_mismatches') == 1
+            assert wiki_processor.metrics.get('local_renders') == 0
+        finally:
+            wiki_processor.close()
+            template_manager.close()
+
+if __name__ == "__main__":
+    test_parse_wikitext()
+    test_render_nesting()
+    test_render()
+    test_render_parses_once()
+    test_processor_local_first()
+    test_parity()
+    print('All local renderer tests passed')
\ No newline at end of file
@@ -0,0 +1,107 @@
+﻿#!/usr/bin/env python3
+import logging
+import os
+import sys
+import tempfile
+import time
+from logging.handlers import QueueHandler
+from pathlib import Path
+
+# Add parent directory to path for imports (src modules import each other by name)
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent / 'src'))
+
+from src.logger import RequestTracer, setup_logger
+
+class RecordingHandler(logging.Handler):
+    """Keeps the records it is given"""
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+def recording_logger(name):
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    handler = RecordingHandler()
+    logger.addHandler(handler)
+    return logger, handler
+
+def test_setup_logger_is_idempotent():
+    with tempfile.TemporaryDirectory() as log_dir:
+        log_file = os.path.join(log_dir, 'logs', 'run.log')
+        logger = setup_logger('test_logger_setup', log_file)
+        try:
+            assert setup_logger('test_logger_setup', log_file, level=logging.WARNING) is logger
+            assert len([handler for handler in logger.handlers if isinstance(handler, QueueHandler)]) == 1
+            assert logger.level == logging.WARNING
+            
+            logger.warning('written once')
+            # The listener writes in the background
+            for _ in range(100):
+                with open(log_file, encoding='utf-8') as f:
+                    content = f.read()
+                if content:
+                    break
+                time.sleep(0.01)
+            assert content.count('written once') == 1
+        finally:
+            for handler in list(logger.handlers):
+                logger.removeHandler(handler)
+
+def test_tracer_samples_every_nth_request():
+    logger, handler = recording_logger('test_tracer_sampling')
+    tracer = RequestTracer(logger, every=3, max_field_length=5)
+    for _ in range(7):
+        tracer.trace(status=200, wikitext='A long definition')
+    assert [record.getMessage() for record in handler.records] == [
+        "request_trace n=3 status=200 wikitext='A lon'",
+        "request_trace n=6 status=200 wikitext='A lon'",
+    ]
+    assert {record.levelno for record in handler.records} == {logging.INFO}
+
+def test_tracer_always_logs_failures():
+    logger, handler = recording_logger('test_tracer_failures')
+    tracer = RequestTracer(logger, every=1000)
+    tracer.trace(status=200)
+    tracer.trace(error=True, status=502)
+    tracer.trace(status=200)
+    assert [(record.levelno, record.getMessage()) for record in handler.records] == [
+        (logging.WARNING, "request_trace n=2 status=502")
+    ]
+    
+    # Failures are still logged with sampling off
+    tracer = RequestTracer(logger, every=0)
+    tracer.trace(status=200)
+    tracer.trace(error=True, status=503)
+    assert len(handler.records) == 2 and handler.records[-1].levelno == logging.WARNING
+
+def test_tracer_skips_fields_of_unlogged_requests():
+    logger, handler = recording_logger('test_tracer_fields')
+    tracer = RequestTracer(logger, every=4)
+    formatted = []
+    format_fields = tracer._format_fields
+    def counting_format_fields(fields):
+        formatted.append(fields)
+        return format_fields(fields)
+    tracer._format_fields = counting_format_fields
+    
+    for _ in range(10):
+        tracer.trace(status=200)
+    assert len(formatted) == len(handler.records) == 2
+    
+    # Nor for sampled requests below the logger's level
+    logger.setLevel(logging.WARNING)
+    for _ in range(10):
+        tracer.trace(status=200)
+    assert len(formatted) == 2
+
+if __name__ == "__main__":
+    test_setup_logger_is_idempotent()
+    test_tracer_samples_every_nth_request()
+    test_tracer_always_logs_failures()
+    test_tracer_skips_fields_of_unlogged_requests()
+    print('All logger tests passed')
\ No newline at end of file
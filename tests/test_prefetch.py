@@ -0,0 +1,116 @@
+﻿#!/usr/bin/env python3
+import sys
+import tempfile
+import xml.etree.ElementTree as ET
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+# Add parent directory to path for imports (src modules import each other by name)
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent / 'src'))
+
+from src.template_manager import TemplateManager, extract_dependencies, parse_item_reference
+from src.wiki_installer import WikiInstaller
+from tests.stub_server import StubWikiServer
+
+def test_bulk_import():
+    with tempfile.TemporaryDirectory() as cache_dir, StubWikiServer() as server:
+        template_manager = TemplateManager(cache_dir, api_url=server.api_url, requests_per_second=0)
+        pages = [('Template', f't{index}', f'{{{{#invoke:m|f|{index}}}}}') for index in range(30)]
+        pages.append(('Module', 'm', 'return { f = function() return "<&>" end }'))
+        template_manager.store.put_many(pages)
+        template_manager.manifest.record([(item_type, item_name, 1, None, str(index))
+                                          for index, (item_type, item_name, _) in enumerate(pages)], [])
+        # Fetched earlier but missing from the store: not exported, so it stays pending
+        template_manager.manifest.record([('Template', 'absent', 1, None, 'x')], [])
+        
+        # Stand-in for importDump.php: keep the XML it is given
+        imported_path = Path(cache_dir) / 'imported.xml'
+        import_command = [sys.executable, '-c',
+                          f'import shutil, sys; shutil.copyfileobj(sys.stdin.buffer, open({str(imported_path)!r}, "ab"))']
+        installer = WikiInstaller(server.api_url, template_manager, import_command=import_command)
+        try:
+            assert installer.bulk_import() == 31
+            root = ET.parse(imported_path).getroot()
+            assert len(root) == 31
+            assert not server.pages
+            assert template_manager.uninstalled_items() == [('Template', 'absent')]
+            
+            # Revisions are stamped now, so importDump.php makes them current
+            # even on pages the wiki already has
+            namespace = {'mw': 'http://www.mediawiki.org/xml/export-0.11/'}
+            for revision in root.findall('mw:page/mw:revision', namespace):
+                timestamp = datetime.strptime(revision.findtext('mw:timestamp', namespaces=namespace),
+                                              '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=timezone.utc)
+                assert abs(datetime.now(timezone.utc) - timestamp) < timedelta(minutes=1)
+                assert revision.findtext('mw:contributor/mw:ip', namespaces=namespace) == '127.0.0.1'
+            
+            # Nothing changed: nothing is imported again
+            assert installer.bulk_import() == 0
+            assert len(ET.parse(imported_path).getroot()) == 31
+            
+            # A few changed pages go through the edit API
+            template_manager.manifest.record([('Template', 't3', 2, None, 'new')], [])
+            assert installer.bulk_import() == 1
+            assert list(server.pages) == ['Template:t3']
+            
+            # A failing import falls back to the edit API
+            template_manager.manifest.reset_installed()
+            installer.import_command = [sys.executable, '-c', 'import sys; sys.exit(1)']
+            assert installer.bulk_import() == 31
+            assert len(server.pages) == 31
+        finally:
+            installer.close()
+            template_manager.close()
+
+def test_parse_item_reference():
+    assert parse_item_reference('lb') == ('Template', 'lb')
+    assert parse_item_reference('#invoke:form of/templates') == ('Module', 'form of/templates')
+    assert parse_item_reference('Template:en_noun') == ('Template', 'en noun')
+    assert parse_item_reference('subst:m') == ('Template', 'm')
+    assert parse_item_reference('#if:x') is None
+    assert parse_item_reference('PAGENAME') is None
+    assert parse_item_reference('lc:X') is None
+
+def test_extract_dependencies():
+    template = '{{#invoke:labels|show}} {{{1}}} {{lb|en|{{w|x}}}} {{#if:{{{a|}}}|{{m|en}}}}'
+    assert extract_dependencies(template) == {
+        ('Module', 'labels'), ('Template', 'lb'), ('Template', 'w'), ('Template', 'm')
+    }
+    module = 'local u = require("Module:utilities")\nlocal d = mw.loadData("Module:languages/data")'
+    assert extract_dependencies(module, 'Module') == {
+        ('Module', 'utilities'), ('Module', 'languages/data')
+    }
+
+def test_install_pending():
+    with tempfile.TemporaryDirectory() as cache_dir, StubWikiServer() as server:
+        template_manager = TemplateManager(cache_dir, api_url=server.api_url, requests_per_second=0)
+        template_manager.store.put_many([
+            ('Template', 'lb', '{{#invoke:labels|show}}'), ('Module', 'labels/data', 'return {}')
+        ])
+        template_manager.manifest.record(
+            [('Template', 'lb', 1, None, 'a'), ('Module', 'labels/data', 2, None, 'b'), ('Module', 'absent', 3, None, 'c')], []
+        )
+        
+        installer = WikiInstaller(server.api_url, template_manager)
+        try:
+            assert installer.install_pending() == 2
+            assert installer.failed_count == 1
+            # Only the item that could not be installed is tried again
+            assert installer.install_pending() == 0
+            assert installer.failed_count == 2
+            
+            # A new revision is installed again
+            template_manager.manifest.record([('Template', 'lb', 4, None, 'd')], [])
+            assert template_manager.uninstalled_items() == [('Module', 'absent'), ('Template', 'lb')]
+        finally:
+            installer.close()
+            template_manager.close()
+        assert server.pages == {'Template:lb': '{{#invoke:labels|show}}', 'Module:labels/data': 'return {}'}
+
+if __name__ == "__main__":
+    test_parse_item_reference()
+    test_extract_dependencies()
+    test_install_pending()
+    test_bulk_import()
+    print('All prefetch tests passed')
\ No newline at end of file
@@ -4,8 +4,9 @@ import os
 import logging
 from pathlib import Path
 
-# Add parent directory to path for imports
+# Add parent directory to path for imports (src modules import each other by name)
 sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent / 'src'))
 
 from src.database import Database
 from src.wiki_processor import WikiProcessor
@@ -0,0 +1,66 @@
+﻿#!/usr/bin/env python3
+import sys
+import tempfile
+from pathlib import Path
+
+# Add parent directory to path for imports (src modules import each other by name)
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent / 'src'))
+
+from src.render_cache import RenderCache
+
+def test_invalidate_titles():
+    with tempfile.TemporaryDirectory() as cache_dir:
+        render_cache = RenderCache(str(Path(cache_dir) / 'render_cache.db'), batch_size=2)
+        try:
+            render_cache.put('{{lb|en|a}} one', 'a one', ['Template:lb', 'Module:labels'])
+            render_cache.put('{{m|en|b}}  two', 'b two', ['Template:m'])
+            render_cache.put('three', 'three')
+            
+            # Whitespace differences share an entry
+            assert render_cache.get('{{m|en|b}} two') == 'b two'
+            
+            assert render_cache.invalidate_titles(['Module:labels', 'Template:unused']) == 1
+            assert render_cache.get('{{lb|en|a}} one') is None
+            assert render_cache.get('{{m|en|b}} two') == 'b two'
+            assert render_cache.get('three') == 'three'
+            
+            # A re-render replaces the recorded dependencies
+            render_cache.put('{{m|en|b}} two', 'b two', ['Template:m2'])
+            assert render_cache.invalidate_titles(['Template:m']) == 0
+            assert render_cache.invalidate_titles(['Template:m2']) == 1
+        finally:
+            render_cache.close()
+
+def test_normalize_keeps_line_layout():
+    normalize = RenderCache.normalize
+    assert normalize('{{m|en|b}}  two \t') == '{{m|en|b}} two'
+    # Decomposed accents are composed
+    assert normalize('cafe\u0301') == normalize('caf\u00e9')
+    # Line breaks and leading spaces change the render, so they stay
+    assert normalize('a\nb') != normalize('a b')
+    assert normalize(' pre') != normalize('pre')
+    assert normalize('* one  \n*  two\n\n') == '* one\n* two'
+    assert normalize('\tindented\tline') == '\tindented\tline'
+
+def test_hit_and_miss_counters():
+    with tempfile.TemporaryDirectory() as cache_dir:
+        render_cache = RenderCache(str(Path(cache_dir) / 'render_cache.db'), batch_size=2)
+        try:
+            assert render_cache.get('one') is None
+            render_cache.put('one', 'one')
+            # Pending and flushed entries both count as hits
+            assert render_cache.get('one') == 'one'
+            render_cache.put('two', 'two')
+            assert render_cache.get('one') == 'one'
+            assert render_cache.get('two ') == 'two'
+            assert render_cache.get('three') is None
+            assert (render_cache.hits, render_cache.misses) == (3, 2)
+        finally:
+            render_cache.close()
+
+if __name__ == "__main__":
+    test_invalidate_titles()
+    test_normalize_keeps_line_layout()
+    test_hit_and_miss_counters()
+    print('All render cache tests passed')
\ No newline at end of file
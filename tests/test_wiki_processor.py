@@ -0,0 +1,312 @@
+﻿#!/usr/bin/env python3
+import json
+import sys
+import tempfile
+import time
+from collections import Counter
+from types import SimpleNamespace
+from pathlib import Path
+import requests
+
+# Add parent directory to path for imports (src modules import each other by name)
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent / 'src'))
+
+from src.render_cache import RenderCache
+from src.template_manager import TemplateManager
+import src.wiki_processor as wiki_processor_module
+from src.wiki_processor import UTF8_BOM, WikiProcessor, decode_json
+from tests.stub_server import StubWikiServer
+
+LUA_ERROR = ('<strong class="error"><span class="scribunto-error" id="mw-scribunto-error-0">'
+             'Lua error in Module:labels at line 12: attempt to index a nil value.</span></strong>')
+LABELS_METADATA = [{'ns': 828, 'title': 'Module:labels', 'exists': True}]
+
+def render_lua_errors(text):
+    """Stub renderer: {{lb}} hits a Lua error in a module that exists"""
+    if '{{lb' in text:
+        return text.replace('{{lb|en|x}}', LUA_ERROR), LABELS_METADATA
+    return text, []
+
+def render_slow(text):
+    """Stub renderer: definitions marked slow take a while to parse"""
+    if 'slow' in text:
+        time.sleep(0.3)
+    return text, []
+
+def make_processor(server, cache_dir, **kwargs):
+    template_manager = TemplateManager(cache_dir, api_url=server.api_url, requests_per_second=0)
+    return WikiProcessor(server.api_url, template_manager, max_batch_size=8, **kwargs), template_manager
+
+def test_split_batch_html():
+    with tempfile.TemporaryDirectory() as cache_dir, StubWikiServer() as server:
+        wiki_processor, template_manager = make_processor(server, cache_dir)
+        try:
+            html = ('<div class="mw-parser-output"><div id="wdb-item-0">A <div>nested</div></div>\n'
+                    '<div id="wdb-item-1"><b>B</b></div></div>')
+            assert wiki_processor._split_batch_html(html, 2) == ['A <div>nested</div>', '<b>B</b>']
+            # A sentinel missing or out of order
+            assert wiki_processor._split_batch_html(html, 3) is None
+            assert wiki_processor._split_batch_html(html.replace('item-1', 'item-2'), 2) is None
+            # Unbalanced markup swallowed the next wrapper, or text leaked between them
+            assert wiki_processor._split_batch_html(html.replace('nested</div>', 'nested'), 2) is None
+            assert wiki_processor._split_batch_html(html.replace('</div>\n', '</div>stray\n'), 2) is None
+        finally:
+            wiki_processor.close()
+            template_manager.close()
+
+def test_batch_split():
+    with tempfile.TemporaryDirectory() as cache_dir, StubWikiServer() as server:
+        wiki_processor, template_manager = make_processor(server, cache_dir)
+        try:
+            definitions = ['A <i>cat</i>.', 'A <b>dog</b>.', 'A cow.']
+            assert wiki_processor.process_batch(definitions) == ['A cat.', 'A dog.', 'A cow.']
+            assert server.parse_count == 1
+            assert wiki_processor.batch_size == 5
+        finally:
+            wiki_processor.close()
+            template_manager.close()
+
+def test_broken_batch_falls_back_to_single_renders():
+    with tempfile.TemporaryDirectory() as cache_dir, StubWikiServer() as server:
+        wiki_processor, template_manager = make_processor(server, cache_dir)
+        try:
+            # The unclosed <div> swallows the wrappers after it, so no text
+            # may be attached to a row from the batch
+            definitions = ['A cat.', 'A <div>dog.', 'A cow.']
+            assert wiki_processor.process_batch(definitions) == ['A cat.', 'A dog.', 'A cow.']
+            assert server.parse_count == 4
+            assert wiki_processor.batch_size == 2
+        finally:
+            wiki_processor.close()
+            template_manager.close()
+
+def test_batch_with_missing_items():
+    source_pages = {'Template:gloss': 'a gloss'}
+    with tempfile.TemporaryDirectory() as cache_dir, StubWikiServer(bom=False, source_pages=source_pages) as server:
+        wiki_processor, template_manager = make_processor(server, cache_dir)
+        
+        def render_gloss(text):
+            """{{gloss}} is a red link until the template has been downloaded"""
+            if template_manager.load_item('Template', 'gloss') is not None:
+                return text.replace('{{gloss}}', '(a gloss)'), [{'ns': 10, 'title': 'Template:gloss', 'exists': True}]
+            if '{{gloss}}' not in text:
+                return text, []
+            redlink = '<a href="/index.php?title=Template:gloss&amp;action=edit&amp;redlink=1">Template:gloss</a>'
+            return text.replace('{{gloss}}', redlink), [{'ns': 10, 'title': 'Template:gloss'}]
+        server.render = render_gloss
+        
+        try:
+            results = wiki_processor.process_batch(['A cat.', '{{gloss}} A dog.', 'A cow.'])
+            assert results == ['A cat.', '(a gloss) A dog.', 'A cow.']
+            # The batch, then only the row with the red link: before and after the download
+            assert server.parse_count == 3
+            assert server.query_counts['Template:gloss'] == 1
+        finally:
+            wiki_processor.close()
+            template_manager.close()
+
+def test_adapt_batch_size():
+    with tempfile.TemporaryDirectory() as cache_dir, StubWikiServer() as server:
+        wiki_processor, template_manager = make_processor(server, cache_dir, target_batch_latency=1.0,
+                                                          max_batch_html_size=1000)
+        try:
+            assert wiki_processor.batch_size == 4
+            for _ in range(10):
+                wiki_processor._adapt_batch_size(0.1, 100, True)
+            assert wiki_processor.batch_size == 8
+            wiki_processor._adapt_batch_size(2.0, 100, True)
+            assert wiki_processor.batch_size == 4
+            wiki_processor._adapt_batch_size(0.1, 5000, True)
+            assert wiki_processor.batch_size == 2
+            wiki_processor._adapt_batch_size(0.1, 100, False)
+            wiki_processor._adapt_batch_size(0.1, 100, False)
+            assert wiki_processor.batch_size == 1
+        finally:
+            wiki_processor.close()
+            template_manager.close()
+
+def test_render_error_is_not_a_result():
+    with tempfile.TemporaryDirectory() as cache_dir, StubWikiServer(render=render_lua_errors) as server:
+        template_manager = TemplateManager(cache_dir, api_url=server.api_url, requests_per_second=0)
+        render_cache = RenderCache(str(Path(cache_dir) / 'render_cache.db'))
+        wiki_processor = WikiProcessor(server.api_url, template_manager, render_cache, max_batch_size=4)
+        try:
+            result = wiki_processor.process_definition('{{lb|en|x}} A cat.')
+            assert result.startswith('ERROR:') and 'Lua error in Module:labels at line 12' in result
+            # Not cached, so a --resume run asks MediaWiki again
+            assert render_cache.get('{{lb|en|x}} A cat.') is None
+            wiki_processor.process_definition('{{lb|en|x}} A cat.')
+            assert server.parse_count == 2
+            
+            # In a batch, only the definition with the error is recorded as one
+            results = wiki_processor.process_batch(['A dog.', '{{lb|en|x}} A cow.'])
+            assert results[0] == 'A dog.'
+            assert results[1].startswith('ERROR:')
+            assert render_cache.get('A dog.') == 'A dog.'
+            assert render_cache.get('{{lb|en|x}} A cow.') is None
+        finally:
+            wiki_processor.close()
+            render_cache.close()
+            template_manager.close()
+
+def test_decode_json_bom():
+    body = '{"parse": {"title": "API", "text": "<p>caf\u00e9</p>"}}'.encode('utf-8')
+    expected = {'parse': {'title': 'API', 'text': '<p>caf\u00e9</p>'}}
+    
+    # orjson rejects a BOM, so decode_json must skip it; a stand-in for
+    # orjson shows what that branch hands it
+    decoded = []
+    def loads(data):
+        data = bytes(data)
+        assert not data.startswith(UTF8_BOM)
+        decoded.append(data)
+        return json.loads(data)
+    saved_orjson = wiki_processor_module.orjson
+    try:
+        for orjson in (None, SimpleNamespace(loads=loads)):
+            wiki_processor_module.orjson = orjson
+            assert decode_json(UTF8_BOM + body) == expected
+            assert decode_json(body) == expected
+            # A BOM-less error is still an error
+            try:
+                decode_json(b'not json')
+                assert False, 'expected a ValueError'
+            except ValueError:
+                pass
+    finally:
+        wiki_processor_module.orjson = saved_orjson
+    assert decoded == [body, body, b'not json']
+
+def test_parse_formatversion_2():
+    with tempfile.TemporaryDirectory() as cache_dir, StubWikiServer() as server:
+        wiki_processor, template_manager = make_processor(server, cache_dir)
+        try:
+            parse, error = wiki_processor._parse_wikitext('A cat.')
+            assert error is None
+            # parse.text is the HTML itself, not nested under '*'
+            assert parse['text'] == '<div class="mw-parser-output"><p>A cat.</p></div>'
+            assert parse['templates'] == []
+            # The decode is timed once per response
+            assert wiki_processor.metrics.timer_counts['decode'] == 1
+            assert wiki_processor.metrics.timers['decode'] >= 0
+            assert wiki_processor.metrics.get('requests') == 1
+        finally:
+            wiki_processor.close()
+            template_manager.close()
+
+def test_html_error_page():
+    with tempfile.TemporaryDirectory() as cache_dir, StubWikiServer() as server:
+        wiki_processor, template_manager = make_processor(server, cache_dir)
+        def post_returning(content):
+            def post(*args, **kwargs):
+                response = requests.Response()
+                response.status_code = 200
+                response._content = content
+                return response
+            return post
+        try:
+            # A fatal MediaWiki error page, BOM and all, is sniffed as HTML
+            wiki_processor.session.post = post_returning(
+                UTF8_BOM + b'\n<!DOCTYPE html>\n<html><body>MediaWiki internal error.</body></html>')
+            assert wiki_processor._parse_wikitext('A cat.') == (None, "ERROR: MediaWiki API returned HTML error")
+            
+            wiki_processor.session.post = post_returning(b'{"parse": ')
+            parse, error = wiki_processor._parse_wikitext('A cat.')
+            assert parse is None and error.startswith('ERROR: Failed to parse MediaWiki API response')
+            # Failed decodes are timed too
+            assert wiki_processor.metrics.timer_counts['decode'] == 2
+        finally:
+            wiki_processor.close()
+            template_manager.close()
+
+def test_concurrent_results_and_backpressure():
+    with tempfile.TemporaryDirectory() as cache_dir, StubWikiServer(render=render_slow) as server:
+        wiki_processor, template_manager = make_processor(server, cache_dir)
+        wiki_processor.max_batch_size = wiki_processor.batch_size = 1
+        try:
+            consumed = []
+            def definitions():
+                for definition_id in range(12):
+                    consumed.append(definition_id)
+                    yield definition_id, 1, f"Definition {definition_id}{' slow' if definition_id == 0 else ''}."
+                    
+            results = []
+            max_ahead = 0
+            for result in wiki_processor.process_definitions_concurrently(definitions(), workers=2):
+                # Never more than 2 * workers batches taken ahead of the consumer
+                max_ahead = max(max_ahead, len(consumed) - len(results))
+                assert len(consumed) - len(results) <= 4
+                results.append(result)
+            assert max_ahead == 4
+            
+            # The slow first definition comes back after the others, and every id exactly once
+            assert results[0][0] != 0
+            assert Counter(definition_id for definition_id, _, _ in results) == Counter(range(12))
+            assert all(error is None and processed_text for _, processed_text, error in results)
+            assert server.parse_count == 12
+        finally:
+            wiki_processor.close()
+            template_manager.close()
+
+def test_concurrent_batch_failure():
+    with tempfile.TemporaryDirectory() as cache_dir, StubWikiServer() as server:
+        wiki_processor, template_manager = make_processor(server, cache_dir)
+        process_batch = wiki_processor.process_batch
+        def failing_process_batch(raw_texts):
+            if any('bad' in raw_text for raw_text in raw_texts):
+                raise ValueError('batch failed')
+            return process_batch(raw_texts)
+        wiki_processor.process_batch = failing_process_batch
+        try:
+            assert wiki_processor.batch_size == 4
+            definitions = [(definition_id, 1, f"Definition {definition_id}{' bad' if definition_id == 6 else ''}.")
+                           for definition_id in range(8)]
+            results = {definition_id: (processed_text, error) for definition_id, processed_text, error
+                       in wiki_processor.process_definitions_concurrently(definitions, workers=1)}
+            assert sorted(results) == list(range(8))
+            for definition_id in range(4):
+                assert results[definition_id] == (f"Definition {definition_id}.", None)
+            # Every row of the failed batch carries the exception, none a result
+            errors = [results[definition_id] for definition_id in range(4, 8)]
+            assert all(processed_text is None and isinstance(error, ValueError) for processed_text, error in errors)
+            assert len({id(error) for _, error in errors}) == 1
+        finally:
+            wiki_processor.close()
+            template_manager.close()
+
+def test_closing_early_cancels_queued_batches():
+    with tempfile.TemporaryDirectory() as cache_dir, StubWikiServer(render=render_slow) as server:
+        wiki_processor, template_manager = make_processor(server, cache_dir)
+        wiki_processor.max_batch_size = wiki_processor.batch_size = 1
+        try:
+            consumed = []
+            def definitions():
+                for definition_id in range(10):
+                    consumed.append(definition_id)
+                    yield definition_id, 1, f"Definition {definition_id}{' slow' if definition_id else ''}."
+                    
+            results = wiki_processor.process_definitions_concurrently(definitions(), workers=2)
+            assert next(results)[0] == 0
+            # Definitions 1 and 2 are being parsed, 3 is queued behind them
+            results.close()
+            assert consumed == [0, 1, 2, 3]
+            assert server.parse_count == 3
+        finally:
+            wiki_processor.close()
+            template_manager.close()
+
+if __name__ == "__main__":
+    test_split_batch_html()
+    test_batch_split()
+    test_broken_batch_falls_back_to_single_renders()
+    test_batch_with_missing_items()
+    test_adapt_batch_size()
+    test_render_error_is_not_a_result()
+    test_decode_json_bom()
+    test_parse_formatversion_2()
+    test_html_error_page()
+    test_concurrent_results_and_backpressure()
+    test_concurrent_batch_failure()
+    test_closing_early_cancels_queued_batches()
+    print('All wiki processor tests passed')
\ No newline at end of file